@@ -21,16 +21,20 @@ Nodes communicate using the fabric.
 
 import logging
 
+import ujson
 import gevent
 import gevent.monkey
 gevent.monkey.patch_all(thread=False, select=False)
 
 import minemeld.mgmtbus
 import minemeld.ft
+import minemeld.ft.dbenv
 import minemeld.fabric
 
 LOG = logging.getLogger(__name__)
 STATE_REPORT_INTERVAL = 10
+LOG_BATCH_SIZE = 100
+LOG_BATCH_INTERVAL = 1.0
 
 
 class Chassis(object):
@@ -41,11 +45,26 @@ class Chassis(object):
         fabricconfig (dict): config dictionary for fabric,
             class specific
         mgmtbusconfig (dict): config dictionary for mgmt bus
+        storageconfig (dict): config dictionary for the storage
+            environment, see minemeld.ft.dbenv
     """
-    def __init__(self, fabricclass, fabricconfig, mgmtbusconfig):
+    def __init__(self, fabricclass, fabricconfig, mgmtbusconfig,
+                 storageconfig=None):
         self.fts = {}
         self.poweroff = None
 
+        self.num_shed_logs = 0
+        self._shedding_logs = False
+
+        self._log_batch = []
+        self._log_values = []
+        self._log_values_index = {}
+        self._log_flush_glet = None
+
+        self.storage_config = storageconfig
+        if self.storage_config is None:
+            self.storage_config = {}
+
         self.fabric_class = fabricclass
         self.fabric_config = fabricconfig
         self.fabric = minemeld.fabric.factory(
@@ -71,12 +90,16 @@ class Chassis(object):
     def get_ft(self, ftname):
         return self.fts.get(ftname, None)
 
-    def configure(self, config):
+    def configure(self, config, remote_outputs=None):
         """configures the chassis instance
 
         Args:
             config (list): list of FTs
+            remote_outputs (list): list of FTs with subscribers in other
+                chassis, None if unknown
         """
+        self.fabric.configure(config.keys(), remote_outputs=remote_outputs)
+
         newfts = {}
         for ft in config:
             ftconfig = config[ft]
@@ -96,6 +119,13 @@ class Chassis(object):
 
         self.fts = newfts
 
+        # nodes open their DBs at initialize, after the environment
+        # has been configured with the DBs declared by every node
+        minemeld.ft.dbenv.configure(
+            self.storage_config,
+            dict((n, ft.storage_dbs()) for n, ft in self.fts.iteritems())
+        )
+
         # XXX should be moved to constructor
         self.mgmtbus.start()
 
@@ -113,20 +143,81 @@ class Chassis(object):
     def request_sub_channel(self, ftname, ft, subname, allowed_methods=None):
         if allowed_methods is None:
             allowed_methods = []
-        self.fabric.request_sub_channel(ftname, ft, subname, allowed_methods)
+        return self.fabric.request_sub_channel(
+            ftname,
+            ft,
+            subname,
+            allowed_methods
+        )
 
     def send_rpc(self, sftname, dftname, method, params, block, timeout):
         return self.fabric.send_rpc(sftname, dftname, method, params,
                                     block=block, timeout=timeout)
 
     def log(self, timestamp, nodename, log_type, value):
+        # logs are dropped before the data messages get blocked
+        if self.fabric.congested():
+            if not self._shedding_logs:
+                LOG.warning('chassis - fabric congested, dropping logs')
+                self._shedding_logs = True
+            self.num_shed_logs += 1
+            return False
+
+        if self._shedding_logs:
+            LOG.info('chassis - fabric not congested, %d logs dropped',
+                     self.num_shed_logs)
+            self._shedding_logs = False
+
+        # the value of trace logs is serialized now, the node could
+        # change it before the batch is sent. Identical values in
+        # the same batch are sent once
+        if isinstance(value, dict) and 'value' in value:
+            jvalue = ujson.dumps(value.pop('value'))
+            vidx = self._log_values_index.get(jvalue, None)
+            if vidx is None:
+                vidx = len(self._log_values)
+                self._log_values.append(jvalue)
+                self._log_values_index[jvalue] = vidx
+            value['value_ref'] = vidx
+
+        self._log_batch.append({
+            'timestamp': timestamp,
+            'source': nodename,
+            'log_type': log_type,
+            'log': value
+        })
+
+        if len(self._log_batch) >= LOG_BATCH_SIZE:
+            self.flush_logs()
+
+        elif self._log_flush_glet is None:
+            self._log_flush_glet = gevent.spawn_later(
+                LOG_BATCH_INTERVAL,
+                self.flush_logs
+            )
+
+        return True
+
+    def flush_logs(self):
+        if self._log_flush_glet is not None:
+            if self._log_flush_glet is not gevent.getcurrent():
+                self._log_flush_glet.kill()
+            self._log_flush_glet = None
+
+        if len(self._log_batch) == 0:
+            return
+
+        logs = self._log_batch
+        values = self._log_values
+        self._log_batch = []
+        self._log_values = []
+        self._log_values_index = {}
+
         self.log_channel.publish(
-            method='log',
+            method='log_batch',
             params={
-                'timestamp': timestamp,
-                'source': nodename,
-                'log_type': log_type,
-                'log': value
+                'logs': logs,
+                'values': values
             }
         )
 
@@ -152,6 +243,8 @@ class Chassis(object):
         for _, ft in self.fts.iteritems():
             ft.stop()
 
+        self.flush_logs()
+
         self.fabric.stop()
         self.mgmtbus.stop()
 
@@ -1,10 +1,14 @@
 from __future__ import absolute_import
 
 from .amqp import AMQP
+from .uds import UDS
 
 
 def factory(commclass, config):
-    if commclass != 'AMQP':
-        raise RuntimeError('Unknown comm class %s', commclass)
+    if commclass == 'AMQP':
+        return AMQP(config)
 
-    return AMQP(config)
+    if commclass == 'UDS':
+        return UDS(config)
+
+    raise RuntimeError('Unknown comm class %s', commclass)
@@ -14,6 +14,34 @@
 
 """
 This module implements AMQP communication class for mgmtbus and fabric.
+
+**BATCHES**
+
+*update* and *withdraw* messages published on a pub channel are collected
+in batches and sent as a single *batch* message, with params
+*{'messages': [[<method>, <params>], ...]}*. A batch is sent when it
+reaches batch_max_size messages, after batch_flush_interval seconds, or
+before any other message is published on the channel, so the order of the
+messages is preserved.
+
+Listeners of a sub channel with *batch* in the allowed methods receive the
+batch with a single call, the other listeners receive one call per
+message. Batches are disabled if batch_max_size is less than 2.
+
+**FLOW CONTROL**
+
+Sub channels consume with acks and a prefetch of prefetch_count messages,
+the broker stops delivering to a slow subscriber instead of filling the
+memory of the subscriber process. Set prefetch_count to 0 to disable acks.
+
+The prefetch bounds only the memory of the consumer: the queues of the
+subscriptions are not bounded, the messages not yet delivered to a slow
+subscriber pile up in the broker queue. Publishers are slowed down only
+when the broker blocks the connections (connection.blocked), when the
+broker wide memory or disk alarm is raised; publish then waits until the
+connections are unblocked. Pub channels requested with shed set to True
+drop the messages instead. Each message carries the publish timestamp,
+used by the sub channels to compute the lag.
 """
 
 from __future__ import absolute_import
@@ -22,15 +50,21 @@ import amqp.connection
 import amqp
 import gevent
 import gevent.event
+import gevent.lock
 import ujson as json
 import logging
 import uuid
+import time
 
 LOG = logging.getLogger(__name__)
 
+BATCHED_METHODS = ['update', 'withdraw']
+DEFAULT_PREFETCH_COUNT = 100
+
 
 class AMQPPubChannel(object):
-    def __init__(self, topic):
+    def __init__(self, topic, batch_max_size=1, batch_flush_interval=0.05,
+                 flow=None, shed=False):
         self.topic = topic
 
         self.channel = None
@@ -38,6 +72,15 @@ class AMQPPubChannel(object):
 
         self.num_publish = 0
 
+        self.flow = flow
+        self.shed = shed
+        self.num_shed = 0
+
+        self.batch_max_size = batch_max_size
+        self.batch_flush_interval = batch_flush_interval
+        self._batch = []
+        self._flush_glet = None
+
     def connect(self, conn):
         if self.channel is not None:
             return
@@ -53,23 +96,66 @@ class AMQPPubChannel(object):
         if self.channel is None:
             return
 
+        self.flush()
+
         # self.channel.exchange_delete(self.topic)
         self.channel.close()
         self.channel = None
 
-    def publish(self, method, params={}):
-        if self.channel is None:
-            return
-
+    def _publish(self, method, params):
         msg = {
             'method': method,
-            'params': params
+            'params': params,
+            'timestamp': time.time()
         }
         self.channel.basic_publish(
             amqp.Message(body=json.dumps(msg)),
             exchange=self.topic
         )
 
+    def _timed_flush(self):
+        self._flush_glet = None
+        self.flush()
+
+    def flush(self):
+        """Sends the pending batch."""
+        if self._flush_glet is not None:
+            self._flush_glet.kill(block=False)
+            self._flush_glet = None
+
+        if len(self._batch) == 0 or self.channel is None:
+            return
+
+        batch = self._batch
+        self._batch = []
+        self._publish('batch', {'messages': batch})
+
+    def publish(self, method, params={}):
+        if self.channel is None:
+            return
+
+        if self.flow is not None and not self.flow.is_set():
+            if self.shed:
+                self.num_shed += 1
+                return
+
+            self.flow.wait()
+
+        if self.batch_max_size > 1 and method in BATCHED_METHODS:
+            self._batch.append([method, params])
+            if len(self._batch) >= self.batch_max_size:
+                self.flush()
+
+            elif self._flush_glet is None:
+                self._flush_glet = gevent.spawn_later(
+                    self.batch_flush_interval,
+                    self._timed_flush
+                )
+
+        else:
+            self.flush()
+            self._publish(method, params)
+
         self.num_publish += 1
         if self.num_publish == 10:
             self.num_publish = 0
@@ -85,8 +171,11 @@ class AMQPRpcFanoutClientChannel(object):
         self._out_channel = None
 
     def _in_callback(self, msg):
+        self._handle_reply(msg.body)
+
+    def _handle_reply(self, body):
         try:
-            msg = json.loads(msg.body)
+            msg = json.loads(body)
         except ValueError:
             LOG.error("Invalid JSON in msg body")
             return
@@ -303,7 +392,7 @@ class AMQPRpcServerChannel(object):
 
 
 class AMQPSubChannel(object):
-    def __init__(self, topic, listeners=None, name=None):
+    def __init__(self, topic, listeners=None, name=None, prefetch_count=0):
         if listeners is None:
             listeners = []
 
@@ -311,15 +400,47 @@ class AMQPSubChannel(object):
         self.channel = None
         self.listeners = listeners
         self.name = name
+        self.prefetch_count = prefetch_count
 
         self.num_callbacks = 0
 
+        self.num_received = 0
+        self.lag = None
+
     def add_listener(self, obj, allowed_methods=[]):
         self.listeners.append((obj, allowed_methods))
 
+    def _dispatch(self, obj, allowed_methods, method, params):
+        if method not in allowed_methods:
+            LOG.error("Method not allowed: %s", method)
+            return
+
+        m = getattr(obj, method, None)
+        if m is None:
+            LOG.error('Method %s not defined', method)
+            return
+
+        try:
+            m(**params)
+        except:
+            LOG.exception('Exception in handling %s on topic %s '
+                          'with params %s', method, self.topic, params)
+
+    def stats(self):
+        return {
+            'received': self.num_received,
+            'lag': self.lag
+        }
+
     def _callback(self, msg):
+        self._handle_message(msg.body)
+
+        if self.prefetch_count != 0:
+            self.channel.basic_ack(msg.delivery_tag)
+
+    def _handle_message(self, body):
         try:
-            msg = json.loads(msg.body)
+            msg = json.loads(body)
         except ValueError:
             LOG.error("invalid message received")
             return
@@ -330,21 +451,23 @@ class AMQPSubChannel(object):
             LOG.error("Message without method field")
             return
 
-        for obj, allowed_methods in self.listeners:
-            if method not in allowed_methods:
-                LOG.error("Method not allowed: %s", method)
-                continue
+        timestamp = msg.get('timestamp', None)
+        if timestamp is not None:
+            self.lag = time.time()-timestamp
+
+        if method == 'batch':
+            self.num_received += len(params.get('messages', []))
+        else:
+            self.num_received += 1
 
-            m = getattr(obj, method, None)
-            if m is None:
-                LOG.error('Method %s not defined', method)
+        for obj, allowed_methods in self.listeners:
+            if method != 'batch' or 'batch' in allowed_methods:
+                self._dispatch(obj, allowed_methods, method, params)
                 continue
 
-            try:
-                m(**params)
-            except:
-                LOG.exception('Exception in handling %s on topic %s '
-                              'with params %s', method, self.topic, params)
+            # listener not batch aware
+            for bmethod, bparams in params.get('messages', []):
+                self._dispatch(obj, allowed_methods, bmethod, bparams)
 
         self.num_callbacks += 1
         if self.num_callbacks == 10:
@@ -383,9 +506,11 @@ class AMQPSubChannel(object):
             queue=q.queue,
             exchange=self.topic
         )
+        if self.prefetch_count != 0:
+            self.channel.basic_qos(0, self.prefetch_count, False)
         self.channel.basic_consume(
             callback=self._callback,
-            no_ack=True,
+            no_ack=(self.prefetch_count == 0),
             exclusive=True
         )
 
@@ -400,14 +525,27 @@ class AMQPSubChannel(object):
 class AMQP(object):
     def __init__(self, config):
         self.num_connections = config.pop('num_connections', 1)
+        self.batch_max_size = config.pop('batch_max_size', 1)
+        self.batch_flush_interval = config.pop('batch_flush_interval', 0.05)
+        self.prefetch_count = config.pop(
+            'prefetch_count',
+            DEFAULT_PREFETCH_COUNT
+        )
         self.amqp_config = config
 
+        # cleared while the broker blocks the connections
+        self.flow = gevent.event.Event()
+        self.flow.set()
+
         self.rpc_server_channels = {}
         self.pub_channels = {}
         self.sub_channels = {}
         self.rpc_fanout_clients_channels = []
 
         self.rpc_out_channel = None
+        # send_rpc can be called by multiple greenlets, the frames of
+        # each message should not be interleaved
+        self._rpc_out_lock = gevent.lock.Semaphore()
         self.active_rpcs = {}
 
         self._connections = []
@@ -418,6 +556,18 @@ class AMQP(object):
     def add_failure_listener(self, listener):
         self.failure_listeners.append(listener)
 
+    def congested(self):
+        """Returns True if the broker is blocking the connections."""
+        return not self.flow.is_set()
+
+    def _blocked(self, reason=None):
+        LOG.warning('AMQP connection blocked by the broker: %s', reason)
+        self.flow.clear()
+
+    def _unblocked(self):
+        LOG.info('AMQP connection unblocked by the broker')
+        self.flow.set()
+
     def request_rpc_server_channel(self, name, obj=None, allowed_methods=[],
                                    method_prefix='', fanout=None):
         if name in self.rpc_server_channels:
@@ -436,10 +586,14 @@ class AMQP(object):
         self.rpc_fanout_clients_channels.append(c)
         return c
 
-    def request_pub_channel(self, topic):
+    def request_pub_channel(self, topic, shed=False):
         if topic not in self.pub_channels:
             self.pub_channels[topic] = AMQPPubChannel(
-                topic
+                topic,
+                batch_max_size=self.batch_max_size,
+                batch_flush_interval=self.batch_flush_interval,
+                flow=self.flow,
+                shed=shed
             )
 
         return self.pub_channels[topic]
@@ -451,15 +605,18 @@ class AMQP(object):
 
         if topic in self.sub_channels:
             self.sub_channels[topic].add_listener(obj, allowed_methods)
-            return
+            return self.sub_channels[topic]
 
         subchannel = AMQPSubChannel(
             topic,
             [(obj, allowed_methods)],
-            name=name
+            name=name,
+            prefetch_count=self.prefetch_count
         )
         self.sub_channels[topic] = subchannel
 
+        return subchannel
+
     def _rpc_callback(self, msg):
         try:
             msg = json.loads(msg.body)
@@ -499,7 +656,8 @@ class AMQP(object):
         )
 
         self.active_rpcs[id_] = gevent.event.AsyncResult()
-        self.rpc_out_channel.basic_publish(msg, routing_key=dest+':rpc')
+        with self._rpc_out_lock:
+            self.rpc_out_channel.basic_publish(msg, routing_key=dest+':rpc')
 
         try:
             result = self.active_rpcs[id_].get(block=block, timeout=timeout)
@@ -538,7 +696,11 @@ class AMQP(object):
 
         for j in range(num_conns_total):
             self._connections.append(
-                amqp.connection.Connection(**self.amqp_config)
+                amqp.connection.Connection(
+                    on_blocked=self._blocked,
+                    on_unblocked=self._unblocked,
+                    **self.amqp_config
+                )
             )
 
         csel = 0
@@ -0,0 +1,172 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+This module implements in-process pub/sub channels for the fabric.
+
+Messages published on a LocalPubChannel are delivered directly to the
+LocalSubChannel of the same topic, without encoding. Each LocalSubChannel
+has a queue and a greenlet delivering the messages to the listeners in
+order, so the publisher never runs the listeners code and the ordering of
+update, withdraw and checkpoint messages is the same as with AMQP.
+
+Params are handed off with a shallow copy: the params dict, the value dict
+and the lists and dicts in the value are copied when the message is
+published, and again for each listener but the last one. The other objects
+are shared. Indicator values are flat, so publishers and listeners can
+modify the value as they do with the values encoded to and decoded from
+AMQP.
+
+The queue of a LocalSubChannel holds at most queue_size messages, when it
+is full publish blocks until the listeners catch up. The channel is
+congested when the queue is filled above CONGESTION_THRESHOLD.
+
+If the topic has subscribers in other processes, the LocalPubChannel
+publishes the messages on the remote channel too.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import time
+
+import gevent
+import gevent.queue
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 1000
+CONGESTION_THRESHOLD = 0.8
+
+
+def _handoff_copy(params):
+    result = dict(params)
+
+    value = result.get('value', None)
+    if type(value) is dict:
+        value = dict(value)
+        for k, v in value.iteritems():
+            if type(v) is list:
+                value[k] = list(v)
+            elif type(v) is dict:
+                value[k] = dict(v)
+        result['value'] = value
+
+    return result
+
+
+class LocalPubChannel(object):
+    def __init__(self, topic, sub_channel=None, remote=None):
+        self.topic = topic
+        self.sub_channel = sub_channel
+        self.remote = remote
+
+        self.num_publish = 0
+
+    def publish(self, method, params={}):
+        if self.sub_channel is not None:
+            self.sub_channel.put(method, params)
+
+        if self.remote is not None:
+            self.remote.publish(method, params)
+
+        self.num_publish += 1
+        if self.num_publish == 10:
+            self.num_publish = 0
+            gevent.sleep(0)
+
+
+class LocalSubChannel(object):
+    def __init__(self, topic, listeners=None, queue_size=DEFAULT_QUEUE_SIZE):
+        if listeners is None:
+            listeners = []
+
+        self.topic = topic
+        self.listeners = listeners
+        self.queue_size = queue_size
+
+        self._queue = gevent.queue.Queue(maxsize=queue_size)
+        self._glet = None
+
+        self.num_callbacks = 0
+
+        self.num_received = 0
+        self.lag = None
+
+    def add_listener(self, obj, allowed_methods=[]):
+        self.listeners.append((obj, allowed_methods))
+
+    def stats(self):
+        return {
+            'received': self.num_received,
+            'pending': self._queue.qsize(),
+            'lag': self.lag
+        }
+
+    def congested(self):
+        return self._queue.qsize() >= self.queue_size*CONGESTION_THRESHOLD
+
+    def put(self, method, params):
+        if len(self.listeners) == 0:
+            return
+
+        self._queue.put((method, _handoff_copy(params), time.time()))
+
+    def _dispatch(self, obj, allowed_methods, method, params):
+        if method not in allowed_methods:
+            LOG.error("Method not allowed: %s", method)
+            return
+
+        m = getattr(obj, method, None)
+        if m is None:
+            LOG.error('Method %s not defined', method)
+            return
+
+        try:
+            m(**params)
+        except:
+            LOG.exception('Exception in handling %s on topic %s '
+                          'with params %s', method, self.topic, params)
+
+    def _run(self):
+        while True:
+            method, params, timestamp = self._queue.get()
+            self.lag = time.time()-timestamp
+            self.num_received += 1
+
+            last = len(self.listeners)-1
+            for j, (obj, allowed_methods) in enumerate(self.listeners):
+                lparams = params
+                if j != last:
+                    lparams = _handoff_copy(params)
+
+                self._dispatch(obj, allowed_methods, method, lparams)
+
+            self.num_callbacks += 1
+            if self.num_callbacks == 10:
+                self.num_callbacks = 0
+                gevent.sleep(0)
+
+    def start(self):
+        if self._glet is not None:
+            return
+
+        self._glet = gevent.spawn(self._run)
+
+    def stop(self):
+        if self._glet is None:
+            return
+
+        self._glet.kill()
+        self._glet = None
@@ -0,0 +1,655 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+This module implements a brokerless communication class for mgmtbus and
+fabric, over Unix domain sockets. It has the same interface of
+minemeld.comm.amqp.AMQP and can be used when all the processes run on
+the same host.
+
+**SOCKETS**
+
+All the sockets are created in the directory *path* of the config:
+
+- *<path>/pub/<topic>/<id>*: bound by each pub channel of the topic, *id*
+  is unique per pub channel instance. Sub channels connect to all the
+  sockets in the directory and receive the messages of all the publishers
+- *<path>/rpc/<name>*: bound by the RPC server channel *name*
+- *<path>/fanout/<fanout>/<name>*: bound by the RPC server channel *name*
+  if it is attached to the *fanout*. Fanout RPC clients send the request
+  to all the sockets in the directory
+
+Messages are ujson documents prefixed by their length as a 32-bit unsigned
+big endian integer. Update and withdraw messages are sent in batches, as
+in minemeld.comm.amqp.
+
+Publishers block when the socket buffer of a subscriber is full, and sub
+channels read the next message only after the previous one has been
+handled, so slow subscribers slow down the publishers.
+
+Sub channels connect to the pub channels bound when the sub channel is
+connected, and look for new or restarted pub channels every
+reconnect_interval seconds. Messages published while a sub channel is not
+connected to the pub channel are lost, as with the AMQP exchanges. Named
+sub channels are not persistent.
+"""
+
+from __future__ import absolute_import
+
+import os
+import os.path
+import errno
+import socket
+import struct
+import logging
+import uuid
+import time
+
+import gevent
+import gevent.event
+import gevent.lock
+import gevent.server
+import gevent.socket
+import ujson as json
+
+from .amqp import AMQPPubChannel, AMQPSubChannel, AMQPRpcFanoutClientChannel
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PATH = '/var/run/minemeld/comm'
+DEFAULT_RECONNECT_INTERVAL = 0.1
+
+
+def _send_frame(sock, msg):
+    body = json.dumps(msg)
+    sock.sendall(struct.pack('>I', len(body))+body)
+
+
+def _recv_frame(f):
+    header = f.read(4)
+    if len(header) < 4:
+        return None
+
+    length = struct.unpack('>I', header)[0]
+    body = f.read(length)
+    if len(body) < length:
+        return None
+
+    return body
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _bind(path, handle):
+    _makedirs(os.path.dirname(path))
+    _unlink(path)
+
+    sock = gevent.socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(128)
+
+    server = gevent.server.StreamServer(sock, handle)
+    server.start()
+
+    return server
+
+
+class _UDSClientConnection(object):
+    """Connection to a RPC server channel. Replies are passed to
+    callback.
+    """
+    def __init__(self, path, callback):
+        self.path = path
+        self.callback = callback
+
+        self._lock = gevent.lock.Semaphore()
+
+        self.sock = gevent.socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._glet = gevent.spawn(self._run)
+
+    def _run(self):
+        f = self.sock.makefile('rb')
+
+        while True:
+            body = _recv_frame(f)
+            if body is None:
+                break
+
+            self.callback(body)
+
+        self.sock.close()
+
+    def closed(self):
+        return self._glet.ready()
+
+    def send(self, msg):
+        with self._lock:
+            _send_frame(self.sock, msg)
+
+    def close(self):
+        self._glet.kill()
+        self.sock.close()
+
+
+class UDSPubChannel(AMQPPubChannel):
+    def __init__(self, path, topic, batch_max_size=1,
+                 batch_flush_interval=0.05, shed=False):
+        super(UDSPubChannel, self).__init__(
+            topic,
+            batch_max_size=batch_max_size,
+            batch_flush_interval=batch_flush_interval,
+            shed=shed
+        )
+
+        self.path = os.path.join(path, 'pub', topic, uuid.uuid4().hex)
+        self.subscribers = []
+
+    def _handle(self, sock, address):
+        self.subscribers.append(sock)
+
+        # subscribers never send, wait for the connection to be closed
+        try:
+            while sock.recv(1024):
+                pass
+        except socket.error:
+            pass
+
+        if sock in self.subscribers:
+            self.subscribers.remove(sock)
+
+    def connect(self):
+        if self.channel is not None:
+            return
+
+        self.channel = _bind(self.path, self._handle)
+
+    def disconnect(self):
+        if self.channel is None:
+            return
+
+        super(UDSPubChannel, self).disconnect()
+
+        for sock in self.subscribers:
+            sock.close()
+        self.subscribers = []
+
+        _unlink(self.path)
+
+    def _publish(self, method, params):
+        msg = {
+            'method': method,
+            'params': params,
+            'timestamp': time.time()
+        }
+        body = json.dumps(msg)
+        frame = struct.pack('>I', len(body))+body
+
+        for sock in self.subscribers[:]:
+            try:
+                sock.sendall(frame)
+            except socket.error:
+                LOG.error('%s - error sending message to subscriber',
+                          self.topic)
+                if sock in self.subscribers:
+                    self.subscribers.remove(sock)
+                sock.close()
+
+
+class UDSSubChannel(AMQPSubChannel):
+    def __init__(self, path, topic, listeners=None, name=None,
+                 reconnect_interval=DEFAULT_RECONNECT_INTERVAL):
+        super(UDSSubChannel, self).__init__(
+            topic,
+            listeners=listeners,
+            name=name
+        )
+
+        self.path = os.path.join(path, 'pub', topic)
+        self.reconnect_interval = reconnect_interval
+
+        # greenlets reading from the pub channels, by socket name
+        self._readers = {}
+
+    def _read(self, sock):
+        f = sock.makefile('rb')
+        try:
+            while True:
+                body = _recv_frame(f)
+                if body is None:
+                    break
+
+                self._handle_message(body)
+
+        except socket.error:
+            LOG.error('%s - error receiving messages', self.topic)
+
+        finally:
+            sock.close()
+
+    def _connect_publishers(self):
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            names = []
+
+        for name in names:
+            reader = self._readers.get(name, None)
+            if reader is not None and not reader.ready():
+                continue
+
+            sock = gevent.socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(os.path.join(self.path, name))
+            except socket.error:
+                # stale socket, or pub channel not listening yet
+                sock.close()
+                continue
+
+            LOG.debug('Subscribed to %s - %s', self.topic, name)
+            self._readers[name] = gevent.spawn(self._read, sock)
+
+    def _run(self):
+        while True:
+            gevent.sleep(self.reconnect_interval)
+            self._connect_publishers()
+
+    def connect(self):
+        if self.channel is not None:
+            return
+
+        # the pub channels already bound are connected before returning
+        self._connect_publishers()
+        self.channel = gevent.spawn(self._run)
+
+    def disconnect(self):
+        if self.channel is None:
+            return
+
+        self.channel.kill()
+        self.channel = None
+
+        gevent.killall(self._readers.values())
+        self._readers = {}
+
+
+class UDSRpcFanoutClientChannel(AMQPRpcFanoutClientChannel):
+    def __init__(self, path, fanout):
+        super(UDSRpcFanoutClientChannel, self).__init__(fanout)
+
+        self.path = os.path.join(path, 'fanout', fanout)
+        self._connections = {}
+        self._connected = False
+
+    def _connection(self, name):
+        conn = self._connections.get(name, None)
+        if conn is None or conn.closed():
+            conn = _UDSClientConnection(
+                os.path.join(self.path, name),
+                self._handle_reply
+            )
+            self._connections[name] = conn
+
+        return conn
+
+    def send_rpc(self, method, params={}, num_results=0, and_discard=False):
+        if not self._connected:
+            raise RuntimeError('Not connected')
+
+        id_ = str(uuid.uuid1())
+
+        body = {
+            'method': method,
+            'id': id_,
+            'params': params
+        }
+
+        LOG.debug('UDSRpcFanoutClientChannel - sending %s to %s',
+                  body, self.fanout)
+
+        event = gevent.event.AsyncResult()
+
+        self.active_rpcs[id_] = {
+            'cmd': method,
+            'answers': {},
+            'num_results': num_results,
+            'event': event,
+            'errors': 0,
+            'discard': and_discard
+        }
+
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            names = []
+
+        for name in names:
+            try:
+                self._connection(name).send(body)
+            except socket.error:
+                LOG.error('UDSRpcFanoutClientChannel - error sending '
+                          'request to %s', name)
+
+        gevent.sleep(0)
+
+        return event
+
+    def connect(self):
+        self._connected = True
+
+    def disconnect(self):
+        for conn in self._connections.values():
+            conn.close()
+        self._connections = {}
+        self._connected = False
+
+
+class UDSRpcServerChannel(object):
+    def __init__(self, path, name, obj, allowed_methods=[],
+                 method_prefix='', fanout=None):
+        self.name = name
+        self.obj = obj
+        self.allowed_methods = allowed_methods
+        self.fanout = fanout
+        self.method_prefix = method_prefix
+
+        self.paths = [os.path.join(path, 'rpc', name)]
+        if fanout is not None:
+            self.paths.append(os.path.join(path, 'fanout', fanout, name))
+
+        self.servers = None
+
+    def _send_result(self, sock, lock, id_, result=None, error=None):
+        ans = {
+            'source': self.name,
+            'id': id_,
+            'result': result,
+            'error': error
+        }
+
+        try:
+            with lock:
+                _send_frame(sock, ans)
+        except socket.error:
+            LOG.error('%s - error sending RPC result', self.name)
+            return
+
+        LOG.debug('UDSRpcServerChannel - sent result %s', ans)
+
+    def _callback(self, sock, lock, body):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            LOG.error("Invalid JSON in msg body")
+            return
+        LOG.debug('in callback - %s', body)
+
+        method = body.get('method', None)
+        id_ = body.get('id', None)
+        params = body.get('params', {})
+
+        if method is None:
+            LOG.error('No method in msg body')
+            return
+        if id_ is None:
+            LOG.error('No id in msg body')
+            return
+
+        method = self.method_prefix+method
+
+        if method not in self.allowed_methods:
+            LOG.error("method not allowed: %s", method)
+            self._send_result(sock, lock, id_, error="Method not allowed")
+            return
+
+        m = getattr(self.obj, method, None)
+        if m is None:
+            LOG.error("Method %s not defined for %s", method, self.name)
+            self._send_result(sock, lock, id_, error="Method not defined")
+            return
+
+        try:
+            result = m(**params)
+        except Exception as e:
+            self._send_result(sock, lock, id_, error=str(e))
+        else:
+            self._send_result(sock, lock, id_, result=result)
+
+    def _handle(self, sock, address):
+        lock = gevent.lock.Semaphore()
+        f = sock.makefile('rb')
+
+        try:
+            while True:
+                body = _recv_frame(f)
+                if body is None:
+                    break
+
+                gevent.spawn(self._callback, sock, lock, body)
+
+        except socket.error:
+            LOG.debug('%s - error receiving RPC requests', self.name)
+
+    def connect(self):
+        if self.servers is not None:
+            return
+
+        self.servers = [_bind(p, self._handle) for p in self.paths]
+
+    def disconnect(self):
+        if self.servers is None:
+            return
+
+        for s in self.servers:
+            s.stop()
+        self.servers = None
+
+        for p in self.paths:
+            _unlink(p)
+
+
+class UDS(object):
+    def __init__(self, config):
+        self.path = config.pop('path', DEFAULT_PATH)
+        self.reconnect_interval = config.pop(
+            'reconnect_interval',
+            DEFAULT_RECONNECT_INTERVAL
+        )
+        self.batch_max_size = config.pop('batch_max_size', 1)
+        self.batch_flush_interval = config.pop('batch_flush_interval', 0.05)
+
+        self.rpc_server_channels = {}
+        self.pub_channels = {}
+        self.sub_channels = {}
+        self.rpc_fanout_clients_channels = []
+
+        self.active_rpcs = {}
+        self._rpc_connections = {}
+
+        self._started = False
+
+        # there is no shared connection that could fail, errors are
+        # raised by start
+        self.failure_listeners = []
+
+    def add_failure_listener(self, listener):
+        self.failure_listeners.append(listener)
+
+    def congested(self):
+        """Backpressure is applied by the sockets, publishers are never
+        blocked by a shared condition."""
+        return False
+
+    def request_rpc_server_channel(self, name, obj=None, allowed_methods=[],
+                                   method_prefix='', fanout=None):
+        if name in self.rpc_server_channels:
+            return
+
+        self.rpc_server_channels[name] = UDSRpcServerChannel(
+            self.path,
+            name,
+            obj,
+            method_prefix=method_prefix,
+            allowed_methods=allowed_methods,
+            fanout=fanout
+        )
+
+    def request_rpc_fanout_client_channel(self, topic):
+        c = UDSRpcFanoutClientChannel(self.path, topic)
+        self.rpc_fanout_clients_channels.append(c)
+        return c
+
+    def request_pub_channel(self, topic, shed=False):
+        if topic not in self.pub_channels:
+            self.pub_channels[topic] = UDSPubChannel(
+                self.path,
+                topic,
+                batch_max_size=self.batch_max_size,
+                batch_flush_interval=self.batch_flush_interval,
+                shed=shed
+            )
+
+        return self.pub_channels[topic]
+
+    def request_sub_channel(self, topic, obj=None, allowed_methods=None,
+                            name=None):
+        if allowed_methods is None:
+            allowed_methods = []
+
+        if topic in self.sub_channels:
+            self.sub_channels[topic].add_listener(obj, allowed_methods)
+            return self.sub_channels[topic]
+
+        subchannel = UDSSubChannel(
+            self.path,
+            topic,
+            [(obj, allowed_methods)],
+            name=name,
+            reconnect_interval=self.reconnect_interval
+        )
+        self.sub_channels[topic] = subchannel
+
+        return subchannel
+
+    def _rpc_callback(self, body):
+        try:
+            msg = json.loads(body)
+        except ValueError:
+            LOG.error("Invalid JSON in msg body")
+            return
+        id_ = msg.get('id', None)
+        if id_ is None:
+            LOG.error("No id field in RPC reply")
+            return
+        if id_ not in self.active_rpcs:
+            LOG.error("Unknown id received in RPC reply: %s", id_)
+            return
+        ar = self.active_rpcs.pop(id_)
+        ar.set({
+            'error': msg.get('error', None),
+            'result': msg.get('result', None)
+        })
+
+    def _rpc_connection(self, dest):
+        conn = self._rpc_connections.get(dest, None)
+        if conn is None or conn.closed():
+            conn = _UDSClientConnection(
+                os.path.join(self.path, 'rpc', dest),
+                self._rpc_callback
+            )
+            self._rpc_connections[dest] = conn
+
+        return conn
+
+    def send_rpc(self, dest, method, params,
+                 block=True, timeout=None):
+        if not self._started:
+            raise RuntimeError('Not connected')
+
+        id_ = str(uuid.uuid1())
+
+        body = {
+            'method': method,
+            'id': id_,
+            'params': params
+        }
+        LOG.debug('sending %s to %s', body, dest)
+
+        self.active_rpcs[id_] = gevent.event.AsyncResult()
+        try:
+            self._rpc_connection(dest).send(body)
+        except:
+            self.active_rpcs.pop(id_)
+            raise
+
+        try:
+            result = self.active_rpcs[id_].get(block=block, timeout=timeout)
+        except gevent.timeout.Timeout:
+            self.active_rpcs.pop(id_)
+            raise
+
+        return result
+
+    def start(self):
+        _makedirs(self.path)
+
+        for rpcc in self.rpc_server_channels.values():
+            rpcc.connect()
+
+        for pc in self.pub_channels.values():
+            pc.connect()
+
+        for sc in self.sub_channels.values():
+            sc.connect()
+
+        for rfc in self.rpc_fanout_clients_channels:
+            rfc.connect()
+
+        self._started = True
+
+    def stop(self):
+        if not self._started:
+            return
+
+        for rpcc in self.rpc_server_channels.values():
+            rpcc.disconnect()
+
+        for pc in self.pub_channels.values():
+            pc.disconnect()
+
+        for sc in self.sub_channels.values():
+            sc.disconnect()
+
+        for rfc in self.rpc_fanout_clients_channels:
+            rfc.disconnect()
+
+        for conn in self._rpc_connections.values():
+            conn.close()
+        self._rpc_connections = {}
+
+        self._started = False
@@ -25,13 +25,32 @@ from __future__ import absolute_import
 import logging
 
 import minemeld.comm
+import minemeld.comm.local
 
 LOG = logging.getLogger(__name__)
 
+DEFAULT_BATCH_MAX_SIZE = 100
+
 
 class Fabric(object):
     """MineMeld chassis fabric class
 
+    Updates and withdraws published by the nodes are sent in batches of
+    at most *batch_max_size* messages (default: 100), set *batch_max_size*
+    to 1 in the config to disable batches.
+
+    Updates, withdraws and checkpoints published by a node are delivered
+    directly to the subscribers in the same chassis, see
+    minemeld.comm.local, and are published on the communication backend
+    only if the node has subscribers in other chassis. Set
+    *local_delivery* to False in the config to send every message through
+    the communication backend.
+
+    The queues of the local subscriptions hold at most *local_queue_size*
+    messages (default: 1000), publishers block when a queue is full. When
+    a local queue is congested or the communication backend is blocked the
+    fabric is congested, and the chassis drops the trace logs.
+
     Args:
         chassis: MineMeld chassis instance
         config (dict): communication backend config
@@ -40,11 +59,49 @@ class Fabric(object):
     def __init__(self, chassis, config, comm_class):
         self.chassis = chassis
 
-        self.comm_config = config
+        self.comm_config = dict(config)
+        self.comm_config.setdefault('batch_max_size', DEFAULT_BATCH_MAX_SIZE)
+        self.local_delivery = self.comm_config.pop('local_delivery', True)
+        self.local_queue_size = self.comm_config.pop(
+            'local_queue_size',
+            minemeld.comm.local.DEFAULT_QUEUE_SIZE
+        )
         self.comm_class = comm_class
 
         self.comm = minemeld.comm.factory(self.comm_class, self.comm_config)
 
+        self.local_nodes = set()
+        self.remote_outputs = None
+        self.local_sub_channels = {}
+
+    def configure(self, local_nodes, remote_outputs=None):
+        """Sets the nodes running in this chassis. Should be called
+        before the nodes request their channels.
+
+        Args:
+            local_nodes (list): names of the nodes in this chassis
+            remote_outputs (list): names of the nodes in this chassis
+                with subscribers in other chassis, None if unknown
+        """
+        if not self.local_delivery:
+            return
+
+        self.local_nodes = set(local_nodes)
+        self.remote_outputs = remote_outputs
+        if self.remote_outputs is not None:
+            self.remote_outputs = set(self.remote_outputs)
+
+    def _local_sub_channel(self, topic):
+        sc = self.local_sub_channels.get(topic, None)
+        if sc is None:
+            sc = minemeld.comm.local.LocalSubChannel(
+                topic,
+                queue_size=self.local_queue_size
+            )
+            self.local_sub_channels[topic] = sc
+
+        return sc
+
     def request_rpc_channel(self, ftname, node, allowed_methods):
         """Creates a new RPC channel on the communication backend.
 
@@ -61,7 +118,18 @@ class Fabric(object):
         Args:
             ftname (str): node name
         """
-        return self.comm.request_pub_channel(ftname)
+        if ftname not in self.local_nodes:
+            return self.comm.request_pub_channel(ftname)
+
+        remote = None
+        if self.remote_outputs is None or ftname in self.remote_outputs:
+            remote = self.comm.request_pub_channel(ftname)
+
+        return minemeld.comm.local.LocalPubChannel(
+            ftname,
+            sub_channel=self._local_sub_channel(ftname),
+            remote=remote
+        )
 
     def request_sub_channel(self, ftname, node, subname, allowed_methods):
         """Creates a subscription channel to topic subname.
@@ -71,9 +139,27 @@ class Fabric(object):
             node: node instance
             subname (str): name of the topic to subscribe to
             allowed_methods (list): list of allowed methods
+
+        Returns:
+            the subscription channel, with a stats method
         """
         _ = ftname  # noqa
-        self.comm.request_sub_channel(subname, node, allowed_methods)
+        if subname in self.local_nodes:
+            sc = self._local_sub_channel(subname)
+            sc.add_listener(node, allowed_methods)
+            return sc
+
+        return self.comm.request_sub_channel(subname, node, allowed_methods)
+
+    def congested(self):
+        """Returns True if a local subscription is congested or the
+        communication backend is blocked.
+        """
+        for sc in self.local_sub_channels.values():
+            if sc.congested():
+                return True
+
+        return self.comm.congested()
 
     def send_rpc(self, sftname, dftname, method, params,
                  block=True, timeout=None):
@@ -86,9 +172,12 @@ class Fabric(object):
             params (dict): parameters
             block (bool): if call should block
             timeout (int): timeout in seconds
+
+        Returns:
+            dict with the *result* and the *error* of the call
         """
         params['source'] = sftname
-        self.comm.send_rpc(
+        return self.comm.send_rpc(
             dftname,
             method,
             params,
@@ -104,8 +193,15 @@ class Fabric(object):
         self.comm.add_failure_listener(self._comm_failure)
         self.comm.start()
 
+        for sc in self.local_sub_channels.values():
+            sc.start()
+
     def stop(self):
         LOG.debug("fabric stop called")
+
+        for sc in self.local_sub_channels.values():
+            sc.stop()
+
         self.comm.stop()
 
 
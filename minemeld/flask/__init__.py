@@ -13,6 +13,7 @@
 #  limitations under the License.
 
 import sys
+import os
 
 from flask import Flask
 from flask import g
@@ -43,102 +44,139 @@ try:
     import minemeld.comm
     import gevent
     import gevent.event
+    import gevent.lock
     import gevent.queue
     import amqp
     import json
     import psutil  # noqa
 
-    class _MMMasterConnection(object):
-        def __init__(self):
-            self.comm = None
-
-            tconfig = config.get('MGMTBUS', {})
-            self.comm_class = tconfig.get('class', 'AMQP')
-            self.comm_config = tconfig.get('config', {})
-
-        def _open_channel(self):
-            if self.comm is not None:
-                return
-
-            self.comm = minemeld.comm.factory(
+    class _MMRpcPool(object):
+        """Process wide pool of comm instances used to send RPCs to the
+        engine. RPCs are multiplexed on the instances of the pool, selected
+        round robin.
+
+        An instance is marked as failed when its connection fails or when
+        sending a RPC raises an I/O error, and it is replaced by a new one
+        the next time it is selected. The RPC is retried once on the next
+        instance. The pool is created again after a fork, the connections
+        of the parent process are not used.
+
+        Args:
+            comm_class (str): communication backend
+            comm_config (dict): config of the communication backend
+            size (int): number of instances in the pool
+        """
+        def __init__(self, comm_class, comm_config, size=2):
+            self.comm_class = comm_class
+            self.comm_config = comm_config
+            self.size = size
+
+            self._pid = None
+            self._comms = []
+            self._next = 0
+            self._lock = gevent.lock.Semaphore()
+
+        def _connect(self):
+            comm = minemeld.comm.factory(
                 self.comm_class,
-                self.comm_config
+                dict(self.comm_config)
             )
-            self.comm.start()
+            pc = {'comm': comm, 'healthy': True}
 
-        def _send_cmd(self, method, params={}):
-            self._open_channel()
+            def _failure():
+                LOG.error('MMRpcPool - comm failure')
+                pc['healthy'] = False
 
-            return self.comm.send_rpc('mbus:master', method, params)
+            comm.add_failure_listener(_failure)
+            comm.start()
 
-        def status(self):
-            return self._send_cmd('status')
+            return pc
 
-        def stop(self):
-            if self.comm is not None:
-                self.comm.stop()
-                self.comm = None
+        def _get(self):
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._comms = [None]*self.size
+                self._next = 0
 
-    def get_mmmaster():
-        r = getattr(g, 'MMMaster', None)
-        if r is None:
-            r = _MMMasterConnection()
-            g.MMMaster = r
-        return r
+            j = self._next
+            self._next = (j+1) % self.size
 
-    @app.teardown_appcontext
-    def tearwdown_mmmaster(exception):
-        r = getattr(g, 'MMMaster', None)
-        if r is not None:
-            g.MMMaster.stop()
-            g.MMMaster = None
+            pc = self._comms[j]
+            if pc is not None and pc['healthy']:
+                return pc
 
-    MMMaster = werkzeug.LocalProxy(get_mmmaster)
+            with self._lock:
+                pc = self._comms[j]
+                if pc is None or not pc['healthy']:
+                    if pc is not None:
+                        self._close(pc)
 
-    class _MMRpcClient(object):
-        def __init__(self):
-            self.comm = None
+                    pc = self._connect()
+                    self._comms[j] = pc
 
-            tconfig = config.get('MGMTBUS', {})
-            self.comm_class = tconfig.get('class', 'AMQP')
-            self.comm_config = tconfig.get('config', {})
+            return pc
 
-        def _open_channel(self):
-            if self.comm is not None:
-                return
+        def _close(self, pc):
+            try:
+                pc['comm'].stop()
+            except:
+                LOG.exception('MMRpcPool - exception closing comm')
 
-            self.comm = minemeld.comm.factory(
-                self.comm_class,
-                self.comm_config
-            )
-            self.comm.start()
+        def send_rpc(self, target, method, params, timeout=None):
+            pc = self._get()
+            try:
+                return pc['comm'].send_rpc(
+                    target,
+                    method,
+                    params,
+                    timeout=timeout
+                )
 
-        def send_cmd(self, target, method, params={}, timeout=10):
-            self._open_channel()
-            LOG.debug('MMRpcClient channel open')
+            except (IOError, amqp.AMQPError):
+                LOG.exception('MMRpcPool - error sending %s to %s, retrying',
+                              method, target)
+                pc['healthy'] = False
 
-            return self.comm.send_rpc(target, method, params, timeout=timeout)
+            pc = self._get()
+            return pc['comm'].send_rpc(target, method, params, timeout=timeout)
 
         def stop(self):
-            if self.comm is not None:
-                self.comm.stop()
-                self.comm = None
+            for pc in self._comms:
+                if pc is not None:
+                    self._close(pc)
+            self._comms = [None]*self.size
 
-    def get_mmrpcclient():
-        r = getattr(g, 'MMRpcClient', None)
-        if r is None:
-            r = _MMRpcClient()
-            g.MMRpcClient = r
-        return r
+    def _mgmtbus_pool():
+        tconfig = config.get('MGMTBUS', {})
 
-    @app.teardown_appcontext
-    def tearwdown_mmrpcclient(exception):
-        r = getattr(g, 'MMRpcClient', None)
-        if r is not None:
-            g.MMRpcClient.stop()
-            g.MMRpcClient = None
+        return _MMRpcPool(
+            tconfig.get('class', 'AMQP'),
+            tconfig.get('config', {}),
+            size=tconfig.get('pool_size', 2)
+        )
+
+    class _MMMasterConnection(object):
+        def __init__(self, pool):
+            self.pool = pool
+
+        def _send_cmd(self, method, params={}):
+            return self.pool.send_rpc('mbus:master', method, params)
+
+        def status(self):
+            return self._send_cmd('status')
+
+    class _MMRpcClient(object):
+        def __init__(self, pool):
+            self.pool = pool
+
+        def send_cmd(self, target, method, params={}, timeout=10):
+            return self.pool.send_rpc(target, method, params, timeout=timeout)
 
-    MMRpcClient = werkzeug.LocalProxy(get_mmrpcclient)
+    # connections are opened at the first RPC and shared by all the
+    # requests of the process
+    MMRpcPool = _mgmtbus_pool()
+    MMMaster = _MMMasterConnection(MMRpcPool)
+    MMRpcClient = _MMRpcClient(MMRpcPool)
 
     class _MMStateFanout(object):
         def __init__(self):
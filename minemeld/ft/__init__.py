@@ -1,6 +1,7 @@
 _KNOWN_CLASSES = {
     'HTTP': 'minemeld.ft.http.HttpFT',
     'AggregatorIPv4': 'minemeld.ft.ipop.AggregateIPv4FT',
+    'AggregatorIPv6': 'minemeld.ft.ipop.AggregateIPv6FT',
     'Aggregator': 'minemeld.ft.op.AggregateFT',
     'RedisSet': 'minemeld.ft.redis.RedisSet'
 }
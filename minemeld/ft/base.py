@@ -23,19 +23,56 @@ import copy
 import os
 import collections
 import json
+import uuid
+import operator
+import zlib
+import time
+
+import gevent.pool
+import gevent.local
 
 from . import condition
+from . import dbenv
 from . import ft_states
+from . import latency
 from . import utils
 
 
 LOG = logging.getLogger(__name__)
 
+TRACE_LEVELS = ['off', 'withdraw', 'sampled', 'full']
+
+FILTERS_INDEX_ATTRIBUTES = ['__origin', '__method', 'type']
+FILTERS_CACHE_SIZE = 1024
+
+# up to 2**31 usecs, about 35 minutes
+EDGE_LATENCY_BUCKETS = 32
+
+
+class _MetaLocal(gevent.local.local):
+    """Metadata of the indicator being processed. Handlers of different
+    inputs and the other greenlets of the node run concurrently, the
+    metadata is kept per greenlet.
+    """
+    def __init__(self):
+        self.current = None
+
 
 class _Filters(object):
     """Implements a set of filters to be applied to indicators.
     Used by mineneld.ft.base.BaseFT for ingress and egress filters.
 
+    Filters are compiled in a list of (match, action) where match is
+    a function evaluating the conditions of the filter with short-circuit.
+    Filters without an *accept* or *drop* action can't change the result
+    and are not compiled.
+
+    Filters with an equality condition on *__origin*, *__method* or *type*
+    are indexed on the value of the condition, only the filters indexed on
+    the origin, method and type of the indicator and the filters not
+    indexed are evaluated. The list of candidate filters for each
+    (origin, method, type) is cached.
+
     Args:
         filters (list): list of filters.
     """
@@ -57,69 +94,150 @@ class _Filters(object):
 
             self.filters.append(cf)
 
-    def apply(self, origin=None, method=None, indicator=None, value=None):
-        if value is None:
-            d = {}
-        else:
-            d = copy.copy(value)
+        # number of indicators matched by each filter
+        self.hits = [0]*len(self.filters)
+
+        self._compiled = []
+        self._index = dict((a, {}) for a in FILTERS_INDEX_ATTRIBUTES)
+        self._not_indexed = []
+        self._candidates = {}
+
+        for fidx, f in enumerate(self.filters):
+            action = next(
+                (a for a in f['actions'] if a in ['accept', 'drop']),
+                None
+            )
+            if action is None:
+                continue
+
+            conditions = list(f['conditions'])
+            ic = self._index_condition(conditions)
+            if ic is not None:
+                conditions.remove(ic)
+
+            cpos = len(self._compiled)
+            self._compiled.append((
+                self._compile_conditions(conditions),
+                action == 'accept',
+                fidx
+            ))
+
+            if ic is None:
+                self._not_indexed.append(cpos)
+            else:
+                self._index[ic.identifier].setdefault(ic.value, []).append(
+                    cpos
+                )
+
+    @staticmethod
+    def _index_condition(conditions):
+        for attribute in FILTERS_INDEX_ATTRIBUTES:
+            for c in conditions:
+                if c.identifier != attribute:
+                    continue
+
+                if c.comparator is not operator.eq:
+                    continue
+
+                if not isinstance(c.value, basestring):
+                    continue
+
+                return c
+
+        return None
 
-        if indicator is not None:
-            d['__indicator'] = indicator
+    @staticmethod
+    def _compile_conditions(conditions):
+        conditions = [c.compile() for c in conditions]
 
-        if method is not None:
-            d['__method'] = method
+        if len(conditions) == 0:
+            return lambda v, i, m, o: True
 
-        if origin is not None:
-            d['__origin'] = origin
+        if len(conditions) == 1:
+            return conditions[0]
 
-        for f in self.filters:
-            LOG.debug("evaluating filter %s", f['name'])
+        def _match(v, i, m, o):
+            for c in conditions:
+                if not c(v, i, m, o):
+                    return False
+            return True
 
-            r = True
-            for c in f['conditions']:
-                r &= c.eval(d)
+        return _match
 
-            if not r:
+    def _lookup(self, origin, method, itype):
+        positions = list(self._not_indexed)
+        for attribute, avalue in zip(FILTERS_INDEX_ATTRIBUTES,
+                                     [origin, method, itype]):
+            if avalue is None:
                 continue
+            positions.extend(self._index[attribute].get(avalue, []))
+        positions.sort()
 
-            for a in f['actions']:
-                if a == 'accept':
-                    if value is None:
-                        return indicator, None
+        candidates = [self._compiled[p] for p in positions]
 
-                    d.pop('__indicator')
-                    d.pop('__origin', None)
-                    d.pop('__method', None)
+        if len(self._candidates) >= FILTERS_CACHE_SIZE:
+            self._candidates = {}
+        self._candidates[(origin, method, itype)] = candidates
 
-                    return indicator, d
+        return candidates
 
-                elif a == 'drop':
-                    return None, None
+    def apply(self, origin=None, method=None, indicator=None, value=None):
+        """Applies the filters to the indicator. Filters do not modify
+        the value, the value itself is returned when the indicator
+        is accepted.
+
+        Returns:
+            (indicator, value) if the indicator is accepted,
+            (None, None) if the indicator is dropped.
+        """
+        if len(self._compiled) == 0:
+            return indicator, value
+
+        itype = None
+        if value is not None:
+            itype = value.get('type', None)
+            if not isinstance(itype, basestring):
+                itype = None
+
+        candidates = self._candidates.get((origin, method, itype), None)
+        if candidates is None:
+            candidates = self._lookup(origin, method, itype)
 
-        LOG.debug("no matching filter, default accept")
+        for match, accept, fidx in candidates:
+            if match(value, indicator, method, origin):
+                self.hits[fidx] += 1
 
-        if value is None:
-            return indicator, None
+                if accept:
+                    return indicator, value
 
-        d.pop('__indicator')
-        d.pop('__origin', None)
-        d.pop('__method', None)
+                return None, None
 
-        return indicator, d
+        return indicator, value
+
+    def stats(self):
+        return [
+            {'name': f['name'], 'hits': h}
+            for f, h in zip(self.filters, self.hits)
+        ]
 
 
 def _counting(statsname):
-    """Decorator for counting calls to decorated instance methods.
-    Counters are stored in statistics attribute of the instance.
+    """Decorator for counting calls to decorated instance methods and
+    measuring their latency.
+    Counters are stored in statistics attribute of the instance, latency
+    histograms in latency attribute.
 
     Args:
         statsname (str): name of the counter to increment
     """
     def _counter_out(f):
         def _counter(self, *args, **kwargs):
-            LOG.debug('updating %s', statsname)
             self.statistics[statsname] += 1
-            f(self, *args, **kwargs)
+            t0 = time.time()
+            try:
+                f(self, *args, **kwargs)
+            finally:
+                self.latency[statsname].add(time.time()-t0)
         return _counter
     return _counter_out
 
@@ -133,11 +251,54 @@ class BaseFT(object):
             received indicators.
         :outfilters: outbound filter set. Filters to be applied to
             transmitted indicators.
+        :stream_chunk_size: number of indicators in each chunk sent in
+            reply to *get_all* and *get_range*. Default: 500
+        :stream_window: number of chunks in flight while replying to
+            *get_all* and *get_range*. Default: 4
+        :track_latency: if True the indicators emitted by the node carry
+            the origin timestamp, see *Latency tracking*. Default: False
+        :trace_level: indicators traced by the node, **off**,
+            **withdraw** (withdraws only), **sampled** or **full**.
+            Default: full
+        :trace_sample_rate: fraction of the indicators traced when
+            *trace_level* is **sampled**. Default: 0.01
+
+    **Latency tracking**
+        Update and withdraw messages can carry a *meta* dictionary, separate
+        from the value, with the origin timestamp *ts* of the indicator and
+        the number of *hops* from the origin. Nodes with *track_latency* set
+        add it to the indicators they emit when they are not processing a
+        received indicator, miners set the origin when the indicator is seen
+        in the polling loop. Nodes forward the meta of the indicator being
+        processed adding one hop, and keep a latency histogram for each
+        input, reported in *edge_latency* by *mgmtbus_status*. The meta of
+        the indicator being processed is kept per greenlet in
+        *current_meta*, handlers emitting indicators from other greenlets
+        can pass it explicitly with the *meta* argument of *emit_update*
+        and *emit_withdraw*.
+
+    **Tracing**
+        Traces are sent to the chassis, that batches them for mm-traced.
+        With *trace_level* **sampled** an indicator is traced if the CRC32
+        of the indicator is below *trace_sample_rate*, the same indicators
+        are then traced by all the nodes of the graph. Traces sent, not
+        sampled and dropped by the chassis are counted in the
+        *trace.tx*, *trace.sampled_out* and *trace.dropped* statistics.
+
+    **Streams**
+        Nodes reply to *get_all* and *get_range* by sending the indicators
+        to the requester with *update_chunk* RPCs. Each chunk has the id of
+        the stream, a sequence number, a list of [indicator, value] and a
+        cursor, the last indicator of the chunk. Up to *stream_window* chunks
+        are in flight at the same time. When all the chunks have been
+        acknowledged a last empty chunk with *last* set to True and the
+        number of chunks is sent as completion marker.
 
     **Filter set**
         Each filter set is a list of filters. Filters are verified from top
         to bottom, and the first matching filter is applied. Default action
-        is **accept**.
+        is **accept**. Filters are compiled when the node is configured and
+        do not copy or modify the indicator value.
         Each filter is a dictionary with 3 keys:
 
         :name: name of the filter.
@@ -194,9 +355,17 @@ class BaseFT(object):
         self.configure()
 
         self.inputs = []
+        self.input_channels = {}
         self.output = None
 
         self.statistics = collections.defaultdict(lambda: 0)
+        self.latency = collections.defaultdict(latency.Histogram)
+
+        # latency from the origin of the indicators and number of hops,
+        # per input
+        self._meta_local = _MetaLocal()
+        self.edge_latency = {}
+        self.edge_hops = {}
 
         self.read_checkpoint()
 
@@ -288,20 +457,34 @@ class BaseFT(object):
         """
         self.infilters = _Filters(self.config.get('infilters', []))
         self.outfilters = _Filters(self.config.get('outfilters', []))
+        self.stream_chunk_size = self.config.get('stream_chunk_size', 500)
+        self.stream_window = self.config.get('stream_window', 4)
+        self.track_latency = self.config.get('track_latency', False)
+
+        self.trace_level = self.config.get('trace_level', 'full')
+        if self.trace_level not in TRACE_LEVELS:
+            raise ValueError('%s - unknown trace level %s' %
+                             (self.name, self.trace_level))
+        self.trace_sample_rate = self.config.get('trace_sample_rate', 0.01)
+        self._trace_sample_threshold = \
+            int(self.trace_sample_rate * 0x100000000)
 
     def connect(self, inputs, output):
         if self.state != ft_states.READY:
             LOG.error('connect called in non ready FT')
             raise AssertionError('connect called in non ready FT')
 
+        self.input_channels = {}
         for i in inputs:
             LOG.info("%s - requesting fabric sub channel for %s", self.name, i)
-            self.chassis.request_sub_channel(
+            sc = self.chassis.request_sub_channel(
                 self.name,
                 self,
                 i,
-                allowed_methods=['update', 'withdraw', 'checkpoint']
+                allowed_methods=['update', 'withdraw', 'checkpoint', 'batch']
             )
+            if sc is not None:
+                self.input_channels[i] = sc
         self.inputs = inputs
         self.inputs_checkpoint = {}
 
@@ -313,6 +496,7 @@ class BaseFT(object):
             self,
             allowed_methods=[
                 'update',
+                'update_chunk',
                 'withdraw',
                 'checkpoint',
                 'get',
@@ -345,8 +529,82 @@ class BaseFT(object):
         return self.chassis.send_rpc(self.name, dftname, method, kwargs,
                                      block=block, timeout=timeout)
 
+    def _send_chunk(self, dftname, stream, seq, indicators, cursor=None,
+                    last=False):
+        result = self.do_rpc(
+            dftname,
+            'update_chunk',
+            stream=stream,
+            seq=seq,
+            indicators=indicators,
+            cursor=cursor,
+            last=last
+        )
+
+        if result is not None and result.get('error', None) is not None:
+            raise RuntimeError('%s - error in update_chunk %d to %s: %s' %
+                               (self.name, seq, dftname, result['error']))
+
+    def stream_indicators(self, dftname, indicators):
+        """Sends indicators to a node with a stream of *update_chunk*
+        RPCs.
+
+        Args:
+            dftname (str): destination node name
+            indicators: iterator of (indicator, value)
+
+        Returns:
+            number of indicators sent
+        """
+        stream = str(uuid.uuid4())
+        pool = gevent.pool.Pool(self.stream_window)
+        glets = []
+
+        def _flush(chunk, seq):
+            glets.append(pool.spawn(
+                self._send_chunk,
+                dftname,
+                stream,
+                seq,
+                chunk,
+                cursor=chunk[-1][0]
+            ))
+
+            # stop at the first failed chunk
+            for g in glets:
+                if g.ready() and not g.successful():
+                    raise g.exception
+
+        num_indicators = 0
+        seq = 0
+        chunk = []
+        for indicator, value in indicators:
+            chunk.append([indicator, value])
+            num_indicators += 1
+
+            if len(chunk) >= self.stream_chunk_size:
+                _flush(chunk, seq)
+                seq += 1
+                chunk = []
+
+        if len(chunk) != 0:
+            _flush(chunk, seq)
+            seq += 1
+
+        pool.join()
+        for g in glets:
+            if not g.successful():
+                raise g.exception
+
+        self._send_chunk(dftname, stream, seq, [], last=True)
+
+        LOG.debug('%s - sent %d indicators in %d chunks to %s',
+                  self.name, num_indicators, seq, dftname)
+
+        return num_indicators
+
     @_counting('update.tx')
-    def emit_update(self, indicator, value):
+    def emit_update(self, indicator, value, meta=None):
         if self.output is None:
             return
 
@@ -362,19 +620,25 @@ class BaseFT(object):
         if indicator is None:
             return
 
+        # value could be the node own copy, filters don't copy it
         if value is not None:
-            for k in value.keys():
-                if k[0] in ['_', '$']:
-                    value.pop(k)
+            value = dict(
+                (k, v) for k, v in value.iteritems() if k[0] not in ['_', '$']
+            )
 
-        self.output.publish("update", {
+        params = {
             'source': self.name,
             'indicator': indicator,
             'value': value
-        })
+        }
+        meta = self._emit_meta(meta)
+        if meta is not None:
+            params['meta'] = meta
+
+        self.output.publish("update", params)
 
     @_counting('withdraw.tx')
-    def emit_withdraw(self, indicator, value=None):
+    def emit_withdraw(self, indicator, value=None, meta=None):
         if self.output is None:
             return
 
@@ -390,16 +654,22 @@ class BaseFT(object):
         if indicator is None:
             return
 
+        # value could be the node own copy, filters don't copy it
         if value is not None:
-            for k in value.keys():
-                if k[0] in ['_', '$']:
-                    value.pop(k)
+            value = dict(
+                (k, v) for k, v in value.iteritems() if k[0] not in ['_', '$']
+            )
 
-        self.output.publish("withdraw", {
+        params = {
             'source': self.name,
             'indicator': indicator,
             'value': value
-        })
+        }
+        meta = self._emit_meta(meta)
+        if meta is not None:
+            params['meta'] = meta
+
+        self.output.publish("withdraw", params)
 
     @_counting('checkpoint.tx')
     def emit_checkpoint(self, value):
@@ -412,7 +682,7 @@ class BaseFT(object):
         })
 
     @_counting('update.rx')
-    def update(self, source=None, indicator=None, value=None):
+    def update(self, source=None, indicator=None, value=None, meta=None):
         LOG.debug('%s {%s} - update from %s value %s',
                   self.name, self.state, source, value)
 
@@ -439,7 +709,9 @@ class BaseFT(object):
 
         if fltindicator is None:
             self.trace('DROP_UPDATE', indicator, source_node=source, value=value)
-            self.filtered_withdraw(
+            self._call_with_meta(
+                meta,
+                self.filtered_withdraw,
                 source=source,
                 indicator=indicator,
                 value=value
@@ -447,7 +719,9 @@ class BaseFT(object):
             return
 
         self.trace('ACCEPT_UPDATE', indicator, source_node=source, value=value)
-        self.filtered_update(
+        self._call_with_meta(
+            meta,
+            self.filtered_update,
             source=source,
             indicator=fltindicator,
             value=fltvalue
@@ -458,7 +732,7 @@ class BaseFT(object):
         raise NotImplementedError('%s: update' % self.name)
 
     @_counting('withdraw.rx')
-    def withdraw(self, source=None, indicator=None, value=None):
+    def withdraw(self, source=None, indicator=None, value=None, meta=None):
         LOG.debug('%s {%s} - withdraw from %s value %s',
                   self.name, self.state, source, value)
 
@@ -488,7 +762,9 @@ class BaseFT(object):
                     fltvalue.pop(k)
 
         self.trace('ACCEPT_WITHDRAW', indicator, source_node=source, value=value)
-        self.filtered_withdraw(
+        self._call_with_meta(
+            meta,
+            self.filtered_withdraw,
             source=source,
             indicator=indicator,
             value=value
@@ -498,6 +774,106 @@ class BaseFT(object):
     def filtered_withdraw(self, source=None, indicator=None, value=None):
         raise NotImplementedError('%s: withdraw' % self.name)
 
+    def _call_with_meta(self, meta, f, source=None, **kwargs):
+        """Calls the handler f of a received indicator with *meta* as
+        metadata of the indicator being processed, see *Latency tracking*.
+        The latency from the origin is recorded on the edge from *source*.
+        """
+        prev_meta = self.current_meta
+        self.current_meta = meta
+        try:
+            f(source=source, **kwargs)
+
+        finally:
+            self.current_meta = prev_meta
+
+            if meta is not None:
+                self._record_edge_latency(source, meta)
+
+    def _record_edge_latency(self, source, meta):
+        try:
+            elapsed = max(time.time()-meta['ts'], 0)
+        except (KeyError, TypeError):
+            LOG.debug('%s - invalid meta from %s: %s', self.name, source, meta)
+            return
+
+        h = self.edge_latency.get(source, None)
+        if h is None:
+            h = latency.Histogram(num_buckets=EDGE_LATENCY_BUCKETS)
+            self.edge_latency[source] = h
+        h.add(elapsed)
+
+        self.edge_hops[source] = meta.get('hops', None)
+
+    @property
+    def current_meta(self):
+        """Metadata of the indicator being processed by the current
+        greenlet, see *Latency tracking*.
+        """
+        return self._meta_local.current
+
+    @current_meta.setter
+    def current_meta(self, value):
+        self._meta_local.current = value
+
+    def _emit_meta(self, meta=None):
+        """Returns the metadata of the emitted indicator: the metadata of
+        the indicator being processed, *meta* or the current metadata, with
+        one more hop, or a new origin if *track_latency* is set.
+        """
+        if meta is None:
+            meta = self.current_meta
+        if meta is not None:
+            return {'ts': meta.get('ts', None), 'hops': meta.get('hops', 0)+1}
+
+        if self.track_latency:
+            return {'ts': time.time(), 'hops': 1}
+
+        return None
+
+    def batch(self, messages=None):
+        """Handles a batch of update and withdraw messages received from
+        the fabric, in order. Nodes can override it to process the whole
+        batch at once.
+
+        Args:
+            messages (list): list of [<method>, <params>]
+        """
+        for method, params in messages:
+            if method == 'update':
+                m = self.update
+            elif method == 'withdraw':
+                m = self.withdraw
+            else:
+                LOG.error('%s - method %s not allowed in batch',
+                          self.name, method)
+                continue
+
+            try:
+                m(**params)
+            except:
+                LOG.exception('%s - exception in handling %s from batch '
+                              'with params %s', self.name, method, params)
+
+    def update_chunk(self, source=None, stream=None, seq=None,
+                     indicators=None, cursor=None, last=False):
+        """Handles a chunk of a stream sent in reply to *get_all* or
+        *get_range*, see *Streams*.
+        """
+        if last:
+            LOG.debug('%s - stream %s from %s completed, %d chunks',
+                      self.name, stream, source, seq)
+            return 'OK'
+
+        for indicator, value in indicators:
+            try:
+                self.update(source=source, indicator=indicator, value=value)
+            except:
+                LOG.exception('%s - exception in handling update of %s '
+                              'from stream %s', self.name, indicator, stream)
+
+        return 'OK'
+
     @_counting('checkpoint.rx')
     def checkpoint(self, source=None, value=None):
         LOG.debug('%s {%s} - checkpoint from %s value %s',
@@ -555,10 +931,49 @@ class BaseFT(object):
             'class': (self.__class__.__module__+'.'+self.__class__.__name__),
             'state': self.state,
             'statistics': self.statistics,
+            'trace_level': self.trace_level,
             'length': self.length(),
             'inputs': self.inputs,
             'output': (self.output is not None)
         }
+
+        storage = dbenv.usage(self.name)
+        if len(storage) != 0:
+            result['storage'] = storage
+
+        # latency histograms of the node methods and of the table
+        node_latency = latency.statistics(self.latency)
+        table = getattr(self, 'table', None)
+        if table is not None and hasattr(table, 'latency'):
+            for op, s in latency.statistics(table.latency).iteritems():
+                node_latency['table.'+op] = s
+        if len(node_latency) != 0:
+            result['latency'] = node_latency
+
+        edge_latency = {}
+        for source, h in self.edge_latency.iteritems():
+            edge_latency[source] = h.statistics()
+            edge_latency[source]['hops'] = self.edge_hops.get(source, None)
+        if len(edge_latency) != 0:
+            result['edge_latency'] = edge_latency
+
+        # number of indicators matched by each filter
+        filters = {}
+        if len(self.infilters.filters) != 0:
+            filters['infilters'] = self.infilters.stats()
+        if len(self.outfilters.filters) != 0:
+            filters['outfilters'] = self.outfilters.stats()
+        if len(filters) != 0:
+            result['filters'] = filters
+
+        # received messages, pending messages and lag in seconds
+        # of each input subscription
+        subscriptions = {}
+        for i, sc in self.input_channels.iteritems():
+            subscriptions[i] = sc.stats()
+        if len(subscriptions) != 0:
+            result['subscriptions'] = subscriptions
+
         return result
 
     def mgmtbus_checkpoint(self, value=None):
@@ -572,6 +987,13 @@ class BaseFT(object):
 
         return 'OK'
 
+    def storage_dbs(self):
+        """Returns the names of the LevelDB tables opened by the node,
+        used by the storage environment to split the memory budget
+        across the DBs of the node and to report their usage.
+        """
+        return []
+
     def initialize(self):
         pass
 
@@ -600,7 +1022,17 @@ class BaseFT(object):
     def hup(self, source=None):
         raise NotImplementedError('%s: hup - not implemented' % self.name)
 
+    def _trace_sampled(self, indicator):
+        if isinstance(indicator, unicode):
+            indicator = indicator.encode('utf-8')
+
+        return (zlib.crc32(indicator) & 0xffffffff) < \
+            self._trace_sample_threshold
+
     def trace(self, action, indicator, **kwargs):
+        if self.trace_level == 'off':
+            return
+
         if self.state not in [ft_states.STARTED, ft_states.CHECKPOINT]:
             LOG.debug(
                 "%s - trace called in wrong state %s",
@@ -609,17 +1041,31 @@ class BaseFT(object):
             )
             return
 
+        if self.trace_level == 'withdraw':
+            if not action.endswith('_WITHDRAW'):
+                return
+
+        elif self.trace_level == 'sampled':
+            if indicator is None or not self._trace_sampled(indicator):
+                self.statistics['trace.sampled_out'] += 1
+                return
+
         trace = {
             'indicator': indicator,
             'op': action,
         }
         trace.update(kwargs)
-        self.chassis.log(
+        sent = self.chassis.log(
             timestamp=utils.utc_millisec(),
             nodename=self.name,
             log_type='TRACE',
             value=trace
         )
+        if sent is False:
+            self.statistics['trace.dropped'] += 1
+            return
+
+        self.statistics['trace.tx'] += 1
 
     def start(self):
         LOG.debug("%s - start called", self.name)
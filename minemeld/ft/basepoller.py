@@ -19,13 +19,20 @@ miners retrieving indicators by periodically polling an external source.
 
 import logging
 import copy
+import struct
+import itertools
+import contextlib
 import gevent
 import gevent.event
+import gevent.lock
 import random
+import time
 
 from . import base
 from . import ft_states
 from . import table
+from . import expiry
+from . import indexgc
 from .utils import utc_millisec
 from .utils import RWLock
 from .utils import parse_age_out
@@ -34,6 +41,149 @@ LOG = logging.getLogger(__name__)
 
 _MAX_AGE_OUT = ((1 << 32)-1)*1000  # 2106-02-07 6:28:15
 
+# number of items of the feed processed in a single write batch
+_BATCH_ITEMS = 1000
+
+_GENERATIONS_METADATA = 'basepoller.generations'
+
+
+class _Generations(object):
+    """Tracks which indicators have been seen in the feed in each polling
+    run (generation) without rewriting the indicators.
+
+    Each indicator gets a slot number, stored in the *_slot* attribute when
+    the indicator is added to the table. For each run there is a bitmap
+    indexed by slot with the indicators seen during the run. Only the
+    bitmap of the last completed run (*prev*) and the bitmap of the
+    current run (*cur*) are kept, *prev* is stored in the table as custom
+    metadata at the end of each run, together with the bitmap of the
+    allocated slots.
+    """
+    def __init__(self):
+        self.generation = None
+        self.next_slot = 0
+
+        self.prev = bytearray()
+        self.cur = bytearray()
+        self.allocated = bytearray()
+        self.free_slots = []
+
+        self.prev_valid = False
+
+    def load(self, blob):
+        if blob is None:
+            return
+
+        self.generation, self.next_slot, nbytes = \
+            struct.unpack('>QQL', blob[:20])
+        if self.generation == 0:
+            # no completed runs
+            self.generation = None
+        self.prev = bytearray(blob[20:20+nbytes])
+        self.allocated = bytearray(blob[20+nbytes:20+2*nbytes])
+        self.cur = bytearray(nbytes)
+
+        self.free_slots = [
+            slot for slot in xrange(self.next_slot)
+            if not self._test(self.allocated, slot)
+        ]
+        self.free_slots.reverse()
+
+    def dump(self):
+        nbytes = len(self.allocated)
+        self._extend(self.prev, nbytes)
+
+        return (
+            struct.pack('>QQL', self.generation or 0, self.next_slot,
+                        nbytes) +
+            str(self.prev) +
+            str(self.allocated)
+        )
+
+    def _extend(self, bitmap, nbytes):
+        if len(bitmap) < nbytes:
+            bitmap.extend(bytearray(nbytes - len(bitmap)))
+
+    def _test(self, bitmap, slot):
+        idx = slot >> 3
+        if idx >= len(bitmap):
+            return False
+        return (bitmap[idx] & (1 << (slot & 7))) != 0
+
+    def _set(self, bitmap, slot):
+        self._extend(bitmap, (slot >> 3)+1)
+        bitmap[slot >> 3] |= (1 << (slot & 7))
+
+    def _clear(self, bitmap, slot):
+        if (slot >> 3) < len(bitmap):
+            bitmap[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+
+    def allocate(self):
+        if len(self.free_slots) != 0:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.next_slot
+            self.next_slot += 1
+
+        self._set(self.allocated, slot)
+
+        return slot
+
+    def free(self, slot):
+        if not self._test(self.allocated, slot):
+            return
+
+        self._clear(self.allocated, slot)
+        self._clear(self.prev, slot)
+        self._clear(self.cur, slot)
+        self.free_slots.append(slot)
+
+    def mark(self, slot):
+        self._set(self.cur, slot)
+
+    def mark_previous(self, slot):
+        self._set(self.prev, slot)
+
+    def reset_current(self):
+        """Clears the marks of the current run, called at the beginning
+        of each polling cycle so that a failed cycle does not leave
+        marks of a partial run.
+        """
+        self.cur = bytearray(len(self.cur))
+
+    def seen_in_run(self, slot):
+        return self._test(self.cur, slot)
+
+    def in_feed(self, slot):
+        if self._test(self.cur, slot):
+            return True
+
+        return self.prev_valid and self._test(self.prev, slot)
+
+    def removed(self):
+        """Generator of the slots seen in the previous run and not in
+        the current run.
+        """
+        cur = self.cur
+        lcur = len(cur)
+        for idx, b in enumerate(self.prev):
+            if b == 0:
+                continue
+
+            if idx < lcur:
+                b = b & ~cur[idx]
+
+            while b != 0:
+                bit = b & -b
+                yield (idx << 3) + bit.bit_length() - 1
+                b ^= bit
+
+    def rotate(self, generation):
+        self.generation = generation
+        self.prev = self.cur
+        self.cur = bytearray(len(self.prev))
+        self.prev_valid = True
+
 
 class IndicatorStatus(object):
     D_MASK = 1
@@ -51,7 +201,8 @@ class IndicatorStatus(object):
     NFXAXW = D_MASK | A_MASK | W_MASK
     XFXAXW = D_MASK | F_MASK | A_MASK | W_MASK
 
-    def __init__(self, indicator, attributes, table, now, in_feed_threshold):
+    def __init__(self, indicator, attributes, table, now, in_feed_threshold,
+                 generations):
         self.state = 0
 
         self.cv = table.get(indicator)
@@ -62,7 +213,14 @@ class IndicatorStatus(object):
         if self.cv['_age_out'] < now:
             self.state = self.state | IndicatorStatus.A_MASK
 
-        if self.cv['_last_run'] >= in_feed_threshold:
+        slot = self.cv.get('_slot', None)
+        if slot is None:
+            # indicator stored before generations, check _last_run
+            in_feed = self.cv.get('_last_run', 0) >= in_feed_threshold
+        else:
+            in_feed = generations.in_feed(slot)
+
+        if in_feed:
             self.state = self.state | IndicatorStatus.F_MASK
 
         if self.cv.get('_withdrawn', None) is not None:
@@ -174,6 +332,8 @@ class BasePollerFT(base.BaseFT):
         self.glet = None
         self.ageout_glet = None
 
+        self.generations = None
+
         self.active_requests = []
         self.rebuild_flag = False
         self.last_run = None
@@ -182,6 +342,7 @@ class BasePollerFT(base.BaseFT):
         self.poll_event = gevent.event.Event()
 
         self.state_lock = RWLock()
+        self._batch_lock = gevent.lock.Semaphore()
 
         super(BasePollerFT, self).__init__(name, chassis, config)
 
@@ -209,11 +370,58 @@ class BasePollerFT(base.BaseFT):
                 continue
             self.age_out[k] = parse_age_out(v)
 
+    def storage_dbs(self):
+        return [self.name]
+
     def _initialize_table(self, truncate=False):
         self.table = table.Table(self.name, truncate=truncate)
-        self.table.create_index('_age_out')
         self.table.create_index('_withdrawn')
-        self.table.create_index('_last_run')
+        self.table.create_index('_slot')
+
+        self.expiry = expiry.Expiry(self.table, self.age_out['interval'])
+        self.expiry.migrate_index('_age_out', self._legacy_age_out)
+
+        self.index_gc = indexgc.IndexGC(self.table)
+
+        self.generations = _Generations()
+        self.generations.load(
+            self.table.get_custom_metadata(_GENERATIONS_METADATA)
+        )
+
+        if '_last_run' in self.table.indexes:
+            self._migrate_last_run()
+
+    def _migrate_last_run(self):
+        """Converts the indicators stored before generations. Previous
+        versions stored in *_last_run* the time of the last run that
+        has seen the indicator, the indicators with the most recent
+        *_last_run* are marked as seen in the previous generation. The
+        legacy *_last_run* index is then dropped.
+        """
+        LOG.info('%s - migrating _last_run to generations', self.name)
+
+        legacy = [
+            (i, v) for i, v in self.table.query(include_value=True,
+                                                fill_cache=False)
+            if '_slot' not in v
+        ]
+
+        last_run = max([v.get('_last_run', 0) for _, v in legacy] or [0])
+
+        with self.table.write_batch():
+            for i, v in legacy:
+                seen = v.pop('_last_run', 0) == last_run
+                v['_slot'] = self.generations.allocate()
+                if seen:
+                    self.generations.mark_previous(v['_slot'])
+
+                self.table.put(i, v)
+
+        if self.generations.generation is None and last_run != 0:
+            self.generations.generation = last_run
+        self._store_generations()
+
+        self.table.drop_index('_last_run')
 
     def initialize(self):
         self._initialize_table()
@@ -246,19 +454,22 @@ class BasePollerFT(base.BaseFT):
 
                 LOG.debug('now: %s', now)
 
-                for i, v in self.table.query(index='_age_out',
-                                             to_key=now-1,
-                                             include_value=True):
-                    LOG.debug('%s - %s %s aged out', self.name, i, v)
+                with self._table_batch():
+                    for i in self.expiry.expired(now):
+                        v = self.table.get(i)
+                        if v is None:
+                            continue
+
+                        LOG.debug('%s - %s %s aged out', self.name, i, v)
 
-                    if v.get('_withdrawn', None) is not None:
-                        continue
+                        if v.get('_withdrawn', None) is not None:
+                            continue
 
-                    self.emit_withdraw(indicator=i)
-                    v['_withdrawn'] = now
-                    self.table.put(i, v)
+                        self.emit_withdraw(indicator=i)
+                        v['_withdrawn'] = now
+                        self.table.put(i, v)
 
-                    self.statistics['aged_out'] += 1
+                        self.statistics['aged_out'] += 1
 
                 self.last_ageout_run = now
 
@@ -272,10 +483,20 @@ class BasePollerFT(base.BaseFT):
                 self.state_lock.runlock()
 
             try:
-                gevent.sleep(self.age_out['interval'])
+                self.expiry.wait(now)
             except gevent.GreenletExit:
                 break
 
+    def _legacy_age_out(self, indicator, value):
+        if value.get('_withdrawn', None) is not None:
+            return None
+
+        return value['_age_out']
+
+    def _put_indicator(self, indicator, value):
+        self.table.put(indicator, value)
+        self.expiry.schedule(indicator, value['_age_out'])
+
     def _calc_age_out(self, indicator, attributes):
         t = attributes.get('type', None)
         if t is None or t not in self.age_out:
@@ -290,116 +511,213 @@ class BasePollerFT(base.BaseFT):
 
         return b + sel['offset']
 
-    def _sudden_death(self):
-        if self.last_run is None:
+    def _sudden_death(self, lastrun):
+        # the indicators of the previous run are unknown, or the
+        # previous run is too old
+        if not self.generations.prev_valid:
             return
 
         LOG.debug('checking sudden death')
 
-        for i, v in self.table.query(index='_last_run',
-                                     to_key=self.last_run,
-                                     include_value=True):
+        # indicators are looked up before updating them, queries
+        # would commit the pending writes
+        removed = []
+        for slot in self.generations.removed():
+            # the index could still contain stale entries for the slot,
+            # only the indicator currently holding the slot is valid
+            i, v = next(
+                ((i, v) for i, v in self.table.query(index='_slot',
+                                                     from_key=slot,
+                                                     to_key=slot,
+                                                     include_value=True)
+                 if v.get('_slot', None) == slot),
+                (None, None)
+            )
+            if i is None:
+                LOG.error('%s - no indicator found for slot %d',
+                          self.name, slot)
+                continue
+
+            if v.get('_withdrawn', None) is not None:
+                continue
+
+            removed.append((i, v))
+
+        for i, v in removed:
             LOG.debug('%s - %s %s sudden death', self.name, i, v)
 
-            v['_age_out'] = self.last_run-1
-            self.table.put(i, v)
+            v['_age_out'] = lastrun-1
+            self._put_indicator(i, v)
             self.statistics['removed'] += 1
 
     def _collect_garbage(self, t0):
-        for i in self.table.query(index='_withdrawn',
-                                  to_key=t0-1,
-                                  include_value=False):
+        for i, v in self.table.query(index='_withdrawn',
+                                     to_key=t0-1,
+                                     include_value=True):
+            slot = v.get('_slot', None)
+            if slot is not None:
+                # withdrawn but still in the feed
+                if self.generations.seen_in_run(slot):
+                    continue
+
+                self.generations.free(slot)
+
             self.table.delete(i)
             self.statistics['garbage_collected'] += 1
 
+    def _store_generations(self):
+        self.table.put_custom_metadata(
+            _GENERATIONS_METADATA,
+            self.generations.dump()
+        )
+
     def _compare_attributes(self, oa, na):
         for k in na:
             if oa.get(k, None) != na[k]:
                 return False
         return True
 
+    @contextlib.contextmanager
+    def _table_batch(self):
+        """Groups the table writes of the block in a write batch,
+        discarded if the block raises. The batches of the polling loop
+        and of the age out loop are serialized, a batch never contains
+        the writes of the other loop.
+        """
+        with self._batch_lock:
+            with self.table.write_batch():
+                yield
+
     def _polling_loop(self):
         LOG.info("Polling %s", self.name)
 
         now = utc_millisec()
 
-        iterator = self._build_iterator(now)
+        # after a restart the previous generation is valid only if
+        # it is recent enough
+        generation = self.generations.generation
+        self.generations.prev_valid = (
+            generation is not None and
+            (self.last_run is not None or
+             generation >= now - self.interval*1000)
+        )
 
-        for item in iterator:
-            try:
-                ipairs = self._process_item(item)
+        iterator = iter(self._build_iterator(now))
 
-            except:
-                LOG.exception('%s - Exception parsing %s', self.name, item)
-                continue
+        while True:
+            # items are fetched outside of the write batch, the fetch
+            # could wait on the network
+            items = list(itertools.islice(iterator, _BATCH_ITEMS))
+            if len(items) == 0:
+                break
 
-            for indicator, attributes in ipairs:
-                if indicator is None:
-                    LOG.debug('%s - indicator is None for item %s',
-                              self.name, item)
-                    continue
+            with self._table_batch():
+                for item in items:
+                    self._poll_item(now, item)
 
-                in_feed_threshold = self.last_run
-                if in_feed_threshold is None:
-                    in_feed_threshold = now - self.interval*1000
-
-                istatus = IndicatorStatus(
-                    indicator=indicator,
-                    attributes=attributes,
-                    table=self.table,
-                    now=now,
-                    in_feed_threshold=in_feed_threshold
-                )
-
-                if istatus.state in [IndicatorStatus.NX,
-                                     IndicatorStatus.NFNANW,
-                                     IndicatorStatus.NFXANW,
-                                     IndicatorStatus.NFXAXW,
-                                     IndicatorStatus.NFNAXW]:
-                    v = copy.copy(self.attributes)
-                    v['sources'] = [self.source_name]
-                    v['last_seen'] = now
-                    v['first_seen'] = now
-                    v['_last_run'] = now
-                    v.update(attributes)
-                    v['_age_out'] = self._calc_age_out(indicator, v)
+        self.current_meta = None
 
-                    self.statistics['added'] += 1
-                    self.table.put(indicator, v)
-                    self.emit_update(indicator, v)
+    def _poll_item(self, now, item):
+        # origin of the indicators of this item, see BaseFT
+        if self.track_latency:
+            self.current_meta = {'ts': time.time(), 'hops': 0}
+
+        try:
+            ipairs = self._process_item(item)
 
-                    LOG.debug('%s - added %s %s', self.name, indicator, v)
+        except:
+            LOG.exception('%s - Exception parsing %s', self.name, item)
+            return
 
-                elif istatus.state == IndicatorStatus.XFNANW:
-                    v = istatus.cv
+        for indicator, attributes in ipairs:
+            if indicator is None:
+                LOG.debug('%s - indicator is None for item %s',
+                          self.name, item)
+                continue
 
-                    eq = self._compare_attributes(v, attributes)
+            in_feed_threshold = self.last_run
+            if in_feed_threshold is None:
+                in_feed_threshold = now - self.interval*1000
+
+            istatus = IndicatorStatus(
+                indicator=indicator,
+                attributes=attributes,
+                table=self.table,
+                now=now,
+                in_feed_threshold=in_feed_threshold,
+                generations=self.generations
+            )
 
-                    v['_last_run'] = now
+            if istatus.state in [IndicatorStatus.NX,
+                                 IndicatorStatus.NFNANW,
+                                 IndicatorStatus.NFXANW,
+                                 IndicatorStatus.NFXAXW,
+                                 IndicatorStatus.NFNAXW]:
+                slot = None
+                if istatus.cv is not None:
+                    slot = istatus.cv.get('_slot', None)
+                if slot is None:
+                    slot = self.generations.allocate()
+
+                v = copy.copy(self.attributes)
+                v['sources'] = [self.source_name]
+                v['last_seen'] = now
+                v['first_seen'] = now
+                v['_slot'] = slot
+                v.update(attributes)
+                v['_age_out'] = self._calc_age_out(indicator, v)
+
+                self.statistics['added'] += 1
+                self._put_indicator(indicator, v)
+                self.generations.mark(slot)
+                self.emit_update(indicator, v)
+
+                LOG.debug('%s - added %s %s', self.name, indicator, v)
+
+            elif istatus.state == IndicatorStatus.XFNANW:
+                v = istatus.cv
+
+                eq = self._compare_attributes(v, attributes)
+                upgraded = self._upgrade_slot(v)
+
+                # the indicator is rewritten only if it has changed
+                # or if it has been stored before generations
+                if not eq or upgraded:
                     v.update(attributes)
                     v['_age_out'] = self._calc_age_out(indicator, v)
+                    self._put_indicator(indicator, v)
 
-                    self.table.put(indicator, v)
+                self.generations.mark(v['_slot'])
+
+                if not eq:
+                    self.emit_update(indicator, v)
 
-                    if not eq:
-                        self.emit_update(indicator, v)
+            elif istatus.state in [IndicatorStatus.XFXANW,
+                                   IndicatorStatus.XFXAXW,
+                                   IndicatorStatus.XFNAXW]:
+                v = istatus.cv
 
-                elif istatus.state == IndicatorStatus.XFXANW:
-                    v = istatus.cv
-                    v['_last_run'] = now
+                if self._upgrade_slot(v):
                     self.table.put(indicator, v)
 
-                elif istatus.state in [IndicatorStatus.XFXAXW,
-                                       IndicatorStatus.XFNAXW]:
-                    v = istatus.cv
-                    v['_last_run'] = now
-                    v['_withdrawn'] = now
-                    self.table.put(indicator, v)
+                self.generations.mark(v['_slot'])
 
-                else:
-                    LOG.error('%s - indicator state unhandled: %s',
-                              self.name, istatus.state)
-                    continue
+            else:
+                LOG.error('%s - indicator state unhandled: %s',
+                          self.name, istatus.state)
+                continue
+
+    def _upgrade_slot(self, value):
+        """Converts the value of an indicator stored before generations.
+        Returns True if the value has been modified.
+        """
+        if '_slot' in value:
+            return False
+
+        value.pop('_last_run', None)
+        value['_slot'] = self.generations.allocate()
+
+        return True
 
     def _run(self):
         while self.last_ageout_run is None:
@@ -414,7 +732,9 @@ class BasePollerFT(base.BaseFT):
             if self.rebuild_flag:
                 LOG.debug("rebuild flag set, resending current indicators")
                 # reinit flag is set, emit update for all the known indicators
-                for i, v in self.table.query(include_value=True):
+                for i, v in self.table.query(include_value=True,
+                                             snapshot=True,
+                                             fill_cache=False):
                     self.emit_update(i, v)
         finally:
             self.state_lock.unlock()
@@ -430,12 +750,21 @@ class BasePollerFT(base.BaseFT):
                 break
 
             try:
-                self._polling_loop()
+                try:
+                    self.generations.reset_current()
+                    self._polling_loop()
+
+                    with self._table_batch():
+                        if self.age_out['sudden_death']:
+                            self._sudden_death(lastrun)
+
+                        self._collect_garbage(lastrun)
 
-                if self.age_out['sudden_death']:
-                    self._sudden_death()
+                    self.generations.rotate(lastrun)
 
-                self._collect_garbage(lastrun)
+                finally:
+                    self.current_meta = None
+                    self._store_generations()
 
             except gevent.GreenletExit:
                 break
@@ -480,6 +809,7 @@ class BasePollerFT(base.BaseFT):
     def mgmtbus_status(self):
         result = super(BasePollerFT, self).mgmtbus_status()
         result['last_run'] = self.last_run
+        result['index_gc'] = self.index_gc.statistics
 
         return result
 
@@ -498,6 +828,7 @@ class BasePollerFT(base.BaseFT):
 
         self.glet = gevent.spawn_later(random.randint(0, 2), self._run)
         self.ageout_glet = gevent.spawn(self._age_out_run)
+        self.index_gc.start()
 
     def stop(self):
         super(BasePollerFT, self).stop()
@@ -510,5 +841,6 @@ class BasePollerFT(base.BaseFT):
 
         self.glet.kill()
         self.ageout_glet.kill()
+        self.index_gc.stop()
 
         LOG.info("%s - # indicators: %d", self.name, self.table.num_indicators)
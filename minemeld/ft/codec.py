@@ -0,0 +1,139 @@
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+This module implements the codecs used by minemeld.ft.table.Table to
+encode indicator values.
+
+Each codec has a name, stored in the table metadata, and a tag, the first
+byte of the encoded values. The tag is used to select the codec when
+decoding, values encoded with different codecs can be read from the same
+table during the migration from one codec to another.
+
+The codec is selected per table, the default is json. msgpack values are
+about 1/3 of the size of JSON values, decoding has about the same cost
+because building the dict of attributes takes most of the decoding time
+(see tests/table_codec_profile.py).
+
+Available codecs:
+
+- json: values are encoded as JSON objects, the tag is the opening brace
+- msgpack: values are encoded as msgpack arrays, the id of the shape of
+  the value (the tuple of attribute names) followed by the attribute
+  values. Shapes are interned per table and stored in the table custom
+  metadata, values with a new shape are encoded as msgpack maps when the
+  max number of shapes is reached
+"""
+
+import logging
+import weakref
+from itertools import izip
+
+import ujson
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+LOG = logging.getLogger(__name__)
+
+
+class JSONCodec(object):
+    NAME = 'json'
+    TAG = '{'
+
+    def __init__(self, table):
+        pass
+
+    def encode(self, value):
+        return ujson.dumps(value)
+
+    def decode(self, blob):
+        return ujson.loads(blob)
+
+
+class MsgpackCodec(object):
+    NAME = 'msgpack'
+    TAG = '\x01'
+    SHAPES_METADATA = 'codec.msgpack.shapes'
+    MAX_SHAPES = 1024
+
+    def __init__(self, table):
+        # tables are closed when garbage collected, avoid cycles
+        self.table = weakref.proxy(table)
+
+        self.shapes = []
+        self.shape_ids = {}
+        self._packer = msgpack.Packer(use_bin_type=False)
+
+        shapes = table.get_custom_metadata(self.SHAPES_METADATA)
+        if shapes is not None:
+            self.shapes = msgpack.unpackb(
+                shapes,
+                encoding='utf-8',
+                use_list=False
+            )
+            self.shape_ids = {s: id_ for id_, s in enumerate(self.shapes)}
+
+    def _add_shape(self, shape):
+        if len(self.shapes) >= self.MAX_SHAPES:
+            return None
+
+        shape = tuple(
+            k if type(k) == unicode else k.decode('utf8') for k in shape
+        )
+
+        id_ = len(self.shapes)
+        self.shapes.append(shape)
+        self.shape_ids[shape] = id_
+
+        self.table.put_custom_metadata(
+            self.SHAPES_METADATA,
+            self._packer.pack(self.shapes)
+        )
+
+        return id_
+
+    def encode(self, value):
+        shape = tuple(value)
+
+        id_ = self.shape_ids.get(shape, None)
+        if id_ is None:
+            id_ = self._add_shape(shape)
+            if id_ is None:
+                # too many shapes, the value is encoded as a map
+                return self.TAG+self._packer.pack((None, value))
+
+        return self.TAG+self._packer.pack((id_,)+tuple(value.itervalues()))
+
+    def decode(self, blob):
+        result = msgpack.unpackb(blob[1:], encoding='utf-8')
+
+        id_ = result[0]
+        if id_ is None:
+            return result[1]
+
+        return dict(izip(self.shapes[id_], result[1:]))
+
+
+CODECS = {
+    JSONCodec.NAME: JSONCodec
+}
+DEFAULT_CODEC = JSONCodec.NAME
+
+if msgpack is not None:
+    CODECS[MsgpackCodec.NAME] = MsgpackCodec
+else:
+    LOG.info('msgpack not available, msgpack codec disabled')
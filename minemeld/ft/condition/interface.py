@@ -24,10 +24,17 @@ from .BoolExprListener import BoolExprListener  # noqa
 
 LOG = logging.getLogger(__name__)
 
+SPECIAL_ATTRIBUTES = ['__indicator', '__method', '__origin']
+
 
 class _BECompiler(BoolExprListener):
     def exitExpression(self, ctx):
-        self.expression = jmespath.compile(ctx.getText())
+        # the outermost expression is the last one
+        self.text = ctx.getText()
+        self.expression = jmespath.compile(self.text)
+        self.identifier = None
+        if ctx.functionExpression() is None:
+            self.identifier = self.text
 
     def exitComparator(self, ctx):
         comparator = ctx.getText()
@@ -59,7 +66,13 @@ class _BECompiler(BoolExprListener):
 
 class Condition(object):
     def __init__(self, s):
-        self.expression, self.comparator, self.value = self._parse_boolexpr(s)
+        eb = self._parse_boolexpr(s)
+
+        self.text = eb.text
+        self.identifier = eb.identifier
+        self.expression = eb.expression
+        self.comparator = eb.comparator
+        self.value = eb.value
 
     def _parse_boolexpr(self, s):
         lexer = BoolExprLexer(
@@ -73,9 +86,9 @@ class Condition(object):
         walker = antlr4.ParseTreeWalker()
         walker.walk(eb, tree)
 
-        return eb.expression, eb.comparator, eb.value
+        return eb
 
-    def eval(self, i):
+    def _search(self, i):
         try:
             r = self.expression.search(i)
         except jmespath.exceptions.JMESPathError:
@@ -86,4 +99,59 @@ class Condition(object):
         if r == 'null':
             r = None
 
-        return self.comparator(r, self.value)
+        return r
+
+    def eval(self, i):
+        return self.comparator(self._search(i), self.value)
+
+    def compile(self):
+        """Compiles the condition into a function of (value, indicator,
+        method, origin) returning the result of the condition.
+
+        Conditions on a simple attribute are evaluated with a direct
+        lookup, without JMESPath. The special attributes are added to a
+        copy of the value only if the expression refers to them.
+        """
+        comparator = self.comparator
+        cvalue = self.value
+
+        if self.identifier == '__indicator':
+            return lambda v, i, m, o: comparator(i, cvalue)
+
+        if self.identifier == '__method':
+            return lambda v, i, m, o: comparator(m, cvalue)
+
+        if self.identifier == '__origin':
+            return lambda v, i, m, o: comparator(o, cvalue)
+
+        if self.identifier is not None:
+            key = self.identifier
+
+            def _eval_attribute(v, i, m, o):
+                if v is None:
+                    return comparator(None, cvalue)
+                return comparator(v.get(key, None), cvalue)
+
+            return _eval_attribute
+
+        search = self._search
+
+        if not any(sa in self.text for sa in SPECIAL_ATTRIBUTES):
+            def _eval_expression(v, i, m, o):
+                if v is None:
+                    v = {}
+                return comparator(search(v), cvalue)
+
+            return _eval_expression
+
+        def _eval_special_expression(v, i, m, o):
+            d = {} if v is None else dict(v)
+            if i is not None:
+                d['__indicator'] = i
+            if m is not None:
+                d['__method'] = m
+            if o is not None:
+                d['__origin'] = o
+            return comparator(search(d), cvalue)
+
+        return _eval_special_expression
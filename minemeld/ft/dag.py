@@ -27,6 +27,7 @@ import pan.xapi
 
 from . import base
 from . import table
+from . import expiry
 from .utils import utc_millisec
 
 LOG = logging.getLogger(__name__)
@@ -253,9 +254,14 @@ class DagPusher(base.BaseFT):
             ['confidence', 'direction']
         )
 
+    def storage_dbs(self):
+        return [self.name]
+
     def _initialize_table(self, truncate=False):
         self.table = table.Table(self.name, truncate=truncate)
-        self.table.create_index('_age_out')
+
+        self.expiry = expiry.Expiry(self.table, self.age_out_interval)
+        self.expiry.migrate_index('_age_out')
 
     def initialize(self):
         self._initialize_table()
@@ -309,6 +315,7 @@ class DagPusher(base.BaseFT):
 
         self.statistics['added'] += 1
         self.table.put(str(address), value)
+        self.expiry.schedule(str(address), age_out)
 
         value.pop('_age_out')
 
@@ -368,9 +375,11 @@ class DagPusher(base.BaseFT):
 
                 LOG.debug('now: %s', now)
 
-                for i, v in self.table.query(index='_age_out',
-                                             to_key=now-1,
-                                             include_value=True):
+                for i in self.expiry.expired(now):
+                    v = self.table.get(i)
+                    if v is None:
+                        continue
+
                     LOG.debug('%s - %s %s aged out', self.name, i, v)
 
                     for dp in self.device_pushers:
@@ -392,7 +401,7 @@ class DagPusher(base.BaseFT):
                 LOG.exception('Exception in _age_out_loop')
 
             try:
-                gevent.sleep(self.age_out_interval)
+                self.expiry.wait(now)
             except gevent.GreenletExit:
                 break
 
@@ -405,7 +414,8 @@ class DagPusher(base.BaseFT):
         )
         dp.link_exception(self._device_pusher_died)
 
-        for i, v in self.table.query(include_value=True):
+        for i, v in self.table.query(include_value=True, snapshot=True,
+                                     fill_cache=False):
             LOG.debug('%s - addding %s to init', self.name, i)
             dp.put('init', i, v)
         dp.put('EOI', None, None)
@@ -0,0 +1,280 @@
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+This module implements the LevelDB storage environment of a chassis
+process. minemeld.ft.table.Table and minemeld.ft.st.ST open their LevelDB
+instances through the environment.
+
+The environment is configured by the chassis with the *storage* section of
+the config:
+
+    :memory_budget: total number of bytes for LevelDB block caches and
+        write buffers in the chassis process. In dedicated mode the budget
+        is split evenly across the nodes of the chassis opening DBs, and
+        the share of a node is split evenly across the DBs declared by the
+        node (see minemeld.ft.base.BaseFT.storage_dbs). Each DB gets 3/4
+        of its share as block cache and 1/4 as write buffer, DBs not
+        declared by any node get the minimum sizes (1MB). If not set,
+        LevelDB defaults are used for each DB (8MB block cache, 4MB write
+        buffer).
+    :shared: if *true* all the tables of the chassis are stored in a single
+        LevelDB instance, with a key prefix per table. A single block cache
+        and write buffer, sized by memory_budget, are shared by all the
+        nodes. Default: *false*
+    :path: path of the shared DB. Default: *chassis-<sorted node names
+        hash>*
+    :max_open_files: max number of open files per LevelDB instance.
+        Default: LevelDB default (1000)
+
+LevelDB block caches can't be shared across instances with plyvel, the
+shared mode is the only way to have a single cache per chassis.
+In shared mode the data of a node is stored in the DB of the chassis
+running the node, if the assignment of the nodes to the chassis changes
+the nodes start with empty tables.
+"""
+
+import logging
+import shutil
+import weakref
+import hashlib
+
+import plyvel
+
+LOG = logging.getLogger(__name__)
+
+_MIN_LRU_CACHE_SIZE = 1 << 20
+_MIN_WRITE_BUFFER_SIZE = 1 << 20
+
+
+class _SharedDBTable(object):
+    """Table stored in the shared DB, wraps a plyvel prefixed DB.
+    Closing the table does not close the shared DB.
+    """
+    def __init__(self, db, prefix):
+        self.prefixed_db = db.prefixed_db(prefix)
+        self.prefix = prefix
+
+        self.get = self.prefixed_db.get
+        self.put = self.prefixed_db.put
+        self.delete = self.prefixed_db.delete
+        self.iterator = self.prefixed_db.iterator
+        self.write_batch = self.prefixed_db.write_batch
+        self.snapshot = self.prefixed_db.snapshot
+
+    def truncate(self):
+        batch = self.write_batch()
+        for k in self.iterator(include_value=False):
+            batch.delete(k)
+        batch.write()
+
+    def close(self):
+        pass
+
+
+class StorageEnvironment(object):
+    def __init__(self, memory_budget=None, nodes=None, shared=False,
+                 path=None, max_open_files=None):
+        self.memory_budget = memory_budget
+        self.shared = shared
+        self.path = path
+        self.max_open_files = max_open_files
+
+        self.nodes = nodes
+        if self.nodes is None:
+            self.nodes = {}
+        self.num_nodes = max(
+            len([n for n, dbs in self.nodes.iteritems() if len(dbs) != 0]),
+            1
+        )
+
+        self._db_nodes = {}
+        for node, dbs in self.nodes.iteritems():
+            for db in dbs:
+                self._db_nodes[db] = node
+
+        self._shared_db = None
+        self._owners = weakref.WeakValueDictionary()
+
+    def _db_options(self, name=None):
+        result = {}
+
+        if self.max_open_files is not None:
+            result['max_open_files'] = self.max_open_files
+
+        if self.memory_budget is None:
+            return result
+
+        share = self.memory_budget
+        if not self.shared:
+            node = self._db_nodes.get(name, None)
+            if node is None:
+                share = 0
+            else:
+                share = share // self.num_nodes // len(self.nodes[node])
+
+        result['lru_cache_size'] = max(_MIN_LRU_CACHE_SIZE, share*3//4)
+        result['write_buffer_size'] = max(_MIN_WRITE_BUFFER_SIZE, share//4)
+
+        return result
+
+    def _open_shared(self, name, truncate):
+        if self._shared_db is None:
+            LOG.info('Opening shared DB %s', self.path)
+            self._shared_db = plyvel.DB(
+                self.path,
+                create_if_missing=True,
+                bloom_filter_bits=10,
+                **self._db_options()
+            )
+
+        # table names don't contain NUL, prefixes are not prefix
+        # of each other
+        result = _SharedDBTable(self._shared_db, name+'\x00')
+        if truncate:
+            result.truncate()
+
+        return result
+
+    def open_db(self, name, owner, truncate=False, bloom_filter_bits=0,
+                **kwargs):
+        """Opens the LevelDB instance of a table.
+
+        Args:
+            name (str): name of the table
+            owner (object): object owning the DB, the DB is tracked by the
+                environment until the owner is garbage collected
+            truncate (bool): remove the content of the table
+            bloom_filter_bits (int): bloom filter bits per key
+            kwargs: additional plyvel.DB options, overridden by the
+                environment memory budget
+
+        Returns:
+            plyvel.DB or an object with the same interface
+        """
+        self._owners[name] = owner
+
+        if self.shared:
+            return self._open_shared(name, truncate)
+
+        if truncate:
+            try:
+                shutil.rmtree(name)
+            except:
+                pass
+
+        if self.memory_budget is not None and name not in self._db_nodes:
+            LOG.warning('DB %s not declared by any node, using minimum '
+                        'cache and write buffer sizes', name)
+
+        kwargs.update(self._db_options(name))
+
+        return plyvel.DB(
+            name,
+            create_if_missing=True,
+            bloom_filter_bits=bloom_filter_bits,
+            **kwargs
+        )
+
+    def usage(self, node):
+        """Returns the memory usage and size of the open DBs declared by
+        a node.
+
+        Args:
+            node (str): name of the node
+        """
+        result = {}
+
+        for name in self.nodes.get(node, []):
+            owner = self._owners.get(name, None)
+            if owner is None:
+                continue
+
+            db = getattr(owner, 'db', None)
+            if db is None:
+                continue
+
+            options = self._db_options(name)
+            dbusage = {
+                'lru_cache_size': options.get('lru_cache_size', None),
+                'write_buffer_size': options.get('write_buffer_size', None)
+            }
+
+            if self.shared:
+                prefix = db.prefix
+                dbusage['approximate_size'] = \
+                    self._shared_db.approximate_size(prefix, prefix+'\xFF')
+                dbusage['shared'] = True
+
+            elif not db.closed:
+                dbusage['memory_usage'] = int(
+                    db.get_property('leveldb.approximate-memory-usage')
+                )
+
+            result[name] = dbusage
+
+        return result
+
+    def close(self):
+        if self._shared_db is not None:
+            self._shared_db.close()
+            self._shared_db = None
+
+
+_ENVIRONMENT = StorageEnvironment()
+
+
+def configure(config, nodes):
+    """Configures the storage environment of the process.
+
+    Args:
+        config (dict): storage config
+        nodes (dict): names of the DBs opened by each node of the chassis.
+            A list of node names is accepted for nodes opening a single
+            DB named after the node.
+    """
+    global _ENVIRONMENT
+
+    _ENVIRONMENT.close()
+
+    if not isinstance(nodes, dict):
+        nodes = dict((n, [n]) for n in nodes)
+
+    path = config.get('path', None)
+    if path is None:
+        path = 'chassis-%s' % hashlib.sha1(
+            '\x00'.join(sorted(nodes))
+        ).hexdigest()[:16]
+
+    _ENVIRONMENT = StorageEnvironment(
+        memory_budget=config.get('memory_budget', None),
+        nodes=nodes,
+        shared=config.get('shared', False),
+        path=path,
+        max_open_files=config.get('max_open_files', None)
+    )
+
+
+def open_db(name, owner, truncate=False, bloom_filter_bits=0, **kwargs):
+    return _ENVIRONMENT.open_db(
+        name,
+        owner,
+        truncate=truncate,
+        bloom_filter_bits=bloom_filter_bits,
+        **kwargs
+    )
+
+
+def usage(node):
+    return _ENVIRONMENT.usage(node)
@@ -0,0 +1,127 @@
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+This module implements minemeld.ft.expiry.Expiry, a scheduler of
+indicator expiration deadlines on top of the time ordered expiry keys
+of minemeld.ft.table.Table.
+
+Nodes schedule a deadline every time they store an indicator that should
+be aged out, and the age out greenlet retrieves only the indicators with
+an expired deadline instead of scanning an index. The age out greenlet
+sleeps until the next deadline and is woken up if an earlier deadline
+is scheduled.
+"""
+
+import logging
+
+import gevent.event
+
+LOG = logging.getLogger(__name__)
+
+
+class Expiry(object):
+    """Expiration deadlines of the indicators of a table.
+
+    Args:
+        table (minemeld.ft.table.Table): table
+        max_interval (int): max number of seconds between successive
+            age out checks, if None age out is checked only at the
+            deadlines
+    """
+    def __init__(self, table, max_interval):
+        self.table = table
+        self.max_interval = max_interval
+
+        self._next_deadline = table.next_expiry()
+        self._wakeup = gevent.event.Event()
+
+    def schedule(self, key, deadline):
+        """Sets the deadline of an indicator, replacing the previous one.
+
+        Args:
+            key (str): indicator
+            deadline (int): deadline in millisec
+        """
+        self.table.set_expiry(key, deadline)
+
+        if self._next_deadline is None or deadline < self._next_deadline:
+            self._next_deadline = deadline
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """Removes the deadline of an indicator.
+
+        Args:
+            key (str): indicator
+        """
+        self.table.cancel_expiry(key)
+
+    def expired(self, now):
+        """Generator of the indicators with a deadline before now. The
+        deadline of each indicator is removed when the indicator is
+        returned.
+
+        Args:
+            now (int): current time in millisec
+        """
+        for key, _ in self.table.query_expired(now-1):
+            self.table.cancel_expiry(key)
+            yield key
+
+    def wait(self, now):
+        """Waits until the next deadline, max_interval seconds at most.
+        Returns earlier if a deadline before the next one is scheduled.
+
+        Args:
+            now (int): current time in millisec
+        """
+        self._wakeup.clear()
+        self._next_deadline = self.table.next_expiry()
+
+        timeout = self.max_interval
+        if self._next_deadline is not None:
+            delta = max(0, (self._next_deadline - now)/1000.0)
+            if timeout is None or delta < timeout:
+                timeout = delta
+
+        self._wakeup.wait(timeout=timeout)
+
+    def migrate_index(self, attribute, deadline=None):
+        """Schedules the deadlines of the indicators from an index
+        used for age out by previous versions, and drops the index.
+
+        Args:
+            attribute (str): indexed attribute
+            deadline (callable): called with indicator and value, returns
+                the deadline of the indicator or None. Default: the value
+                of the indexed attribute
+        """
+        if attribute not in self.table.indexes:
+            return
+
+        LOG.info('Migrating index %s to expiry', attribute)
+
+        with self.table.write_batch():
+            for i, v in self.table.query(index=attribute,
+                                         include_value=True):
+                if deadline is None:
+                    d = v.get(attribute, None)
+                else:
+                    d = deadline(i, v)
+
+                if d is not None:
+                    self.schedule(i, d)
+
+        self.table.drop_index(attribute)
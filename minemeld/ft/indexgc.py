@@ -0,0 +1,115 @@
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+This module implements minemeld.ft.indexgc.IndexGC, a background garbage
+collector for the secondary indexes of minemeld.ft.table.Table.
+
+Index entries are not removed when an indicator is updated or deleted,
+queries skip the stale entries. IndexGC periodically walks each index in
+slices of entries, removing the stale entries and yielding to the other
+greenlets between slices.
+"""
+
+import logging
+
+import gevent
+
+LOG = logging.getLogger(__name__)
+
+
+class IndexGC(object):
+    """Background garbage collector of the indexes of a table.
+
+    Args:
+        table (minemeld.ft.table.Table): table
+        interval (int): number of seconds between successive passes
+        slice_size (int): max number of index entries scanned between
+            successive yields
+    """
+    def __init__(self, table, interval=600, slice_size=1000):
+        self.table = table
+        self.interval = interval
+        self.slice_size = slice_size
+
+        self.statistics = {}
+
+        self._glet = None
+
+    def _collect(self, attribute):
+        entries = 0
+        removed = 0
+
+        cursor = None
+        while True:
+            cursor, s, r = self.table.collect_index_garbage(
+                attribute,
+                start=cursor,
+                max_entries=self.slice_size
+            )
+            entries += s
+            removed += r
+
+            if cursor is None:
+                break
+
+            gevent.sleep(0)
+
+        # index entries per indicator, before the collection
+        ratio = None
+        if self.table.num_indicators != 0:
+            ratio = float(entries)/self.table.num_indicators
+
+        self.statistics[attribute] = {
+            'entries': entries-removed,
+            'removed': removed,
+            'ratio': ratio
+        }
+
+        LOG.debug('index %s - %d entries, %d removed', attribute,
+                  entries, removed)
+
+    def run_once(self):
+        """Executes a full pass over all the indexes of the table."""
+        for attribute in self.table.indexes.keys():
+            if attribute not in self.table.indexes:
+                # index dropped during the pass
+                continue
+
+            self._collect(attribute)
+
+    def _run(self):
+        while True:
+            try:
+                gevent.sleep(self.interval)
+                self.run_once()
+
+            except gevent.GreenletExit:
+                break
+
+            except:
+                LOG.exception('Exception in index gc')
+
+    def start(self):
+        if self._glet is not None:
+            return
+
+        self._glet = gevent.spawn(self._run)
+
+    def stop(self):
+        if self._glet is None:
+            return
+
+        self._glet.kill()
+        self._glet = None
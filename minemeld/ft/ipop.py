@@ -13,12 +13,15 @@
 #  limitations under the License.
 
 import logging
+import itertools
+import operator
 import netaddr
 import uuid
 
 from . import base
 from . import table
 from . import st
+from . import memst
 from .utils import utc_millisec
 from .utils import RESERVED_ATTRIBUTES
 
@@ -26,20 +29,36 @@ LOG = logging.getLogger(__name__)
 
 WL_LEVEL = st.MAX_LEVEL
 
+ST_ENGINES = {
+    'leveldb': st.ST,
+    'memory': memst.MemoryST
+}
+
+OUTPUT_MODES = ['range', 'cidr']
+
 
 class MWUpdate(object):
-    def __init__(self, start, end, uuids):
+    def __init__(self, start, end, uuids, version=4):
         self.start = start
         self.end = end
         self.uuids = set(uuids)
 
-        s = netaddr.IPAddress(start)
-        e = netaddr.IPAddress(end)
+        self.version = version
+
+        s = netaddr.IPAddress(start, version=version)
+        e = netaddr.IPAddress(end, version=version)
         self._indicator = '%s-%s' % (s, e)
 
     def indicator(self):
         return self._indicator
 
+    def cidrs(self):
+        """Returns the minimal list of CIDR blocks covering the range."""
+        return [str(n) for n in netaddr.iprange_to_cidrs(
+            netaddr.IPAddress(self.start, version=self.version),
+            netaddr.IPAddress(self.end, version=self.version)
+        )]
+
     def __repr__(self):
         return 'MWUpdate('+self._indicator+', %r)' % self.uuids
 
@@ -51,7 +70,123 @@ class MWUpdate(object):
             self.end == other.end
 
 
+class _RangeSweep(object):
+    """State of the sweep over the endpoints of the segment tree: the live
+    intervals and the IP ranges found so far.
+    """
+    def __init__(self, version=4):
+        self.version = version
+        self.result = set()
+
+        self.live = {}
+        self.level_counts = {}
+
+        self._oep = None
+        self._oeplevel = -1
+
+    def add_live(self, uuid_, level):
+        if uuid_ in self.live:
+            return
+
+        self.live[uuid_] = level
+        self.level_counts[level] = self.level_counts.get(level, 0)+1
+
+    def _remove_live(self, uuid_):
+        level = self.live.pop(uuid_, None)
+        if level is None:
+            return
+
+        count = self.level_counts[level]-1
+        if count == 0:
+            self.level_counts.pop(level)
+        else:
+            self.level_counts[level] = count
+
+    def endpoint(self, epaddr, start_ids, end_ids):
+        """Processes the intervals starting and ending at epaddr.
+
+        Args:
+            epaddr (int): endpoint
+            start_ids (dict): uuid -> level of the intervals starting at
+                epaddr
+            end_ids (dict): uuid -> level of the intervals ending at epaddr
+        """
+        if len(start_ids) == 0 and len(end_ids) == 0:
+            return
+
+        # max level of the intervals covering epaddr
+        eplevel = max(
+            max(self.level_counts) if len(self.level_counts) != 0 else 0,
+            max(start_ids.itervalues()) if len(start_ids) != 0 else 0,
+            max(end_ids.itervalues()) if len(end_ids) != 0 else 0
+        )
+
+        if len(start_ids) != 0:
+            if self._oep is not None and self._oep != epaddr and \
+               len(self.live) != 0:
+                if self._oeplevel != WL_LEVEL:
+                    self.result.add(MWUpdate(self._oep, epaddr-1, self.live,
+                                             version=self.version))
+
+            self._oep = epaddr
+            self._oeplevel = eplevel
+            for uuid_, level in start_ids.iteritems():
+                self.add_live(uuid_, level)
+
+        if len(end_ids) != 0:
+            if self._oep is not None and len(self.live) != 0:
+                if eplevel < WL_LEVEL:
+                    self.result.add(MWUpdate(self._oep, epaddr, self.live,
+                                             version=self.version))
+
+            self._oep = epaddr+1
+            self._oeplevel = eplevel
+            for uuid_ in end_ids:
+                self._remove_live(uuid_)
+
+
+class _MergedValuesCache(table._LRUCache):
+    """Bounded LRU cache of the merged values of sets of uuids, keyed by
+    the frozenset of the uuids. Entries are invalidated when the value of
+    one of the uuids changes.
+    """
+    def __init__(self, size):
+        super(_MergedValuesCache, self).__init__(size)
+        self.by_uuid = {}
+
+    def put(self, key, value):
+        if self.size == 0:
+            return
+
+        super(_MergedValuesCache, self).put(key, value)
+        for uuid_ in key:
+            self.by_uuid.setdefault(uuid_, set()).add(key)
+
+    def _evicted(self, key):
+        for uuid_ in key:
+            keys = self.by_uuid.get(uuid_, None)
+            if keys is None:
+                continue
+
+            keys.discard(key)
+            if len(keys) == 0:
+                self.by_uuid.pop(uuid_)
+
+    def invalidate(self, uuid_):
+        for key in self.by_uuid.pop(uuid_, set()):
+            self.entries.pop(key, None)
+            self._evicted(key)
+
+    def clear(self):
+        super(_MergedValuesCache, self).clear()
+        self.by_uuid.clear()
+
+
 class AggregateIPv4FT(base.BaseFT):
+    _IP_VERSION = 4
+    _INDICATOR_TYPE = 'IPv4'
+    _EPSIZE = 32
+
     def __init__(self, name, chassis, config):
         self.active_requests = []
 
@@ -61,15 +196,72 @@ class AggregateIPv4FT(base.BaseFT):
         super(AggregateIPv4FT, self).configure()
 
         self.whitelist_prefixes = self.config.get('whitelist_prefixes', [])
+        self.table_codec = self.config.get('table_codec', None)
+        self.table_cache_size = self.config.get('table_cache_size', 0)
+        self.merged_values_cache_size = self.config.get(
+            'merged_values_cache_size',
+            10000
+        )
+        self.st_engine = self.config.get('st_engine', 'leveldb')
+        if self.st_engine not in ST_ENGINES:
+            raise ValueError('%s - unknown st_engine %s' %
+                             (self.name, self.st_engine))
+        self.output_mode = self.config.get('output_mode', 'range')
+        if self.output_mode not in OUTPUT_MODES:
+            raise ValueError('%s - unknown output_mode %s' %
+                             (self.name, self.output_mode))
+
+    def storage_dbs(self):
+        return [self.name, self.name+'_uuid', self.name+'_st']
 
     def _initialize_tables(self, truncate=False):
         self.table = table.Table(
             self.name,
             bloom_filter_bits=10,
+            truncate=truncate,
+            codec=self.table_codec,
+            cache_size=self.table_cache_size
+        )
+        # indicator values are also stored by uuid, to merge the values of
+        # a range with one lookup per uuid. The _id index of the previous
+        # versions is not needed anymore
+        self.table.drop_index('_id')
+        self.uuid_table = table.Table(
+            self.name+'_uuid',
+            bloom_filter_bits=10,
+            truncate=truncate,
+            codec=self.table_codec,
+            cache_size=self.table_cache_size
+        )
+        if self.uuid_table.num_indicators != self.table.num_indicators:
+            self._rebuild_uuid_table()
+
+        self.merged_values = _MergedValuesCache(
+            self.merged_values_cache_size
+        )
+
+        self.st = ST_ENGINES[self.st_engine](
+            self.name+'_st',
+            self._EPSIZE,
             truncate=truncate
         )
-        self.table.create_index('_id')
-        self.st = st.ST(self.name+'_st', 32, truncate=truncate)
+
+    def _rebuild_uuid_table(self):
+        LOG.info('%s - rebuilding uuid table', self.name)
+
+        self.uuid_table.close()
+        self.uuid_table = table.Table(
+            self.name+'_uuid',
+            bloom_filter_bits=10,
+            truncate=True,
+            codec=self.table_codec,
+            cache_size=self.table_cache_size
+        )
+
+        with self.uuid_table.write_batch():
+            for _, v in self.table.query(include_value=True,
+                                         fill_cache=False):
+                self.uuid_table.put(v['_id'], v)
 
     def initialize(self):
         self._initialize_tables()
@@ -84,22 +276,25 @@ class AggregateIPv4FT(base.BaseFT):
         return indicator+'\x00'+source
 
     def _calc_indicator_value(self, uuids):
-        mv = {'sources': []}
-        for uuid_ in uuids:
-            # uuid_ = str(uuid.UUID(bytes=uuid_))
-            k, v = next(
-                self.table.query('_id', from_key=uuid_, to_key=uuid_,
-                                 include_value=True),
-                (None, None)
-            )
-            if k is None:
-                LOG.error("Unable to find key associated with uuid: %s", uuid_)
-
-            for vk in v:
-                if vk in mv and vk in RESERVED_ATTRIBUTES:
-                    mv[vk] = RESERVED_ATTRIBUTES[vk](mv[vk], v[vk])
-                else:
-                    mv[vk] = v[vk]
+        key = frozenset(uuids)
+        mv = self.merged_values.get(key)
+
+        if mv is None:
+            mv = {'sources': []}
+            for uuid_ in uuids:
+                v = self.uuid_table.get(uuid_)
+                if v is None:
+                    LOG.error("Unable to find value associated with uuid: %s",
+                              uuid_)
+                    continue
+
+                for vk in v:
+                    if vk in mv and vk in RESERVED_ATTRIBUTES:
+                        mv[vk] = RESERVED_ATTRIBUTES[vk](mv[vk], v[vk])
+                    else:
+                        mv[vk] = v[vk]
+
+            self.merged_values.put(key, mv)
 
         return mv
 
@@ -133,93 +328,137 @@ class AggregateIPv4FT(base.BaseFT):
         v['_updated'] = now
 
         self.table.put(ik, v)
+        self.uuid_table.put(v['_id'], v)
+        self.merged_values.invalidate(v['_id'])
 
         return v, added
 
+    def _sweep_ipranges(self, start, end, excluded=None):
+        """Computes the IP ranges between start and end in a single ordered
+        sweep over the endpoints. If excluded is not None, the ranges
+        without the interval of the uuid excluded are computed in the
+        same sweep.
+
+        Returns:
+            a tuple: the set of MWUpdate and the set of MWUpdate without
+            excluded (None if excluded is None)
+        """
+        LOG.debug('_sweep_ipranges: %s %s %s', start, end, excluded)
+
+        sweep = _RangeSweep(version=self._IP_VERSION)
+        xsweep = None
+        if excluded is not None:
+            xsweep = _RangeSweep(version=self._IP_VERSION)
+
+        first = True
+        endpoints = self.st.query_endpoints(start=start, stop=end)
+        for epaddr, events in itertools.groupby(endpoints,
+                                                key=operator.itemgetter(0)):
+            start_ids = {}
+            end_ids = {}
+            for _, level, is_start, uuid_ in events:
+                if is_start:
+                    start_ids[uuid_] = level
+                else:
+                    end_ids[uuid_] = level
+
+            if first:
+                # intervals crossing the first endpoint
+                first = False
+                for cuuid, clevel, cstart, cend in self.st.cover(epaddr):
+                    if cstart == epaddr or cend == epaddr:
+                        continue
+
+                    sweep.add_live(cuuid, clevel)
+                    if xsweep is not None and cuuid != excluded:
+                        xsweep.add_live(cuuid, clevel)
+
+            sweep.endpoint(epaddr, start_ids, end_ids)
+
+            if xsweep is not None:
+                if excluded in start_ids or excluded in end_ids:
+                    start_ids = start_ids.copy()
+                    start_ids.pop(excluded, None)
+                    end_ids = end_ids.copy()
+                    end_ids.pop(excluded, None)
+
+                xsweep.endpoint(epaddr, start_ids, end_ids)
+
+        if xsweep is None:
+            return sweep.result, None
+
+        return sweep.result, xsweep.result
+
     def _calc_ipranges(self, start, end):
-        LOG.debug('_calc_ipranges: %s %s', start, end)
-
-        result = set()
-
-        # collect the endpoint between start and end
-        eps = set()
-        for epaddr, _, _, _ in self.st.query_endpoints(start=start, stop=end):
-            eps.add(epaddr)
-        eps = sorted(eps)
-        LOG.debug('eps: %s', eps)
-
-        if len(eps) == 0:
-            return result
-
-        oep = None
-        oeplevel = -1
-        live_ids = set()
-        for epaddr in eps:
-            LOG.debug('status: epaddr: %s oep: %s oeplevel: %d, '
-                      'live_ids: %s result: %s',
-                      epaddr, oep, oeplevel, live_ids, result)
-            end_ids = set()
-            start_ids = set()
-            eplevel = 0
-            for cuuid, clevel, cstart, cend in self.st.cover(epaddr):
-                if clevel > eplevel:
-                    eplevel = clevel
-                if cstart == epaddr:
-                    start_ids.add(cuuid)
-                if cend == epaddr:
-                    end_ids.add(cuuid)
-
-                if cend != epaddr and cstart != epaddr:
-                    if cuuid not in live_ids:
-                        LOG.debug("adding %r to live_ids", cuuid)
-                        assert epaddr == eps[0]
-                        live_ids.add(cuuid)
-
-            LOG.debug('middle: %s %s %s', epaddr, start_ids, end_ids)
-            assert len(end_ids) + len(start_ids) > 0
-
-            if len(start_ids) != 0:
-                if oep is not None and oep != epaddr and len(live_ids) != 0:
-                    if oeplevel != WL_LEVEL:
-                        LOG.debug('start: %s %s %s',
-                                  oep, epaddr-1, live_ids)
-                        result.add(MWUpdate(oep, epaddr-1,
-                                            live_ids))
-
-                oep = epaddr
-                oeplevel = eplevel
-                live_ids = live_ids | start_ids
-
-            if len(end_ids) != 0:
-                if oep is not None and len(live_ids) != 0:
-                    if eplevel < WL_LEVEL:
-                        LOG.debug('end: %s %s %s', oep, epaddr, live_ids)
-                        result.add(MWUpdate(oep, epaddr, live_ids))
-
-                oep = epaddr+1
-                oeplevel = eplevel
-                live_ids = live_ids - end_ids
+        return self._sweep_ipranges(start, end)[0]
+
+    def _ranges_indicators(self, ranges):
+        """Returns the indicators emitted for a set of MWUpdate, as a list
+        of (indicator, uuids). In cidr output mode each range is split in
+        its minimal CIDR cover.
+        """
+        if self.output_mode == 'cidr':
+            return [(n, u.uuids) for u in ranges for n in u.cidrs()]
+
+        return [(u.indicator(), u.uuids) for u in ranges]
+
+    def _emit_ranges_delta(self, rangesb, rangesa):
+        # the indicators of disjoint ranges are disjoint, updates and
+        # withdraws are tracked per indicator: in cidr mode only the blocks
+        # that changed are emitted
+        indicatorsb = dict(self._ranges_indicators(rangesb))
+        indicatorsa = dict(self._ranges_indicators(rangesa))
+
+        updated = []
+        for indicator, uuids in indicatorsa.iteritems():
+            ouuids = indicatorsb.get(indicator, None)
+            if ouuids is None:
+                LOG.debug("%s - IP range added: %s %r",
+                          self.name, indicator, uuids)
+                self.emit_update(
+                    indicator,
+                    self._calc_indicator_value(uuids)
+                )
 
-        return result
+            elif len(uuids ^ ouuids) != 0:
+                updated.append((indicator, uuids))
+
+        for indicator, uuids in updated:
+            LOG.debug("%s - IP range updated: %s %r",
+                      self.name, indicator, uuids)
+            self.emit_update(
+                indicator,
+                self._calc_indicator_value(uuids)
+            )
+
+        for indicator, uuids in indicatorsb.iteritems():
+            if indicator not in indicatorsa:
+                LOG.debug("%s - IP range removed: %s %r",
+                          self.name, indicator, uuids)
+                self.emit_withdraw(indicator)
 
     def _range_from_indicator(self, indicator):
         if '-' in indicator:
-            start, end = map(
-                lambda x: int(netaddr.IPAddress(x)),
-                indicator.split('-', 1)
-            )
+            start, end = map(netaddr.IPAddress, indicator.split('-', 1))
+            versions = set([start.version, end.version])
+            start, end = int(start), int(end)
         elif '/' in indicator:
             ipnet = netaddr.IPNetwork(indicator)
+            versions = set([ipnet.version])
             start = int(ipnet.ip)
             end = start+ipnet.size-1
         else:
-            start = int(netaddr.IPAddress(indicator))
+            ip = netaddr.IPAddress(indicator)
+            versions = set([ip.version])
+            start = int(ip)
             end = start
 
-        if (not (start >= 0 and start <= 0xFFFFFFFF)) or \
-           (not (end >= 0 and end <= 0xFFFFFFFF)):
-            LOG.error('%s - {%s} invalid IPv4 indicator',
-                      self.name, indicator)
+        max_endpoint = self.st.max_endpoint
+        if versions != set([self._IP_VERSION]) or \
+           (not (start >= 0 and start <= max_endpoint)) or \
+           (not (end >= 0 and end <= max_endpoint)):
+            LOG.error('%s - {%s} invalid %s indicator',
+                      self.name, indicator, self._INDICATOR_TYPE)
             return None, None
 
         return start, end
@@ -250,9 +489,9 @@ class AggregateIPv4FT(base.BaseFT):
     @base._counting('update.processed')
     def filtered_update(self, source=None, indicator=None, value=None):
         vtype = value.get('type', None)
-        if vtype != 'IPv4':
-            LOG.debug('%s - update received from %s with type != IPv4 (%s)',
-                      self.name, source, vtype)
+        if vtype != self._INDICATOR_TYPE:
+            LOG.debug('%s - update received from %s with type != %s (%s)',
+                      self.name, source, self._INDICATOR_TYPE, vtype)
             return
 
         v, newindicator = self._add_indicator(source, indicator, value)
@@ -272,46 +511,30 @@ class AggregateIPv4FT(base.BaseFT):
 
         rangestart, rangestop = self._endpoints_from_range(start, end)
 
-        rangesb = set(self._calc_ipranges(rangestart, rangestop))
-        LOG.debug('%s - ranges before update: %s', self.name, rangesb)
-
-        if not newindicator and level != WL_LEVEL:
-            for u in rangesb:
-                self.emit_update(
-                    u.indicator(),
-                    self._calc_indicator_value(u.uuids)
-                )
+        if not newindicator:
+            # same uuid, same interval and same level: the ranges don't
+            # change, the values of the ranges could
+            if level != WL_LEVEL:
+                ranges = self._calc_ipranges(rangestart, rangestop)
+                for indicator, uuids in self._ranges_indicators(ranges):
+                    self.emit_update(
+                        indicator,
+                        self._calc_indicator_value(uuids)
+                    )
             return
 
         uuidbytes = v['_id']
         self.st.put(uuidbytes, start, end, level=level)
 
-        rangesa = set(self._calc_ipranges(rangestart, rangestop))
+        rangesa, rangesb = self._sweep_ipranges(
+            rangestart,
+            rangestop,
+            excluded=uuidbytes
+        )
+        LOG.debug('%s - ranges before update: %s', self.name, rangesb)
         LOG.debug('%s - ranges after update: %s', self.name, rangesa)
 
-        added = rangesa-rangesb
-        LOG.debug("%s - IP ranges added: %s", self.name, added)
-
-        removed = rangesb-rangesa
-        LOG.debug("%s - IP ranges removed: %s", self.name, removed)
-
-        for u in added:
-            self.emit_update(
-                u.indicator(),
-                self._calc_indicator_value(u.uuids)
-            )
-
-        for u in rangesa - added:
-            for ou in rangesb:
-                if u == ou and len(u.uuids ^ ou.uuids) != 0:
-                    LOG.debug("IP range updated: %s", repr(u))
-                    self.emit_update(
-                        u.indicator(),
-                        self._calc_indicator_value(u.uuids)
-                    )
-
-        for u in removed:
-            self.emit_withdraw(u.indicator())
+        self._emit_ranges_delta(rangesb, rangesa)
 
     @base._counting('withdraw.processed')
     def filtered_withdraw(self, source=None, indicator=None, value=None):
@@ -325,6 +548,8 @@ class AggregateIPv4FT(base.BaseFT):
             return
 
         self.table.delete(ik)
+        self.uuid_table.delete(v['_id'])
+        self.merged_values.invalidate(v['_id'])
         self.statistics['removed'] += 1
 
         start, end = self._range_from_indicator(indicator)
@@ -339,59 +564,38 @@ class AggregateIPv4FT(base.BaseFT):
 
         rangestart, rangestop = self._endpoints_from_range(start, end)
 
-        rangesb = set(self._calc_ipranges(rangestart, rangestop))
-        LOG.debug("ranges before: %s", rangesb)
-
         uuidbytes = v['_id']
-        self.st.delete(uuidbytes, start, end, level=level)
-
-        rangesa = set(self._calc_ipranges(rangestart, rangestop))
+        rangesb, rangesa = self._sweep_ipranges(
+            rangestart,
+            rangestop,
+            excluded=uuidbytes
+        )
+        LOG.debug("ranges before: %s", rangesb)
         LOG.debug("ranges after: %s", rangesa)
 
-        added = rangesa-rangesb
-        LOG.debug("IP ranges added: %s", added)
-
-        removed = rangesb-rangesa
-        LOG.debug("IP ranges removed: %s", removed)
-
-        for u in added:
-            self.emit_update(
-                u.indicator(),
-                self._calc_indicator_value(u.uuids)
-            )
-
-        for u in rangesa - added:
-            for ou in rangesb:
-                if u == ou and len(u.uuids ^ ou.uuids) != 0:
-                    LOG.debug("IP range updated: %s", repr(u))
-                    self.emit_update(
-                        u.indicator(),
-                        self._calc_indicator_value(u.uuids)
-                    )
+        self.st.delete(uuidbytes, start, end, level=level)
 
-        for u in removed:
-            self.emit_withdraw(u.indicator())
+        self._emit_ranges_delta(rangesb, rangesa)
 
     def _send_indicators(self, source=None, from_key=None, to_key=None):
         if from_key is None:
             from_key = 0
         if to_key is None:
-            to_key = 0xFFFFFFFF
+            to_key = self.st.max_endpoint
 
         result = self._calc_ipranges(from_key, to_key)
-        for u in result:
-            self.do_rpc(
-                source,
-                "update",
-                indicator=u.indicator(),
-                value=self._calc_indicator_value(u.uuids)
-            )
+        self.stream_indicators(
+            source,
+            ((indicator, self._calc_indicator_value(uuids))
+             for indicator, uuids in self._ranges_indicators(result))
+        )
 
     def get(self, source=None, indicator=None):
         if not type(indicator) in [str, unicode]:
             raise ValueError("Invalid indicator type")
 
-        indicator = int(netaddr.IPAddress(indicator))
+        indicator = int(netaddr.IPAddress(indicator,
+                                          version=self._IP_VERSION))
 
         result = self._calc_ipranges(indicator, indicator)
         if len(result) == 0:
@@ -408,9 +612,11 @@ class AggregateIPv4FT(base.BaseFT):
         if index is not None:
             raise ValueError('Index not found')
         if from_key is not None:
-            from_key = int(netaddr.IPAddress(from_key))
+            from_key = int(netaddr.IPAddress(from_key,
+                                             version=self._IP_VERSION))
         if to_key is not None:
-            to_key = int(netaddr.IPAddress(to_key))
+            to_key = int(netaddr.IPAddress(to_key,
+                                           version=self._IP_VERSION))
 
         self._send_indicators(
             source=source,
@@ -420,14 +626,51 @@ class AggregateIPv4FT(base.BaseFT):
 
         return 'OK'
 
+    def mgmtbus_status(self):
+        result = super(AggregateIPv4FT, self).mgmtbus_status()
+
+        cache_statistics = self.table.cache_statistics()
+        if cache_statistics is not None:
+            result['table_cache'] = cache_statistics
+
+        result['merged_values_cache'] = self.merged_values.statistics()
+
+        return result
+
     def length(self, source=None):
         return self.table.num_indicators
 
+    def create_checkpoint(self, value):
+        self.table.commit_batch()
+        self.uuid_table.commit_batch()
+        super(AggregateIPv4FT, self).create_checkpoint(value)
+
+    def start(self):
+        super(AggregateIPv4FT, self).start()
+
+        # updates are collected in a long running write batch, committed
+        # when the batch is full and when the checkpoint is created.
+        # If the node dies before the checkpoint the table is rebuilt anyway
+        self.table.begin_batch()
+        self.uuid_table.begin_batch()
+
     def stop(self):
         super(AggregateIPv4FT, self).stop()
 
+        self.table.commit_batch()
+        self.uuid_table.commit_batch()
+
         for g in self.active_requests:
             g.kill()
         self.active_requests = []
 
         LOG.info("%s - # indicators: %d", self.name, self.table.num_indicators)
+
+
+class AggregateIPv6FT(AggregateIPv4FT):
+    """Aggregates IPv6 indicators in ranges, with the same semantics of
+    AggregateIPv4FT. Endpoints are 128-bit.
+    """
+    _IP_VERSION = 6
+    _INDICATOR_TYPE = 'IPv6'
+    _EPSIZE = 128
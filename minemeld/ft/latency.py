@@ -0,0 +1,106 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+This module implements the latency histograms of nodes and tables.
+
+Latencies are counted in buckets with power of 2 bounds in microseconds,
+bucket *n* counts the calls that took less than 2**n usecs and at least
+2**(n-1) usecs. The last bucket counts all the calls longer than that.
+"""
+
+import time
+import functools
+
+NUM_BUCKETS = 25
+
+
+def percentile(buckets, p):
+    """Returns the upper bound in usecs of the bucket containing the
+    *p* percentile, None if the buckets are empty.
+
+    Args:
+        buckets (list): list of bucket counters
+        p (int): percentile
+    """
+    total = sum(buckets)
+    if total == 0:
+        return None
+
+    threshold = total*p/100.0
+    count = 0
+    for b, c in enumerate(buckets):
+        count += c
+        if count >= threshold:
+            return 1 << b
+
+    return 1 << (len(buckets)-1)
+
+
+class Histogram(object):
+    __slots__ = ['buckets', 'count', 'total']
+
+    def __init__(self, num_buckets=NUM_BUCKETS):
+        self.buckets = [0]*num_buckets
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, elapsed):
+        b = int(elapsed*1000000).bit_length()
+        if b >= len(self.buckets):
+            b = len(self.buckets)-1
+
+        self.buckets[b] += 1
+        self.count += 1
+        self.total += elapsed
+
+    def statistics(self):
+        result = {
+            'count': self.count,
+            'buckets': list(self.buckets),
+            'p50': percentile(self.buckets, 50),
+            'p99': percentile(self.buckets, 99)
+        }
+        if self.count != 0:
+            result['avg'] = self.total*1000000/self.count
+
+        return result
+
+
+def timed(histname):
+    """Decorator for measuring the latency of calls to decorated
+    instance methods. Histograms are stored in the latency attribute
+    of the instance, a dict.
+
+    Args:
+        histname (str): name of the histogram
+    """
+    def _timed_out(f):
+        @functools.wraps(f)
+        def _timed(self, *args, **kwargs):
+            t0 = time.time()
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                h = self.latency.get(histname, None)
+                if h is None:
+                    h = self.latency[histname] = Histogram()
+                h.add(time.time()-t0)
+        return _timed
+    return _timed_out
+
+
+def statistics(latency):
+    """Returns the statistics of a dict of histograms."""
+    return dict((n, h.statistics()) for n, h in latency.iteritems())
@@ -0,0 +1,286 @@
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""
+In memory interval tree with the same interface of minemeld.ft.st.ST.
+
+Intervals are kept in memory, the LevelDB segment tree is used only as a
+durable copy and is read when the tree is opened.
+
+**INTERVALS**
+
+Each interval is stored once, in the node of an implicit binary tree over
+the endpoint space identified by the highest bit where start and end
+differ. All the intervals of a node contain the middle point of the node,
+the intervals covering a value below the middle point are the intervals
+of the node with start <= value, the intervals covering a value above the
+middle point are those with end >= value. Each node keeps the list of
+its intervals sorted by start and the list sorted by end, the cover of a
+value visits at most one node per bit and touches only the intervals in
+the result.
+
+**ENDPOINTS**
+
+Endpoints are kept in a sorted list of (endpoint, level, type, uuid) split
+in blocks, to keep the cost of inserts and deletes low with millions of
+endpoints.
+"""
+
+import logging
+from bisect import bisect_left, bisect_right, insort
+
+from . import st
+
+LOG = logging.getLogger(__name__)
+
+MAX_LEVEL = st.MAX_LEVEL
+
+
+class _SortedList(object):
+    """Sorted list of items, split in blocks of at most 2*LOAD items."""
+    LOAD = 512
+
+    def __init__(self):
+        self._lists = []
+        self._maxes = []
+
+    def add(self, item):
+        if len(self._maxes) == 0:
+            self._lists.append([item])
+            self._maxes.append(item)
+            return
+
+        pos = bisect_left(self._maxes, item)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._lists[pos].append(item)
+            self._maxes[pos] = item
+        else:
+            insort(self._lists[pos], item)
+
+        sublist = self._lists[pos]
+        if len(sublist) > 2*self.LOAD:
+            half = sublist[self.LOAD:]
+            del sublist[self.LOAD:]
+            self._maxes[pos] = sublist[-1]
+            self._lists.insert(pos+1, half)
+            self._maxes.insert(pos+1, half[-1])
+
+    def remove(self, item):
+        pos = bisect_left(self._maxes, item)
+        if pos == len(self._maxes):
+            raise ValueError('%r not in list' % (item,))
+
+        sublist = self._lists[pos]
+        idx = bisect_left(sublist, item)
+        if sublist[idx] != item:
+            raise ValueError('%r not in list' % (item,))
+
+        del sublist[idx]
+        if len(sublist) == 0:
+            del self._lists[pos]
+            del self._maxes[pos]
+        else:
+            self._maxes[pos] = sublist[-1]
+
+    def irange(self, minimum, maximum, reverse=False):
+        """Iterates over the items between minimum and maximum, both
+        included."""
+        if reverse:
+            pos = bisect_right(self._maxes, maximum)
+            if pos == len(self._maxes):
+                pos -= 1
+                if pos < 0:
+                    return
+                idx = len(self._lists[pos])
+            else:
+                idx = bisect_right(self._lists[pos], maximum)
+
+            while pos >= 0:
+                sublist = self._lists[pos]
+                for j in xrange(idx-1, -1, -1):
+                    item = sublist[j]
+                    if item < minimum:
+                        return
+                    yield item
+
+                pos -= 1
+                if pos >= 0:
+                    idx = len(self._lists[pos])
+
+            return
+
+        pos = bisect_left(self._maxes, minimum)
+        if pos == len(self._maxes):
+            return
+        idx = bisect_left(self._lists[pos], minimum)
+
+        while pos < len(self._lists):
+            sublist = self._lists[pos]
+            for j in xrange(idx, len(sublist)):
+                item = sublist[j]
+                if item > maximum:
+                    return
+                yield item
+
+            pos += 1
+            idx = 0
+
+
+class MemoryST(object):
+    """In memory interval tree, backed by a minemeld.ft.st.ST
+
+    Args:
+        name (str): name of the LevelDB segment tree
+        epsize (int): number of bits of the endpoints
+        truncate (bool): truncate the tree
+        kwargs: additional arguments for minemeld.ft.st.ST
+    """
+    def __init__(self, name, epsize, truncate=False, **kwargs):
+        self.st = st.ST(name, epsize, truncate=truncate, **kwargs)
+        self.epsize = epsize
+        self.max_endpoint = (1 << epsize)-1
+
+        self.num_endpoints = 0
+
+        # one dict per node height, node prefix -> (by start, by end)
+        self._nodes = [{} for _ in xrange(epsize+1)]
+        self._heights = []
+        self._endpoints = _SortedList()
+
+        self._load()
+
+    @property
+    def db(self):
+        return self.st.db
+
+    @property
+    def num_segments(self):
+        return self.st.num_segments
+
+    def _load(self):
+        starts = {}
+        num_intervals = 0
+
+        for endpoint, level, type_, uuid_ in self.st.query_endpoints():
+            if type_:
+                starts.setdefault((level, uuid_), []).append(endpoint)
+                continue
+
+            start = starts[(level, uuid_)].pop()
+            self._add(uuid_, start, endpoint, level)
+            num_intervals += 1
+
+        LOG.info('%d intervals loaded', num_intervals)
+
+    def _node(self, start, end):
+        height = (start ^ end).bit_length()
+        return height, start >> height
+
+    def _add(self, uuid_, start, end, level):
+        height, prefix = self._node(start, end)
+
+        nodes = self._nodes[height]
+        node = nodes.get(prefix, None)
+        if node is None:
+            node = ([], [])
+            nodes[prefix] = node
+            if len(nodes) == 1:
+                self._heights = sorted(
+                    [h for h, n in enumerate(self._nodes) if len(n) != 0],
+                    reverse=True
+                )
+
+        # intervals with the same start are sorted by level, descending
+        insort(node[0], (start, MAX_LEVEL-level, end, uuid_))
+        insort(node[1], (end, level, start, uuid_))
+
+        self._endpoints.add((start, level, st.TYPE_START, uuid_))
+        self._endpoints.add((end, level, st.TYPE_END, uuid_))
+        self.num_endpoints += 2
+
+    def _remove(self, uuid_, start, end, level):
+        height, prefix = self._node(start, end)
+
+        nodes = self._nodes[height]
+        node = nodes.get(prefix, None)
+        if node is None:
+            return
+
+        by_start, by_end = node
+        item = (start, MAX_LEVEL-level, end, uuid_)
+        idx = bisect_left(by_start, item)
+        if idx == len(by_start) or by_start[idx] != item:
+            return
+        del by_start[idx]
+        del by_end[bisect_left(by_end, (end, level, start, uuid_))]
+
+        if len(by_start) == 0:
+            del nodes[prefix]
+            if len(nodes) == 0:
+                self._heights.remove(height)
+
+        self._endpoints.remove((start, level, st.TYPE_START, uuid_))
+        self._endpoints.remove((end, level, st.TYPE_END, uuid_))
+        self.num_endpoints -= 2
+
+    def close(self):
+        self.st.close()
+
+    def put(self, uuid_, start, end, level=0):
+        self.st.put(uuid_, start, end, level=level)
+        self._add(uuid_, start, end, level)
+
+    def delete(self, uuid_, start, end, level=0):
+        self.st.delete(uuid_, start, end, level=level)
+        self._remove(uuid_, start, end, level)
+
+    def cover(self, value):
+        for height in self._heights:
+            node = self._nodes[height].get(value >> height, None)
+            if node is None:
+                continue
+
+            if height == 0:
+                for start, rlevel, end, uuid_ in node[0]:
+                    yield uuid_, MAX_LEVEL-rlevel, start, end
+                continue
+
+            mid = ((value >> height) << height) + (1 << (height-1)) - 1
+            if value <= mid:
+                for start, rlevel, end, uuid_ in node[0]:
+                    if start > value:
+                        break
+                    yield uuid_, MAX_LEVEL-rlevel, start, end
+
+            else:
+                by_end = node[1]
+                for j in xrange(len(by_end)-1, -1, -1):
+                    end, level, start, uuid_ = by_end[j]
+                    if end < value:
+                        break
+                    yield uuid_, level, start, end
+
+    def query_endpoints(self, start=None, stop=None, reverse=False,
+                        include_start=True, include_stop=True):
+        # as in ST, start and stop are endpoint values and are always
+        # included
+        if start is None:
+            start = 0
+        if stop is None:
+            stop = self.max_endpoint
+
+        for endpoint, level, type_, uuid_ in self._endpoints.irange(
+                (start,), (stop, MAX_LEVEL+1), reverse=reverse):
+            yield endpoint, level, type_ == st.TYPE_START, uuid_
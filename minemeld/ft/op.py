@@ -21,6 +21,50 @@ from .utils import RESERVED_ATTRIBUTES
 
 LOG = logging.getLogger(__name__)
 
+_SOURCE_BITS_METADATA = 'aggregate.source_bits'
+
+
+class _SourceBits(object):
+    """Assigns to each source a bit in the presence bitmaps of the summary
+    records. The list of sources, in bit order, is stored in the summary
+    table as custom metadata, bits are not reassigned when the inputs of
+    the node change.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.sources = []
+        self.bits = {}
+
+        blob = table.get_custom_metadata(_SOURCE_BITS_METADATA)
+        if blob:
+            self.sources = blob.split('\x00')
+            self.bits = {s: bit for bit, s in enumerate(self.sources)}
+
+    def bit(self, source):
+        bit = self.bits.get(source, None)
+        if bit is not None:
+            return bit
+
+        bit = len(self.sources)
+        self.sources.append(source)
+        self.bits[source] = bit
+
+        self.table.put_custom_metadata(
+            _SOURCE_BITS_METADATA,
+            '\x00'.join(self.sources)
+        )
+
+        return bit
+
+
+def _popcount(bitmap):
+    return bin(bitmap).count('1')
+
+
+def _public_attributes(value):
+    # attributes not stripped by emit_update
+    return {k: v for k, v in value.iteritems() if k[0] not in ['_', '$']}
+
 
 class AggregateFT(base.BaseFT):
     _ftclass = 'AggregateFT'
@@ -28,6 +72,7 @@ class AggregateFT(base.BaseFT):
     def __init__(self, name, chassis, config):
         self.active_requests = []
         self.table = None
+        self.summary_table = None
 
         super(AggregateFT, self).__init__(name, chassis, config)
 
@@ -35,9 +80,35 @@ class AggregateFT(base.BaseFT):
         super(AggregateFT, self).configure()
 
         self.whitelist_prefixes = self.config.get('whitelist_prefixes', [])
+        self.table_codec = self.config.get('table_codec', None)
+        self.table_cache_size = self.config.get('table_cache_size', 0)
+
+    def storage_dbs(self):
+        return [self.name, self.name+'_summary']
 
     def _initialize_table(self, truncate=False):
-        self.table = table.Table(self.name, truncate=truncate)
+        self.table = table.Table(
+            self.name,
+            truncate=truncate,
+            codec=self.table_codec,
+            cache_size=self.table_cache_size
+        )
+
+        # one summary record per indicator, with the bitmap of the sources
+        # of the indicator and the merged value of the non whitelist
+        # sources
+        self.summary_table = table.Table(
+            self.name+'_summary',
+            truncate=truncate,
+            codec=self.table_codec,
+            cache_size=self.table_cache_size
+        )
+        self.source_bits = _SourceBits(self.summary_table)
+        self._input_masks = None
+
+        if self.summary_table.num_indicators == 0 and \
+           self.table.num_indicators != 0:
+            self._rebuild_summary_table()
 
     def initialize(self):
         self._initialize_table()
@@ -57,15 +128,68 @@ class AggregateFT(base.BaseFT):
                 return True
         return False
 
-    def _emit_update_indicator(self, indicator):
-        LOG.debug("%s - emitting update: %s", self.name, indicator)
+    def _masks(self):
+        """Returns the bitmaps of the whitelist and of the other inputs, and
+        the list of (input, bit) of the inputs.
+        """
+        if self._input_masks is None:
+            wl_mask = 0
+            bl_mask = 0
+            inputs = []
+            for s in self.inputs:
+                bit = 1 << self.source_bits.bit(s)
+                if self._is_whitelist(s):
+                    wl_mask |= bit
+                else:
+                    bl_mask |= bit
+                inputs.append((s, bit))
+
+            self._input_masks = (wl_mask, bl_mask, inputs)
+
+        return self._input_masks
+
+    def _get_summary(self, indicator):
+        summary = self.summary_table.get(indicator)
+        if summary is None:
+            return 0, None
+
+        return int(summary['present'], 16), summary['value']
+
+    def _put_summary(self, indicator, present, mv):
+        if present == 0:
+            self.summary_table.delete(indicator)
+            return
+
+        self.summary_table.put(indicator, {
+            'present': '%x' % present,
+            'value': mv
+        })
+
+    def _merge_inputs(self, indicator, present, values=None):
+        """Merges the values of the non whitelist inputs in the present
+        bitmap. Values are read from the table, unless they are in values.
+        Returns None if there are no values to merge.
+
+        The merge is not incremental: the merge functions of the reserved
+        attributes (see RESERVED_ATTRIBUTES) can't be inverted, so when a
+        source updates or withdraws an indicator the values of all the
+        other present sources are read again. The cost is one table read
+        per present non whitelist source, bounded by the number of inputs
+        of the node, instead of one read per input of the node without the
+        presence bitmap.
+        """
+        _, bl_mask, inputs = self._masks()
 
         mv = {'sources': []}
-        for s in self.inputs:
-            if self._is_whitelist(s):
+        for s, bit in inputs:
+            if (bit & bl_mask & present) == 0:
                 continue
 
-            v = self.table.get(self._indicator_key(indicator, s))
+            v = None
+            if values is not None:
+                v = values.get(s, None)
+            if v is None:
+                v = self.table.get(self._indicator_key(indicator, s))
             if v is None:
                 continue
 
@@ -76,8 +200,46 @@ class AggregateFT(base.BaseFT):
                     mv[k] = v[k]
 
         if len(mv) > 1:
+            return mv
+
+        return None
+
+    def _emit_update_indicator(self, indicator, mv):
+        LOG.debug("%s - emitting update: %s", self.name, indicator)
+
+        if mv is not None:
             self.emit_update(indicator, mv)
 
+    def _rebuild_summary_table(self):
+        LOG.info('%s - rebuilding summary table', self.name)
+
+        def _put(indicator, values):
+            present = 0
+            for s in values:
+                present |= 1 << self.source_bits.bit(s)
+            self._put_summary(
+                indicator,
+                present,
+                self._merge_inputs(indicator, present, values=values)
+            )
+
+        with self.summary_table.write_batch():
+            cindicator = None
+            values = {}
+            for k, v in self.table.query(include_value=True,
+                                         fill_cache=False):
+                indicator, source = k.split('\x00', 1)
+                if indicator != cindicator:
+                    if cindicator is not None:
+                        _put(cindicator, values)
+                    cindicator = indicator
+                    values = {}
+
+                values[source] = v
+
+            if cindicator is not None:
+                _put(cindicator, values)
+
     def _merge_values(self, source, ov, nv):
         result = {'sources': []}
 
@@ -106,19 +268,19 @@ class AggregateFT(base.BaseFT):
 
     @base._counting('update.processed')
     def filtered_update(self, source=None, indicator=None, value=None):
-        ebl = False
-        ewl = False
-        for i in self.inputs:
-            v = self.table.exists(self._indicator_key(indicator, i))
-            if self._is_whitelist(i):
-                ewl |= v
-            else:
-                ebl |= v
+        wl_mask, bl_mask, _ = self._masks()
+
+        present, omv = self._get_summary(indicator)
+        ewl = (present & wl_mask) != 0
+        ebl = (present & bl_mask) != 0
 
         v = self._add_indicator(source, indicator, value)
+        present |= 1 << self.source_bits.bit(source)
 
         if self._is_whitelist(source):
             # update from whitelist
+            self._put_summary(indicator, present, omv)
+
             if ewl:
                 # already whitelisted, no updates
                 return
@@ -127,31 +289,44 @@ class AggregateFT(base.BaseFT):
                 self.emit_withdraw(indicator)
 
         else:
+            mv = self._merge_inputs(indicator, present, values={source: v})
+            self._put_summary(indicator, present, mv)
+
             if ewl:
                 return
-            self._emit_update_indicator(indicator)
+
+            if ebl and omv is not None and mv is not None and \
+               _public_attributes(omv) == _public_attributes(mv):
+                # merged value not changed
+                return
+
+            self._emit_update_indicator(indicator, mv)
 
     @base._counting('withdraw.processed')
     def filtered_withdraw(self, source=None, indicator=None, value=None):
-        ebl = 0
-        ewl = 0
-        for i in self.inputs:
-            v = int(self.table.exists(self._indicator_key(indicator, i)))
-            if self._is_whitelist(i):
-                ewl += v
-            else:
-                ebl += v
+        wl_mask, bl_mask, _ = self._masks()
 
-        e = self.table.exists(self._indicator_key(indicator, source))
+        present, mv = self._get_summary(indicator)
+        ewl = _popcount(present & wl_mask)
+        ebl = _popcount(present & bl_mask)
+
+        bit = 1 << self.source_bits.bit(source)
+        e = (present & bit) != 0
         self.table.delete(self._indicator_key(indicator, source))
 
+        if e:
+            present &= ~bit
+            if (bit & bl_mask) != 0:
+                mv = self._merge_inputs(indicator, present)
+            self._put_summary(indicator, present, mv)
+
         if self._is_whitelist(source):
             # withdraw from whitelist
             if e and ewl > 1:
                 return
 
             if ebl != 0:
-                self._emit_update_indicator(indicator)
+                self._emit_update_indicator(indicator, mv)
 
         else:
             if ewl > 0:
@@ -159,13 +334,19 @@ class AggregateFT(base.BaseFT):
 
             if e:
                 if ebl > 1:
-                    self._emit_update_indicator(indicator)
+                    self._emit_update_indicator(indicator, mv)
                 else:
                     self.emit_withdraw(indicator)
 
     def get(self, source=None, indicator=None):
+        _, _, inputs = self._masks()
+        present, _ = self._get_summary(indicator)
+
         mv = {}
-        for s in self.inputs:
+        for s, bit in inputs:
+            if (bit & present) == 0:
+                continue
+
             v = self.table.get(self._indicator_key(indicator, s))
             if v is None:
                 continue
@@ -181,17 +362,15 @@ class AggregateFT(base.BaseFT):
     def get_all(self, source=None):
         return self.get_range(source=source)
 
-    def get_range(self, source=None, index=None, from_key=None, to_key=None):
-        if index is not None:
-            raise ValueError("Index not found")
-
+    def _range_indicators(self, from_key=None, to_key=None):
         if to_key is not None:
             to_key = self._indicator_key(to_key, '\x7F')
 
         cindicator = None
         cvalue = {}
-        for k, v in self.table.query(index=index, from_key=from_key,
-                                     to_key=to_key, include_value=True):
+        for k, v in self.table.query(from_key=from_key,
+                                     to_key=to_key, include_value=True,
+                                     snapshot=True, fill_cache=False):
             indicator, _ = k.split('\x00')
             if indicator == cindicator:
                 for vk in v.keys():
@@ -202,23 +381,56 @@ class AggregateFT(base.BaseFT):
 
             else:
                 if cindicator is not None:
-                    self.do_rpc(source, "update", indicator=cindicator,
-                                value=cvalue)
+                    yield cindicator, cvalue
                 cindicator = indicator
                 cvalue = v
 
         if cindicator is not None:
-            self.do_rpc(source, "update", indicator=cindicator,
-                        value=cvalue)
+            yield cindicator, cvalue
+
+    def get_range(self, source=None, index=None, from_key=None, to_key=None):
+        if index is not None:
+            raise ValueError("Index not found")
+
+        self.stream_indicators(
+            source,
+            self._range_indicators(from_key=from_key, to_key=to_key)
+        )
 
         return 'OK'
 
+    def mgmtbus_status(self):
+        result = super(AggregateFT, self).mgmtbus_status()
+
+        cache_statistics = self.table.cache_statistics()
+        if cache_statistics is not None:
+            result['table_cache'] = cache_statistics
+
+        return result
+
     def length(self, source=None):
         return self.table.num_indicators
 
+    def create_checkpoint(self, value):
+        self.table.commit_batch()
+        self.summary_table.commit_batch()
+        super(AggregateFT, self).create_checkpoint(value)
+
+    def start(self):
+        super(AggregateFT, self).start()
+
+        # updates are collected in a long running write batch, committed
+        # when the batch is full and when the checkpoint is created.
+        # If the node dies before the checkpoint the table is rebuilt anyway
+        self.table.begin_batch()
+        self.summary_table.begin_batch()
+
     def stop(self):
         super(AggregateFT, self).stop()
 
+        self.table.commit_batch()
+        self.summary_table.commit_batch()
+
         for g in self.active_requests:
             g.kill()
         self.active_requests = []
@@ -24,6 +24,7 @@ import pan.xapi
 
 from . import base
 from . import table
+from . import expiry
 from .utils import utc_millisec
 
 LOG = logging.getLogger(__name__)
@@ -78,6 +79,7 @@ class PanOSLogsAPIFT(base.BaseFT):
         self.age_out_glets = []
 
         self.tables = []
+        self.expiries = []
         self.active_requests = []
         self.rebuild_flag = False
         self.last_log = None
@@ -99,17 +101,36 @@ class PanOSLogsAPIFT(base.BaseFT):
         self.sleeper_slot = int(self.config.get('sleeper_slot', '10'))
         self.maxretries = int(self.config.get('maxretries', '16'))
         self.fields = self.config.get('fields', [])
+        self.fields_age_out = [
+            _age_out_in_usecs(f.get('age_out', '30d')) for f in self.fields
+        ]
         self.age_out_interval = int(self.config.get('age_out_interval', '3600'))
 
+    def storage_dbs(self):
+        return [self.name+'_%d' % idx for idx in range(len(self.fields))]
+
     def _initialize_tables(self, truncate=False):
+        for t in self.tables:
+            t.close()
+
+        self.tables = []
+        self.expiries = []
+
         for idx, field in enumerate(self.fields):
             t = table.Table(
                 self.name+'_%d' % idx,
                 truncate=truncate
             )
-            t.create_index('last_seen')
             self.tables.append(t)
 
+            interval = self.fields_age_out[idx]
+            e = expiry.Expiry(t, self.age_out_interval)
+            e.migrate_index(
+                'last_seen',
+                lambda i, v: v['last_seen']+interval
+            )
+            self.expiries.append(e)
+
     def initialize(self):
         self._initialize_tables()
 
@@ -125,18 +146,17 @@ class PanOSLogsAPIFT(base.BaseFT):
         self.idle_waitobject.set(value)
 
     def _age_out_loop(self, fieldidx):
-        interval = self.fields[fieldidx].get('age_out', '30d')
-        interval = _age_out_in_usecs(interval)
         t = self.tables[fieldidx]
+        e = self.expiries[fieldidx]
 
         while True:
             try:
                 now = utc_millisec()
-                for i, v in t.query(index='last_seen', to_key=now-interval,
-                                    include_value=True):
-                    LOG.debug('%s - %s %s aged out', self.name, i, v)
-                    self.emit_withdraw(indicator=i)
-                    t.delete(i)
+                with t.write_batch():
+                    for i in e.expired(now):
+                        LOG.debug('%s - %s aged out', self.name, i)
+                        self.emit_withdraw(indicator=i)
+                        t.delete(i)
 
             except gevent.GreenletExit:
                 break
@@ -144,14 +164,15 @@ class PanOSLogsAPIFT(base.BaseFT):
             except:
                 LOG.exception('Exception in _age_out_loop')
 
-            gevent.sleep(self.age_out_interval)
+            e.wait(now)
 
     def _run(self):
         if self.rebuild_flag:
             LOG.debug("rebuild flag set, resending current indicators")
             # reinit flag is set, emit update for all the known indicators
             for t in self.tables:
-                for i, v in t.query('last_seen', include_value=True):
+                for i, v in t.query(include_value=True, snapshot=True,
+                                    fill_cache=False):
                     self.emit_update(i, v)
 
         sleeper = _sleeper(self.sleeper_slot, self.maxretries)
@@ -186,6 +207,10 @@ class PanOSLogsAPIFT(base.BaseFT):
                             v = copy.copy(field['attributes'])
                             v['last_seen'] = now
                             self.tables[idx].put(log[field['name']], v)
+                            self.expiries[idx].schedule(
+                                log[field['name']],
+                                now+self.fields_age_out[idx]
+                            )
                             self.emit_update(indicator=log[field['name']], value=v)
                         else:
                             LOG.debug('%s - field %s not found', self.name, field['name'])
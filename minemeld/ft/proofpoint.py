@@ -95,6 +95,9 @@ class ETIntelligence(basepoller.BasePollerFT):
 
         self._load_side_config()
 
+    def storage_dbs(self):
+        return super(ETIntelligence, self).storage_dbs()+[self.name+'_temp']
+
     def _load_side_config(self):
         try:
             with open(self.side_config_path, 'r') as f:
@@ -17,21 +17,21 @@ Simple segment tree implementation based on LevelDB.
 
 **KEYS**
 
-Numbers are 8-bit unsigned.
+Endpoints are 64-bit unsigned big endian, 128-bit (two 64-bit words) when
+epsize is larger than 64. Level and type are 8-bit unsigned.
 
 - Segment key: (1, <start>, <end>, <level>, <uuid>)
-- Endpoint key: (1, <endpoint>, <type>, <level>, <uuid>)
+- Endpoint key: (2, <endpoint>, <level>, <type>, <uuid>)
 
 **ENDPOINT**
 
 - Type: 0: START, 1: END
 """
 
-import plyvel
 import struct
 import logging
-import shutil
-import array
+
+from . import dbenv
 
 LOG = logging.getLogger(__name__)
 
@@ -39,25 +39,27 @@ MAX_LEVEL = 0xFE
 TYPE_START = 0x00
 TYPE_END = 0x1
 
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
 
 class ST(object):
     def __init__(self, name, epsize, truncate=False,
                  bloom_filter_bits=10, write_buffer_size=(4 << 20)):
-        if truncate:
-            try:
-                shutil.rmtree(name)
-            except:
-                pass
+        if epsize > 128:
+            raise ValueError('epsize > 128 not supported')
 
-        self.db = plyvel.DB(
+        self.db = dbenv.open_db(
             name,
-            create_if_missing=True,
+            self,
+            truncate=truncate,
             write_buffer_size=write_buffer_size,
             bloom_filter_bits=bloom_filter_bits
         )
         self.epsize = epsize
         self.max_endpoint = (1 << epsize)-1
 
+        self._epbytes = (8 if epsize <= 64 else 16)
+
         self.num_endpoints = 0
         self.num_segments = 0
 
@@ -75,54 +77,64 @@ class ST(object):
 
         return result
 
+    def _pack_endpoint(self, endpoint):
+        if self._epbytes == 8:
+            return struct.pack(">Q", endpoint)
+
+        return struct.pack(">QQ", endpoint >> 64, endpoint & _MASK64)
+
+    def _unpack_endpoint(self, s):
+        if self._epbytes == 8:
+            return struct.unpack(">Q", s)[0]
+
+        hi, lo = struct.unpack(">QQ", s)
+        return (hi << 64) | lo
+
     def _segment_key(self, start, end, uuid_=None, level=None):
-        res = array.array('B', [
-            1,
-            (start >> 56) & 0xFF, (start >> 48) & 0xFF,
-            (start >> 40) & 0xFF, (start >> 32) & 0xFF,
-            (start >> 24) & 0xFF, (start >> 16) & 0xFF,
-            (start >> 8) & 0xFF, start & 0xFF,
-            (end >> 56) & 0xFF, (end >> 48) & 0xFF,
-            (end >> 40) & 0xFF, (end >> 32) & 0xFF,
-            (end >> 24) & 0xFF, (end >> 16) & 0xFF,
-            (end >> 8) & 0xFF, end & 0xFF,
-        ])
+        res = '\x01'+self._pack_endpoint(start)+self._pack_endpoint(end)
 
         if level is not None:
-            res.append(level)
+            res += chr(level)
             if uuid_ is not None:
-                for c in uuid_:
-                    res.append(ord(c))
+                res += str(uuid_)
 
-        return res.tostring()
+        return res
 
     def _split_segment_key(self, key):
-        _, start, end, level = struct.unpack(">BQQB", key[:18])
-        return start, end, level, key[18:]
+        epbytes = self._epbytes
+        start = self._unpack_endpoint(key[1:1+epbytes])
+        end = self._unpack_endpoint(key[1+epbytes:1+2*epbytes])
+        level = ord(key[1+2*epbytes])
+        return start, end, level, key[2+2*epbytes:]
+
+    def _segment_value(self, start, end):
+        return self._pack_endpoint(start)+self._pack_endpoint(end)
+
+    def _split_segment_value(self, value):
+        epbytes = self._epbytes
+        return (
+            self._unpack_endpoint(value[:epbytes]),
+            self._unpack_endpoint(value[epbytes:])
+        )
 
     def _endpoint_key(self, endpoint, level=None, type_=None, uuid_=None):
-        res = array.array('B', [
-            2,
-            (endpoint >> 56) & 0xFF, (endpoint >> 48) & 0xFF,
-            (endpoint >> 40) & 0xFF, (endpoint >> 32) & 0xFF,
-            (endpoint >> 24) & 0xFF, (endpoint >> 16) & 0xFF,
-            (endpoint >> 8) & 0xFF, endpoint & 0xFF
-        ])
+        res = '\x02'+self._pack_endpoint(endpoint)
 
         if level is not None:
-            res.append(level)
+            res += chr(level)
             if type_ is not None:
-                res.append(type_)
+                res += chr(type_)
                 if uuid_ is not None:
-                    for c in uuid_:
-                        res.append(ord(c))
+                    res += str(uuid_)
 
-        return res.tostring()
+        return res
 
     def _split_endpoint_key(self, k):
-        _, endpoint, level, type_ = struct.unpack(">BQBB", k[:11])
-        type_ = (True if type_ == TYPE_START else False)
-        return endpoint, level, type_, k[11:]
+        epbytes = self._epbytes
+        endpoint = self._unpack_endpoint(k[1:1+epbytes])
+        level = ord(k[1+epbytes])
+        type_ = (True if ord(k[2+epbytes]) == TYPE_START else False)
+        return endpoint, level, type_, k[3+epbytes:]
 
     def close(self):
         self.db.close()
@@ -130,7 +142,7 @@ class ST(object):
     def put(self, uuid_, start, end, level=0):
         si = self._split_interval(start, end, 0, self.max_endpoint)
 
-        value = struct.pack(">QQ", start, end)
+        value = self._segment_value(start, end)
 
         batch = self.db.write_batch()
 
@@ -204,7 +216,7 @@ class ST(object):
                                          reverse=True, include_start=False,
                                          include_stop=False):
                 _, _, level, uuid_ = self._split_segment_key(k)
-                start, end = struct.unpack(">QQ", v)
+                start, end = self._split_segment_value(v)
 
                 yield uuid_, level, start, end
 
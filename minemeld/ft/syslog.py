@@ -31,6 +31,8 @@ import re
 
 from . import base
 from . import table
+from . import expiry
+from . import indexgc
 from . import ft_states
 from . import condition
 from .utils import utc_millisec
@@ -62,6 +64,9 @@ class SyslogMatcher(base.BaseFT):
         self.logstash_host = self.config.get('logstash_host', None)
         self.logstash_port = self.config.get('logstash_port', 5514)
 
+    def storage_dbs(self):
+        return [self.name+'_ipv4', self.name+'_indicators', self.name]
+
     def _initialize_tables(self, truncate=False):
         self.table_ipv4 = table.Table(self.name+'_ipv4', truncate=truncate)
         self.table_ipv4.create_index('_start')
@@ -74,6 +79,13 @@ class SyslogMatcher(base.BaseFT):
         self.table = table.Table(self.name, truncate=truncate)
         self.table.create_index('syslog_original_indicator')
 
+        # queries skip the stale index entries, they are removed by
+        # the index gcs
+        self.index_gcs = {
+            self.name+'_ipv4': indexgc.IndexGC(self.table_ipv4),
+            self.name: indexgc.IndexGC(self.table)
+        }
+
     def initialize(self):
         self._initialize_tables()
 
@@ -134,12 +146,13 @@ class SyslogMatcher(base.BaseFT):
                 self.table_indicators.delete(itype+indicator)
 
         if v is not None:
-            for i in self.table.query(index='syslog_original_indicator',
-                                      from_key=itype+indicator,
-                                      to_key=itype+indicator,
-                                      include_value=False):
-                self.emit_withdraw(i)
-                self.table.delete(i)
+            with self.table.write_batch():
+                for i in self.table.query(index='syslog_original_indicator',
+                                          from_key=itype+indicator,
+                                          to_key=itype+indicator,
+                                          include_value=False):
+                    self.emit_withdraw(i)
+                    self.table.delete(i)
 
     def _handle_ip(self, ip, source=True, message=None):
         try:
@@ -335,6 +348,9 @@ class SyslogMatcher(base.BaseFT):
 
     def mgmtbus_status(self):
         result = super(SyslogMatcher, self).mgmtbus_status()
+        result['index_gc'] = dict(
+            (name, gc.statistics) for name, gc in self.index_gcs.iteritems()
+        )
 
         return result
 
@@ -350,9 +366,15 @@ class SyslogMatcher(base.BaseFT):
             self._amqp_consumer
         )
 
+        for gc in self.index_gcs.values():
+            gc.start()
+
     def stop(self):
         super(SyslogMatcher, self).stop()
 
+        for gc in self.index_gcs.values():
+            gc.stop()
+
         if self.amqp_glet is None:
             return
 
@@ -409,11 +431,18 @@ class SyslogMiner(base.BaseFT):
 
         self._load_side_config()
 
+    def storage_dbs(self):
+        return [self.name]
+
     def _initialize_table(self, truncate=False):
         self.table = table.Table(self.name, truncate=truncate)
-        self.table.create_index('_age_out')
         self.table.create_index('_withdrawn')
 
+        self.expiry = expiry.Expiry(self.table, self.age_out['interval'])
+        self.expiry.migrate_index('_age_out')
+
+        self.index_gc = indexgc.IndexGC(self.table)
+
     def initialize(self):
         self._initialize_table()
 
@@ -515,20 +544,23 @@ class SyslogMiner(base.BaseFT):
 
                 LOG.debug('now: %s', now)
 
-                for i, v in self.table.query(index='_age_out',
-                                             to_key=now-1,
-                                             include_value=True):
-                    LOG.debug('%s - %s %s aged out', self.name, i, v)
+                with self.table.write_batch():
+                    for ikey in self.expiry.expired(now):
+                        v = self.table.get(ikey)
+                        if v is None:
+                            continue
 
-                    if v.get('_withdrawn', None) is not None:
-                        continue
+                        LOG.debug('%s - %s %s aged out', self.name, ikey, v)
 
-                    i, _ = i.split('\0', 1)
+                        if v.get('_withdrawn', None) is not None:
+                            continue
 
-                    self.emit_withdraw(indicator=i)
-                    self.table.delete(i)
+                        i, _ = ikey.split('\0', 1)
+
+                        self.emit_withdraw(indicator=i)
+                        self.table.delete(ikey)
 
-                    self.statistics['aged_out'] += 1
+                        self.statistics['aged_out'] += 1
 
                 self.last_ageout_run = now
 
@@ -542,7 +574,7 @@ class SyslogMiner(base.BaseFT):
                 self.state_lock.runlock()
 
             try:
-                gevent.sleep(self.age_out['interval'])
+                self.expiry.wait(now)
             except gevent.GreenletExit:
                 break
 
@@ -608,46 +640,49 @@ class SyslogMiner(base.BaseFT):
 
         now = utc_millisec()
 
-        for f in self.rules:
-            for indicator, value, device in self._apply_rule(f, message):
-                if indicator is None:
-                    continue
+        with self.table.write_batch():
+            for f in self.rules:
+                for indicator, value, device in self._apply_rule(f, message):
+                    if indicator is None:
+                        continue
 
-                self.statistics[f['metric']] += 1
+                    self.statistics[f['metric']] += 1
 
-                type_ = value.get('type', None)
-                if type_ is None:
-                    LOG.error('%s - no type for indicator %s, ignored',
-                              self.name, indicator)
-                    continue
+                    type_ = value.get('type', None)
+                    if type_ is None:
+                        LOG.error('%s - no type for indicator %s, ignored',
+                                  self.name, indicator)
+                        continue
 
-                ikey = indicator+'\0'+type_
-                cv = self.table.get(ikey)
+                    ikey = indicator+'\0'+type_
+                    cv = self.table.get(ikey)
 
-                if cv is None:
-                    cv = copy.copy(self.attributes)
-                    cv['sources'] = [self.source_name]
-                    cv['last_seen'] = now
-                    cv['first_seen'] = now
-                    cv[devices_attribute] = [device]
-                    cv.update(value)
-                    cv['_age_out'] = self._calc_age_out(indicator, cv)
+                    if cv is None:
+                        cv = copy.copy(self.attributes)
+                        cv['sources'] = [self.source_name]
+                        cv['last_seen'] = now
+                        cv['first_seen'] = now
+                        cv[devices_attribute] = [device]
+                        cv.update(value)
+                        cv['_age_out'] = self._calc_age_out(indicator, cv)
 
-                    self.statistics['added'] += 1
-                    self.table.put(ikey, cv)
-                    self.emit_update(indicator, cv)
+                        self.statistics['added'] += 1
+                        self.table.put(ikey, cv)
+                        self.expiry.schedule(ikey, cv['_age_out'])
+                        self.emit_update(indicator, cv)
 
-                    LOG.debug('%s - added %s %s', self.name, indicator, cv)
+                        LOG.debug('%s - added %s %s', self.name, indicator, cv)
 
-                else:
-                    cv['last_seen'] = now
-                    cv.update(value)
-                    cv['_age_out'] = self._calc_age_out(indicator, cv)
-                    if device not in cv[devices_attribute]:
-                        cv[devices_attribute].append(device)
+                    else:
+                        cv['last_seen'] = now
+                        cv.update(value)
+                        cv['_age_out'] = self._calc_age_out(indicator, cv)
+                        if device not in cv[devices_attribute]:
+                            cv[devices_attribute].append(device)
 
-                    self.table.put(ikey, cv)
-                    self.emit_update(indicator, cv)
+                        self.table.put(ikey, cv)
+                        self.expiry.schedule(ikey, cv['_age_out'])
+                        self.emit_update(indicator, cv)
 
     def _amqp_callback(self, msg):
         try:
@@ -676,7 +711,9 @@ class SyslogMiner(base.BaseFT):
             if self.rebuild_flag:
                 LOG.debug("rebuild flag set, resending current indicators")
                 # reinit flag is set, emit update for all the known indicators
-                for i, v in self.table.query(include_value=True):
+                for i, v in self.table.query(include_value=True,
+                                             snapshot=True,
+                                             fill_cache=False):
                     type_, i = i.split('\0', 1)
                     self.emit_update(i, v)
         finally:
@@ -720,6 +757,12 @@ class SyslogMiner(base.BaseFT):
 
             gevent.sleep(30)
 
+    def mgmtbus_status(self):
+        result = super(SyslogMiner, self).mgmtbus_status()
+        result['index_gc'] = self.index_gc.statistics
+
+        return result
+
     def length(self, source=None):
         return self.table.num_indicators
 
@@ -734,6 +777,7 @@ class SyslogMiner(base.BaseFT):
             self._amqp_consumer
         )
         self.ageout_glet = gevent.spawn(self._age_out_run)
+        self.index_gc.start()
 
     def stop(self):
         super(SyslogMiner, self).stop()
@@ -746,6 +790,7 @@ class SyslogMiner(base.BaseFT):
 
         self.amqp_glet.kill()
         self.ageout_glet.kill()
+        self.index_gc.stop()
 
         LOG.info("%s - # indicators: %d", self.name, self.table.num_indicators)
 
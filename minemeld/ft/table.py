@@ -24,8 +24,12 @@ Numbers are 8-bit unsigned.
 - Index Last Global Id: (0,1, <indexnum>)
 - Last Update Key: (0,2)
 - Number of Indicators: (0,3)
+- Custom Metadata: (0,4,<name>)
+- Codec: (0,5)
 - Indicator Version: (1,0,<indicator>)
 - Indicator: (1,1,<indicator>)
+- Expiry: (3,0,<indicator>)
+- Expiry Deadline: (3,1,<deadline>,<indicator>)
 
 **INDICATORS**
 
@@ -35,8 +39,9 @@ The version number is used to track indicator existance and versioning.
 When an indicator value is updated, its version number is incremented.
 The version number is a 64-bit LSB unsigned int.
 
-The value of an indicator is a 64-bit unsigned int LSB followed by a dump of
-a dictionary of attributes in JSON format.
+The value of an indicator is a 64-bit unsigned int LSB followed by the
+dictionary of attributes encoded with the table codec (see minemeld.ft.codec).
+The name of the codec is stored at (0,5).
 
 To iterate over all the indicators versions iterate from key (1,0) to key
 (1,1) excluded.
@@ -63,26 +68,86 @@ Each entry in the index is stored with a key
 
 When iterating over an index, the value of an index entry is loaded and if
 the version does not match with current indicator version the index entry is
-deleted. This permits a sort of lazy garbage collection.
+skipped. Queries are read-only, stale entries are removed incrementally by
+Table.collect_index_garbage (see minemeld.ft.indexgc).
 
 To retrieve all the indicators with a specific attribute value just iterate
 over the keys (2,<index id>,0xF0,<encoded value>) and
 (2,<index id>,0xF0,<encoded value>,0xFF..FF)
+
+**SCHEMA VERSIONS**
+
+- 0: values encoded in JSON format, no codec key
+- 1: values encoded with the codec stored at (0,5)
+
+Tables with schema version 0 are migrated when opened. When the codec
+requested for a table differs from the stored one, the values are
+re-encoded with the new codec in write batches. Versions are not modified,
+index entries are still valid after the migration. If the migration is
+interrupted it is resumed the next time the table is opened, values encoded
+with different codecs are distinguished by the first byte.
+
+**READ CACHE**
+
+Tables can have an in-memory LRU cache of decoded values, enabled by the
+cache_size parameter. The cache is write-through: put and delete update the
+cached entry. The cache also keeps the existence bit of the indicators, so
+an exists followed by a get reads the DB at most once. get returns a shallow
+copy of the cached value, attributes should not be modified in place without
+a put. Queries don't use the cache, to avoid evicting the working set during
+full scans.
+
+**EXPIRY**
+
+Indicators can have an expiration deadline, a 64-bit unsigned int (usually
+a timestamp in milliseconds). The deadline of an indicator is stored at
+(3,0,<indicator>) and an entry with an empty value is stored at
+(3,1,<deadline>,<indicator>). Entries are ordered by deadline, expired
+indicators are retrieved iterating from (3,1) to (3,1,<now>).
+Differently from indexes, expiry entries are removed as soon as the deadline
+changes or the indicator is deleted, no garbage is left in the DB.
+
+**WRITE BATCHES**
+
+By default each put and delete is written to the DB with its own write batch,
+together with the updated metadata (Last Update Key, Number of Indicators and
+Last Global Id of the indexes). When many indicators are written in a row
+the writes can be grouped in a single batch::
+
+    with table.write_batch():
+        for i, v in indicators:
+            table.put(i, v)
+
+Inside the batch get and exists return the pending values (read-your-writes),
+metadata is written once when the batch is committed. The batch is committed
+when the outermost write_batch block exits or when the number of pending
+operations reaches max_size. Calls to query commit the pending operations
+before iterating over the DB. If the block raises an exception the pending
+operations are discarded, operations already committed are not reverted.
 """
 
-import plyvel
 import struct
-import ujson
 import time
 import logging
-import shutil
+import collections
+
+from .codec import CODECS, DEFAULT_CODEC
+from . import dbenv
+from . import latency
 
 
+SCHEMAVERSION = 1
 SCHEMAVERSION_KEY = struct.pack("B", 0)
 START_INDEX_KEY = struct.pack("BBB", 0, 1, 0)
 END_INDEX_KEY = struct.pack("BBB", 0, 1, 0xFF)
 LAST_UPDATE_KEY = struct.pack("BB", 0, 2)
 NUM_INDICATORS_KEY = struct.pack("BB", 0, 3)
+CUSTOM_METADATA_KEY = struct.pack("BB", 0, 4)
+CODEC_KEY = struct.pack("BB", 0, 5)
+EXPIRY_KEY = struct.pack("BB", 3, 0)
+EXPIRY_DEADLINE_KEY = struct.pack("BB", 3, 1)
+
+DEFAULT_BATCH_MAX_SIZE = 10000
 
 LOG = logging.getLogger(__name__)
 
@@ -91,20 +156,136 @@ class InvalidTableException(Exception):
     pass
 
 
-class Table(object):
-    def __init__(self, name, truncate=False, bloom_filter_bits=0):
-        if truncate:
-            try:
-                shutil.rmtree(name)
-            except:
-                pass
+# cache entries of indicators known to exist or not to exist,
+# but with no cached value
+_CACHE_EXISTS = object()
+_CACHE_NOT_EXISTS = object()
+
+
+class _LRUCache(object):
+    """Bounded LRU cache of decoded indicator values. Subclasses keeping
+    track of the cached keys are notified of evictions by _evicted.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, exists_only=False):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries[key] = entry
+
+        # the value is not cached
+        if entry is _CACHE_EXISTS and not exists_only:
+            self.misses += 1
+            return entry
+
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+
+        if len(self.entries) > self.size:
+            okey, _ = self.entries.popitem(last=False)
+            self.evictions += 1
+            self._evicted(okey)
+
+    def _evicted(self, key):
+        pass
+
+    def clear(self):
+        self.entries.clear()
+
+    def statistics(self):
+        return {
+            'size': self.size,
+            'length': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class _PendingWriteBatch(object):
+    """Wraps a plyvel write batch and keeps track of the pending writes,
+    so that they can be read back before the batch is written to the DB.
+    """
+    def __init__(self, db):
+        self.batch = db.write_batch()
+        self.pending = {}
+        self.indexes = {}
+        self.num_ops = 0
+
+    def put(self, key, value):
+        self.batch.put(key, value)
+        self.pending[key] = value
+
+    def delete(self, key):
+        self.batch.delete(key)
+        self.pending[key] = None
+
+    def write(self):
+        self.batch.write()
+
+
+class _TableWriteBatch(object):
+    """Context manager returned by Table.write_batch."""
+    def __init__(self, table, max_size):
+        self.table = table
+        self.max_size = max_size
 
-        self.db = plyvel.DB(
+    def __enter__(self):
+        self.table.begin_batch(max_size=self.max_size)
+        return self.table
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.table.abort_batch()
+        else:
+            self.table.commit_batch()
+        return False
+
+
+class Table(object):
+    def __init__(self, name, truncate=False, bloom_filter_bits=0,
+                 codec=None, cache_size=0):
+        self.db = dbenv.open_db(
             name,
-            create_if_missing=True,
+            self,
+            truncate=truncate,
             bloom_filter_bits=bloom_filter_bits
         )
+
+        self._batch = None
+        self._batch_depth = 0
+        self._batch_max_size = DEFAULT_BATCH_MAX_SIZE
+
+        self._cache = None
+        if cache_size > 0:
+            self._cache = _LRUCache(cache_size)
+
+        # latency histograms of the table operations
+        self.latency = {}
+
+        if codec is None:
+            codec = DEFAULT_CODEC
+        if codec not in CODECS:
+            raise InvalidTableException("Codec %s not supported" % codec)
+
+        self.name = name
+        self.codec = codec
+
         self._read_metadata()
+        self._init_codecs()
 
     def _init_db(self):
         self.last_update = 0
@@ -112,7 +293,8 @@ class Table(object):
         self.num_indicators = 0
 
         batch = self.db.write_batch()
-        batch.put(SCHEMAVERSION_KEY, struct.pack("B", 0))
+        batch.put(SCHEMAVERSION_KEY, struct.pack("B", SCHEMAVERSION))
+        batch.put(CODEC_KEY, self.codec)
         batch.put(LAST_UPDATE_KEY, struct.pack(">Q", self.last_update))
         batch.put(NUM_INDICATORS_KEY, struct.pack(">Q", self.num_indicators))
         batch.write()
@@ -122,7 +304,7 @@ class Table(object):
         if sv is None:
             return self._init_db()
         sv = struct.unpack("B", sv)[0]
-        if sv != 0:
+        if sv > SCHEMAVERSION:
             raise InvalidTableException("Schema version not supported")
 
         self.indexes = {}
@@ -155,36 +337,238 @@ class Table(object):
             raise InvalidTableException("NUM_INDICATORS_KEY not found")
         self.num_indicators = struct.unpack(">Q", t)[0]
 
-    def _get(self, key):
+    def _init_codecs(self):
+        # all the available codecs are used for decoding, values
+        # could be encoded with a different codec during migrations
+        self._decoders = {}
+        for c in CODECS.values():
+            self._decoders[c.TAG] = c(self)
+        self._encoder = self._decoders[CODECS[self.codec].TAG]
+
+        sv = struct.unpack("B", self._get(SCHEMAVERSION_KEY))[0]
+        if sv == SCHEMAVERSION and self._get(CODEC_KEY) == self.codec:
+            return
+
+        self._migrate_values()
+
+    def _migrate_values(self):
+        LOG.info('%s - migrating values to codec %s', self.name, self.codec)
+
+        tag = self._encoder.TAG
+
+        with self.write_batch():
+            ri = self.db.iterator(
+                start=struct.pack("BB", 1, 1),
+                stop=struct.pack("BB", 1, 2)
+            )
+            for ikey, value in ri:
+                if value[8] == tag:
+                    continue
+
+                self._batch.put(
+                    ikey,
+                    value[:8]+self._encoder.encode(self._decode(value[8:]))
+                )
+                self._check_batch_size()
+
+            self._batch.put(
+                SCHEMAVERSION_KEY,
+                struct.pack("B", SCHEMAVERSION)
+            )
+            self._batch.put(CODEC_KEY, self.codec)
+            self._check_batch_size()
+
+    def _decode(self, value):
+        decoder = self._decoders.get(value[0], None)
+        if decoder is None:
+            raise InvalidTableException(
+                "Codec with tag %r not supported" % value[0]
+            )
+
+        return decoder.decode(value)
+
+    def _get(self, key, snapshot=None, fill_cache=True):
+        if snapshot is not None:
+            return snapshot.get(key, fill_cache=fill_cache)
+
+        if self._batch is not None and key in self._batch.pending:
+            return self._batch.pending[key]
+
         try:
-            result = self.db.get(key)
+            result = self.db.get(key, fill_cache=fill_cache)
         except KeyError:
             return None
 
         return result
 
     def close(self):
+        self._write_batch()
+        self._batch = None
+        self._batch_depth = 0
+
+        if self._cache is not None:
+            self._cache.clear()
+
         self.db.close()
 
+    def write_batch(self, max_size=DEFAULT_BATCH_MAX_SIZE):
+        """Returns a context manager grouping the puts and deletes
+        executed inside the block in a single write batch.
+
+        Args:
+            max_size (int): number of pending operations after which the
+                batch is committed to the DB. Default: 10000
+        """
+        return _TableWriteBatch(self, max_size)
+
+    def begin_batch(self, max_size=DEFAULT_BATCH_MAX_SIZE):
+        """Starts a write batch. Batches can be nested, pending operations
+        are committed when the outermost batch is committed.
+
+        Args:
+            max_size (int): number of pending operations after which the
+                batch is committed to the DB. Default: 10000
+        """
+        self._batch_depth += 1
+        if self._batch is not None:
+            return
+
+        self._batch = _PendingWriteBatch(self.db)
+        self._batch_max_size = max_size
+
+    def commit_batch(self):
+        """Commits the current write batch. If the batch is nested inside
+        another batch the pending operations are kept until the outermost
+        batch is committed.
+        """
+        if self._batch_depth == 0:
+            return
+
+        self._batch_depth -= 1
+        if self._batch_depth != 0:
+            return
+
+        self._write_batch()
+        self._batch = None
+
+    def abort_batch(self):
+        """Discards the pending operations of the current write batch,
+        including the operations of the outer batches if the batch is
+        nested. Operations already committed to the DB are not reverted.
+        """
+        if self._batch_depth == 0:
+            return
+
+        self._batch_depth -= 1
+
+        batch = self._batch
+        self._batch = None
+        if batch is not None and batch.num_ops != 0:
+            # in memory counters and cached values could reflect the
+            # discarded operations
+            self.num_indicators = struct.unpack(
+                ">Q", self._get(NUM_INDICATORS_KEY)
+            )[0]
+            if self._cache is not None:
+                self._cache.clear()
+
+        if self._batch_depth != 0:
+            self._batch = _PendingWriteBatch(self.db)
+
+    def _write_batch(self):
+        batch = self._batch
+        if batch is None or batch.num_ops == 0:
+            return
+
+        self._put_metadata(batch, batch.indexes.values())
+        batch.write()
+
+        self._batch = _PendingWriteBatch(self.db)
+
+    def _check_batch_size(self):
+        self._batch.num_ops += 1
+        if self._batch.num_ops >= self._batch_max_size:
+            self._write_batch()
+
+    def _put_metadata(self, batch, indexes, num_indicators=True,
+                      last_update=True):
+        if last_update:
+            batch.put(LAST_UPDATE_KEY, struct.pack(">Q", self.last_update))
+
+        if num_indicators:
+            batch.put(
+                NUM_INDICATORS_KEY,
+                struct.pack(">Q", self.num_indicators)
+            )
+
+        for index in indexes:
+            batch.put(
+                self._last_global_id_key(index['id']),
+                struct.pack(">Q", index['last_global_id'])
+            )
+
+    @latency.timed('exists')
     def exists(self, key):
         if type(key) == unicode:
             key = key.encode('utf8')
 
+        if self._cache is not None:
+            entry = self._cache.get(key, exists_only=True)
+            if entry is not None:
+                return entry is not _CACHE_NOT_EXISTS
+
         ikeyv = self._indicator_key_version(key)
-        return (self._get(ikeyv) is not None)
+        result = (self._get(ikeyv) is not None)
+
+        if self._cache is not None:
+            self._cache.put(
+                key,
+                _CACHE_EXISTS if result else _CACHE_NOT_EXISTS
+            )
 
+        return result
+
+    @latency.timed('get')
     def get(self, key):
         if type(key) == unicode:
             key = key.encode('utf8')
 
+        if self._cache is None:
+            return self._get_value(key)
+
+        entry = self._cache.get(key)
+        if entry is _CACHE_NOT_EXISTS:
+            return None
+        if entry is not None and entry is not _CACHE_EXISTS:
+            return dict(entry)
+
+        value = self._get_value(key)
+        if value is None:
+            self._cache.put(key, _CACHE_NOT_EXISTS)
+            return None
+
+        self._cache.put(key, value)
+        return dict(value)
+
+    def _get_value(self, key, snapshot=None, fill_cache=True):
         ikey = self._indicator_key(key)
-        value = self._get(ikey)
+        value = self._get(ikey, snapshot=snapshot, fill_cache=fill_cache)
         if value is None:
             return None
 
         # skip version
-        return ujson.loads(value[8:])
+        return self._decode(value[8:])
+
+    def cache_statistics(self):
+        """Returns size, length, hits, misses and evictions of the
+        read cache, None if the cache is disabled.
+        """
+        if self._cache is None:
+            return None
 
+        return self._cache.statistics()
+
+    @latency.timed('delete')
     def delete(self, key):
         if type(key) == unicode:
             key = key.encode('utf8')
@@ -195,13 +579,163 @@ class Table(object):
         if self._get(ikeyv) is None:
             return
 
-        batch = self.db.write_batch()
+        self.num_indicators -= 1
+
+        batch = self._batch
+        if batch is None:
+            batch = self.db.write_batch()
+
         batch.delete(ikey)
         batch.delete(ikeyv)
-        self.num_indicators -= 1
-        batch.put(NUM_INDICATORS_KEY, struct.pack(">Q", self.num_indicators))
+        self._delete_expiry(batch, key)
+
+        if self._cache is not None:
+            self._cache.put(key, _CACHE_NOT_EXISTS)
+
+        if self._batch is not None:
+            self._check_batch_size()
+            return
+
+        self._put_metadata(batch, [], last_update=False)
         batch.write()
 
+    def _expiry_key(self, key):
+        return EXPIRY_KEY+key
+
+    def _expiry_deadline_key(self, deadline, key=''):
+        return EXPIRY_DEADLINE_KEY+struct.pack(">Q", deadline)+key
+
+    def _delete_expiry(self, batch, key):
+        cdeadline = self._get(self._expiry_key(key))
+        if cdeadline is None:
+            return
+
+        batch.delete(self._expiry_key(key))
+        batch.delete(EXPIRY_DEADLINE_KEY+cdeadline+key)
+
+    def set_expiry(self, key, deadline):
+        """Sets the expiration deadline of an indicator, replacing the
+        current deadline.
+
+        Args:
+            key (str): indicator
+            deadline (int): deadline, 64-bit unsigned int
+        """
+        if type(key) == unicode:
+            key = key.encode('utf8')
+
+        packed = struct.pack(">Q", deadline)
+        if self._get(self._expiry_key(key)) == packed:
+            return
+
+        batch = self._batch
+        if batch is None:
+            batch = self.db.write_batch()
+
+        self._delete_expiry(batch, key)
+        batch.put(self._expiry_key(key), packed)
+        batch.put(EXPIRY_DEADLINE_KEY+packed+key, '')
+
+        if self._batch is not None:
+            self._check_batch_size()
+            return
+
+        batch.write()
+
+    def cancel_expiry(self, key):
+        """Removes the expiration deadline of an indicator.
+
+        Args:
+            key (str): indicator
+        """
+        if type(key) == unicode:
+            key = key.encode('utf8')
+
+        batch = self._batch
+        if batch is None:
+            batch = self.db.write_batch()
+
+        self._delete_expiry(batch, key)
+
+        if self._batch is not None:
+            self._check_batch_size()
+            return
+
+        batch.write()
+
+    def get_expiry(self, key):
+        """Returns the expiration deadline of an indicator, None if not set.
+
+        Args:
+            key (str): indicator
+        """
+        if type(key) == unicode:
+            key = key.encode('utf8')
+
+        deadline = self._get(self._expiry_key(key))
+        if deadline is None:
+            return None
+
+        return struct.unpack(">Q", deadline)[0]
+
+    def next_expiry(self):
+        """Returns the earliest expiration deadline, None if no indicator
+        has a deadline.
+        """
+        self._write_batch()
+
+        ri = self.db.iterator(
+            start=EXPIRY_DEADLINE_KEY,
+            stop=struct.pack("BB", 3, 2),
+            include_value=False
+        )
+        for k in ri:
+            return struct.unpack(">Q", k[2:10])[0]
+
+        return None
+
+    def query_expired(self, to_deadline):
+        """Generator of (indicator, deadline) of the indicators with
+        deadline less or equal than to_deadline, ordered by deadline.
+
+        Args:
+            to_deadline (int): deadline
+        """
+        self._write_batch()
+
+        ri = self.db.iterator(
+            start=EXPIRY_DEADLINE_KEY,
+            stop=self._expiry_deadline_key(to_deadline+1),
+            include_value=False
+        )
+        for k in ri:
+            yield k[10:], struct.unpack(">Q", k[2:10])[0]
+
+    def get_custom_metadata(self, name):
+        """Returns the custom metadata blob stored with name, None if
+        it does not exist.
+
+        Args:
+            name (str): name of the metadata
+        """
+        return self._get(CUSTOM_METADATA_KEY+name)
+
+    def put_custom_metadata(self, name, value):
+        """Stores a blob of custom metadata, used by nodes to keep
+        additional state alongside the indicators. If a write batch is
+        active the blob is written with the batch.
+
+        Args:
+            name (str): name of the metadata
+            value (str): blob
+        """
+        if self._batch is not None:
+            self._batch.put(CUSTOM_METADATA_KEY+name, value)
+            self._check_batch_size()
+            return
+
+        self.db.put(CUSTOM_METADATA_KEY+name, value)
+
     def _indicator_key(self, key):
         return struct.pack("BB", 1, 1)+key
 
@@ -247,6 +781,82 @@ class Table(object):
         batch.put(struct.pack("BBB", 0, 1, idxid), attribute)
         batch.write()
 
+    def drop_index(self, attribute):
+        """Removes an index and all its entries.
+
+        Args:
+            attribute (str): indexed attribute
+        """
+        index = self.indexes.pop(attribute, None)
+        if index is None:
+            return
+
+        self._write_batch()
+
+        batch = self.db.write_batch()
+        batch.delete(struct.pack("BBB", 0, 1, index['id']))
+        ri = self.db.iterator(
+            start=struct.pack("BB", 2, index['id']),
+            stop=struct.pack("BBB", 2, index['id'], 0xFF),
+            include_value=False
+        )
+        for k in ri:
+            batch.delete(k)
+        batch.write()
+
+    def collect_index_garbage(self, attribute, start=None, max_entries=1000):
+        """Removes the stale entries of an index, scanning at most
+        max_entries entries after start. Staleness is checked against the
+        indicators written to the DB, pending writes are ignored.
+
+        Args:
+            attribute (str): indexed attribute
+            start (str): key of the last entry scanned by the previous
+                call, None to start from the first entry
+            max_entries (int): max number of entries to scan
+
+        Returns:
+            (last key scanned or None if the end of the index has been
+            reached, number of entries scanned, number of entries removed)
+        """
+        index = self.indexes.get(attribute, None)
+        if index is None:
+            raise ValueError()
+
+        if start is None:
+            start = struct.pack("BBB", 2, index['id'], 0xF0)
+
+        ri = self.db.iterator(
+            start=start,
+            stop=struct.pack("BBB", 2, index['id'], 0xF1),
+            include_start=False
+        )
+
+        batch = self.db.write_batch()
+
+        last = None
+        scanned = 0
+        removed = 0
+        for ikey, ekey in ri:
+            last = ikey
+            scanned += 1
+
+            evalue = self.db.get(self._indicator_key_version(ekey[8:]))
+            if evalue is None or evalue != ekey[:8]:
+                batch.delete(ikey)
+                removed += 1
+
+            if scanned >= max_entries:
+                break
+
+        else:
+            last = None
+
+        batch.write()
+
+        return last, scanned, removed
+
+    @latency.timed('put')
     def put(self, key, value):
         if type(key) == unicode:
             key = key.encode('utf8')
@@ -267,18 +877,23 @@ class Table(object):
         self.last_update = now
         cversion = cversion+1
 
-        batch = self.db.write_batch()
-        batch.put(ikey, struct.pack(">Q", cversion)+ujson.dumps(value))
+        batch = self._batch
+        if batch is None:
+            batch = self.db.write_batch()
+
+        batch.put(
+            ikey,
+            struct.pack(">Q", cversion)+self._encoder.encode(value)
+        )
         batch.put(ikeyv, struct.pack(">Q", cversion))
-        batch.put(LAST_UPDATE_KEY, struct.pack(">Q", self.last_update))
+
+        if self._cache is not None:
+            self._cache.put(key, dict(value))
 
         if exists is None:
             self.num_indicators += 1
-            batch.put(
-                NUM_INDICATORS_KEY,
-                struct.pack(">Q", self.num_indicators)
-            )
 
+        updated_indexes = []
         for iattr, index in self.indexes.iteritems():
             v = value.get(iattr, None)
             if v is None:
@@ -289,21 +904,52 @@ class Table(object):
             idxkey = self._index_key(index['id'], v, index['last_global_id'])
             batch.put(idxkey, struct.pack(">Q", cversion)+key)
 
-            batch.put(
-                self._last_global_id_key(index['id']),
-                struct.pack(">Q", index['last_global_id'])
-            )
+            updated_indexes.append(index)
 
+        if self._batch is not None:
+            for index in updated_indexes:
+                self._batch.indexes[index['id']] = index
+            self._check_batch_size()
+            return
+
+        self._put_metadata(
+            batch,
+            updated_indexes,
+            num_indicators=(exists is None)
+        )
         batch.write()
 
     def query(self, index=None, from_key=None, to_key=None,
               include_value=False, include_stop=True, include_start=True,
-              reverse=False):
+              reverse=False, snapshot=False, fill_cache=True):
+        """Generator of the indicators in a range of indicators or in a
+        range of values of an index.
+
+        By default index entries and values are read from the live DB while
+        iterating, and updates written by the caller during the query could
+        be returned. If snapshot is True, the query runs against a snapshot
+        of the DB taken when the query starts, released when the generator
+        is exhausted or closed.
+
+        Args:
+            snapshot (bool): run the query against a DB snapshot
+            fill_cache (bool): if False, blocks read by the query are not
+                added to the LevelDB block cache. Bulk scans should set
+                this to False to avoid evicting the working set
+        """
+        # iterators don't see the pending operations
+        self._write_batch()
+
         if type(from_key) is unicode:
             from_key = from_key.encode('ascii', 'replace')
         if type(to_key) is unicode:
             to_key = to_key.encode('ascii', 'replace')
 
+        if snapshot:
+            snapshot = self.db.snapshot()
+        else:
+            snapshot = None
+
         if index is None:
             return self._query_by_indicator(
                 from_key=from_key,
@@ -311,7 +957,9 @@ class Table(object):
                 include_value=include_value,
                 include_stop=include_stop,
                 include_start=include_start,
-                reverse=reverse
+                reverse=reverse,
+                snapshot=snapshot,
+                fill_cache=fill_cache
             )
         return self._query_by_index(
             index,
@@ -320,12 +968,15 @@ class Table(object):
             include_value=include_value,
             include_stop=include_stop,
             include_start=include_start,
-            reverse=reverse
+            reverse=reverse,
+            snapshot=snapshot,
+            fill_cache=fill_cache
         )
 
     def _query_by_indicator(self, from_key=None, to_key=None,
                             include_value=False, include_stop=True,
-                            include_start=True, reverse=False):
+                            include_start=True, reverse=False,
+                            snapshot=None, fill_cache=True):
         if from_key is None:
             from_key = struct.pack("BB", 1, 1)
             include_stop = False
@@ -338,24 +989,51 @@ class Table(object):
         else:
             to_key = self._indicator_key(to_key)
 
+        if snapshot is not None:
+            # values are read from the iterator, same view
+            ri = snapshot.iterator(
+                start=from_key,
+                stop=to_key,
+                include_stop=include_stop,
+                include_start=include_start,
+                reverse=reverse,
+                include_value=include_value,
+                fill_cache=fill_cache
+            )
+            try:
+                for e in ri:
+                    if include_value:
+                        yield e[0][2:], self._decode(e[1][8:])
+                    else:
+                        yield e[2:]
+
+            finally:
+                # snapshots are released when garbage collected
+                ri = None
+                snapshot = None
+
+            return
+
         ri = self.db.iterator(
             start=from_key,
             stop=to_key,
             include_stop=include_stop,
             include_start=include_start,
             reverse=reverse,
-            include_value=False
+            include_value=False,
+            fill_cache=fill_cache
         )
         for ekey in ri:
             ekey = ekey[2:]
             if include_value:
-                yield ekey, self.get(ekey)
+                yield ekey, self._get_value(ekey, fill_cache=fill_cache)
             else:
                 yield ekey
 
     def _query_by_index(self, index, from_key=None, to_key=None,
                         include_value=False, include_stop=True,
-                        include_start=True, reverse=False):
+                        include_start=True, reverse=False,
+                        snapshot=None, fill_cache=True):
         if index not in self.indexes:
             raise ValueError()
 
@@ -377,33 +1055,47 @@ class Table(object):
                 lastidxid=0xFFFFFFFFFFFFFFFF
             )
 
-        ri = self.db.iterator(
+        reader = self.db if snapshot is None else snapshot
+        ri = reader.iterator(
             start=from_key,
             stop=to_key,
             include_value=True,
             include_start=include_start,
             include_stop=include_stop,
-            reverse=reverse
+            reverse=reverse,
+            fill_cache=fill_cache
         )
-        for ikey, ekey in ri:
-            iversion = struct.unpack(">Q", ekey[:8])[0]
-            ekey = ekey[8:]
-
-            evalue = self._get(self._indicator_key_version(ekey))
-            if evalue is None:
-                # LOG.debug("Key does not exist")
-                # key does not exist
-                self.db.delete(ikey)
-                continue
-
-            cversion = struct.unpack(">Q", evalue)[0]
-            if iversion != cversion:
-                # index value is old
-                # LOG.debug("Version mismatch")
-                self.db.delete(ikey)
-                continue
-
-            if include_value:
-                yield ekey, self.get(ekey)
-            else:
-                yield ekey
+        try:
+            for ikey, ekey in ri:
+                iversion = struct.unpack(">Q", ekey[:8])[0]
+                ekey = ekey[8:]
+
+                evalue = self._get(
+                    self._indicator_key_version(ekey),
+                    snapshot=snapshot,
+                    fill_cache=fill_cache
+                )
+                if evalue is None:
+                    # LOG.debug("Key does not exist")
+                    # key does not exist
+                    continue
+
+                cversion = struct.unpack(">Q", evalue)[0]
+                if iversion != cversion:
+                    # index value is old
+                    # LOG.debug("Version mismatch")
+                    continue
+
+                if include_value:
+                    yield ekey, self._get_value(
+                        ekey,
+                        snapshot=snapshot,
+                        fill_cache=fill_cache
+                    )
+                else:
+                    yield ekey
+
+        finally:
+            # snapshots are released when garbage collected
+            ri = None
+            snapshot = None
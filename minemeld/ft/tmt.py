@@ -74,6 +74,9 @@ class DTIAPI(basepoller.BasePollerFT):
 
         self._load_side_config()
 
+    def storage_dbs(self):
+        return super(DTIAPI, self).storage_dbs()+[self.name+'_temp']
+
     def _load_side_config(self):
         try:
             with open(self.side_config_path, 'r') as f:
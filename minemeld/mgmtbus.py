@@ -38,6 +38,7 @@ import gevent.event
 
 import minemeld.comm
 import minemeld.ft
+import minemeld.ft.latency
 
 from .collectd import CollectdClient
 
@@ -68,6 +69,7 @@ class MgmtbusMaster(object):
 
         self.status_glet = None
         self._status = {}
+        self._latency_buckets = {}
 
         self.comm = minemeld.comm.factory(self.comm_class, self.comm_config)
         self._out_channel = self.comm.request_pub_channel(MGMTBUS_TOPIC)
@@ -228,7 +230,10 @@ class MgmtbusMaster(object):
         LOG.debug('checkpoint_graph done')
 
     def _send_collectd_metrics(self, answers, interval):
-        """Send collected metrics from nodes to collectd.
+        """Send collected metrics from nodes to collectd. For each latency
+        histogram of the nodes, including the latency from the origin of
+        the indicators on each input edge, the 50th and 99th percentile in
+        usecs of the last interval are sent.
 
         Args:
             answers (list): list of metrics
@@ -261,6 +266,38 @@ class MgmtbusMaster(object):
                           interval=interval,
                           type_='minemeld_delta')
 
+            # percentiles of the latency in the last interval, from the
+            # difference with the histograms of the previous interval
+            histograms = []
+            for m, h in a.get('latency', {}).iteritems():
+                histograms.append((m, h))
+            for i, h in a.get('edge_latency', {}).iteritems():
+                histograms.append(('edge.'+i, h))
+
+            for m, h in histograms:
+                buckets = h.get('buckets', [])
+                lkey = source+'.'+m
+                pbuckets = self._latency_buckets.get(lkey, None)
+                self._latency_buckets[lkey] = buckets
+
+                if pbuckets is not None and len(pbuckets) == len(buckets):
+                    delta = [c-p for c, p in zip(buckets, pbuckets)]
+                    # negative deltas, the node has been restarted
+                    if min(delta) >= 0:
+                        buckets = delta
+
+                for p in [50, 99]:
+                    v = minemeld.ft.latency.percentile(buckets, p)
+                    if v is None:
+                        continue
+
+                    cc.putval(
+                        '%s.latency.%s.p%d' % (source, m, p),
+                        v,
+                        type_='minemeld_counter',
+                        interval=interval
+                    )
+
             if length is not None:
                 gstats['length'] += length
                 gstats[ntype+'.length'] += length
@@ -347,7 +384,8 @@ class MgmtbusSlaveHub(object):
     def request_log_channel(self):
         LOG.debug("Adding log channel")
         return self.comm.request_pub_channel(
-            MGMTBUS_LOG_TOPIC
+            MGMTBUS_LOG_TOPIC,
+            shed=True
         )
 
     def request_channel(self, node):
@@ -381,20 +419,17 @@ def master_factory(config, comm_class, comm_config, fts):
 
     Args:
         config (dict): management bus master config
-        comm_class (string): communication backend.
-            Unused, AMQP is always used
+        comm_class (string): communication backend
         comm_config (dict): config of the communication backend
         fts (list): list of nodes
 
     Returns:
         Instance of minemeld.mgmtbus.MgmtbusMaster class
     """
-    _ = comm_class  # noqa
-
     return MgmtbusMaster(
         fts,
         config,
-        'AMQP',
+        comm_class,
         comm_config
     )
 
@@ -404,17 +439,14 @@ def slave_hub_factory(config, comm_class, comm_config):
 
     Args:
         config (dict): management bus master config
-        comm_class (string): communication backend.
-            Unused, AMQP is always used
+        comm_class (string): communication backend
         comm_config (dict): config of the communication backend.
 
     Returns:
         Instance of minemeld.mgmtbus.MgmtbusSlaveHub class
     """
-    _ = comm_class  # noqa
-
     return MgmtbusSlaveHub(
         config,
-        'AMQP',
+        comm_class,
         comm_config
     )
@@ -107,6 +107,9 @@ def _load_config_from_file(f):
             'slave': {}
         }
 
+    if 'storage' not in config:
+        config['storage'] = {}
+
     nodes_config = config.get('nodes', {})
     for nname, nconfig in nodes_config.iteritems():
         if 'prototype' in nconfig:
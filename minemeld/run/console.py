@@ -45,12 +45,23 @@ def _send_cmd(ctx, target, command, params=None, source=True):
 
 
 class FakeNode(object):
-    def update(self, source=None, indicator=None, value=None):
+    def update(self, source=None, indicator=None, value=None, meta=None):
         print 'source:', source
         print 'indicator:', indicator
         print 'value: %s' % value
         print
 
+    def update_chunk(self, source=None, stream=None, seq=None,
+                     indicators=None, cursor=None, last=False):
+        if last:
+            print 'stream %s completed, %d chunks' % (stream, seq)
+            return 'OK'
+
+        for indicator, value in indicators:
+            self.update(source=source, indicator=indicator, value=value)
+
+        return 'OK'
+
 
 @click.group()
 @click.option('--comm-class', default='AMQP',
@@ -77,7 +88,7 @@ def cli(ctx, verbose, comm_class):
     comm.request_rpc_server_channel(
         source,
         FakeNode(),
-        allowed_methods=['update']
+        allowed_methods=['update', 'update_chunk']
     )
 
     gevent.signal(signal.SIGTERM, comm.stop)
@@ -151,7 +162,7 @@ def get_range(ctx, target, index, from_key, to_key):
     if target is None:
         raise click.UsageError(message='target required')
 
-    print _send_cmd(ctx, target, 'get_all_range', params={
+    print _send_cmd(ctx, target, 'get_range', params={
         'index': index,
         'from_key': from_key,
         'to_key': to_key
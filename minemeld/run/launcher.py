@@ -35,14 +35,16 @@ from minemeld import __version__
 LOG = logging.getLogger(__name__)
 
 
-def _run_chassis(fabricconfig, mgmtbusconfig, fts):
+def _run_chassis(fabricconfig, mgmtbusconfig, storageconfig, fts,
+                 remote_outputs):
     try:
         c = minemeld.chassis.Chassis(
             fabricconfig['class'],
             fabricconfig['config'],
-            mgmtbusconfig
+            mgmtbusconfig,
+            storageconfig
         )
-        c.configure(fts)
+        c.configure(fts, remote_outputs=remote_outputs)
 
         while not c.fts_init():
             gevent.sleep(1)
@@ -61,6 +63,21 @@ def _run_chassis(fabricconfig, mgmtbusconfig, fts):
         raise
 
 
+def _remote_outputs(ftlist, ftlists):
+    """Returns the nodes in ftlist with subscribers in the other lists"""
+    result = set()
+    for g in ftlists:
+        if g is ftlist:
+            continue
+
+        for ftconfig in g.values():
+            for i in ftconfig.get('inputs', []):
+                if i in ftlist:
+                    result.add(i)
+
+    return list(result)
+
+
 def _start_mgmtbus_master(config, ftlist):
     mbusmaster = minemeld.mgmtbus.master_factory(
         config['master'],
@@ -173,7 +190,9 @@ def main():
             args=(
                 config['fabric'],
                 config['mgmtbus'],
-                g
+                config['storage'],
+                g,
+                _remote_outputs(g, ftlists)
             )
         )
         processes.append(p)
@@ -22,6 +22,7 @@ import time
 import Queue
 import os
 import os.path
+import collections
 
 import gevent.queue
 import gevent.event
@@ -110,6 +111,16 @@ class Table(object):
         batch.put(TABLE_MAX_COUNTER_KEY, new_max_counter)
         batch.write()
 
+    def put_many(self, items):
+        self.last_used = time.time()
+
+        batch = self.db.write_batch()
+        for key, value in items:
+            self.max_counter += 1
+            batch.put(key+('%016x' % self.max_counter), value)
+        batch.put(TABLE_MAX_COUNTER_KEY, '%016x' % self.max_counter)
+        batch.write()
+
     def backwards_iterator(self, timestamp, counter):
         return self.db.iterator(
             start=START_KEY,
@@ -315,6 +326,28 @@ class Store(object):
         finally:
             self._release(table, 'write')
 
+    def write_many(self, logs):
+        """Writes a list of (timestamp, log) with a single write batch
+        per daily table.
+        """
+        if self._stop.is_set():
+            raise RuntimeError('stopping')
+
+        days = collections.OrderedDict()
+        for timestamp, log in logs:
+            tssec = timestamp/1000
+            day = '%016x' % (tssec - (tssec % 86400))
+            days.setdefault(day, []).append(('%016x' % timestamp, log))
+
+        for day, items in days.iteritems():
+            table = self._get_table(day, 'write')
+
+            try:
+                table.put_many(items)
+
+            finally:
+                self._release(table, 'write')
+
     def iterate_backwards(self, ref, timestamp, counter):
         if self._stop.is_set():
             raise RuntimeError('stopping')
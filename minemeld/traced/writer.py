@@ -32,7 +32,7 @@ class Writer(object):
         self.comm.request_sub_channel(
             topic,
             self,
-            allowed_methods=['log'],
+            allowed_methods=['log', 'log_batch'],
             name='mbus:log:writer'
         )
 
@@ -42,6 +42,35 @@ class Writer(object):
 
         self.store.write(timestamp, ujson.dumps(kwargs))
 
+    def log_batch(self, logs=None, values=None):
+        """Writes a batch of logs sent by a chassis.
+
+        Values repeated in the batch are sent once, as JSON strings in
+        *values*, and referenced by index with the *value_ref* key of
+        the log. They are expanded here, so the records in the store
+        have the same format of the records written by `log`.
+        """
+        if self._stop.is_set():
+            return
+
+        if logs is None:
+            return
+
+        if values is None:
+            values = []
+        values = [ujson.loads(v) for v in values]
+
+        entries = []
+        for entry in logs:
+            log = entry.get('log', None)
+            if isinstance(log, dict) and 'value_ref' in log:
+                log['value'] = values[log.pop('value_ref')]
+
+            timestamp = entry.pop('timestamp')
+            entries.append((timestamp, ujson.dumps(entry)))
+
+        self.store.write_many(entries)
+
     def stop(self):
         LOG.info('Writer - stop called')
 
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Compares the communication backends of minemeld.comm: pub/sub
+throughput of updates and RPC round trip latency. The AMQP backend is
+skipped if the broker is not reachable.
+
+Usage: comm_profile.py [<num updates>] [<num rpcs>]
+"""
+
+import gevent.monkey
+gevent.monkey.patch_all(thread=False, select=False)
+
+import sys
+import time
+import socket
+import shutil
+import tempfile
+
+import gevent
+import gevent.event
+
+import minemeld.comm
+
+NUM_UPDATES = 100000
+NUM_RPCS = 10000
+UDS_PATH = tempfile.mktemp(prefix='minemeld.commprofile')
+
+
+class Node(object):
+    def __init__(self):
+        self.received = 0
+        self.done = gevent.event.Event()
+
+    def update(self, source=None, indicator=None, value=None):
+        self.received += 1
+
+    def checkpoint(self, source=None, value=None):
+        self.done.set()
+
+    def ping(self):
+        return 'pong'
+
+
+def profile(name, commclass, config, num_updates, num_rpcs):
+    node = Node()
+
+    sc = minemeld.comm.factory(commclass, dict(config))
+    sc.request_sub_channel('profile', node, ['update', 'checkpoint'])
+    sc.request_rpc_server_channel('profile', node, ['ping'])
+    sc.start()
+
+    config = dict(config)
+    config['batch_max_size'] = 100
+    pc = minemeld.comm.factory(commclass, config)
+    pub = pc.request_pub_channel('profile')
+    pc.start()
+
+    # give the sub channels the time to connect
+    gevent.sleep(1)
+
+    t1 = time.time()
+    for j in xrange(num_updates):
+        pub.publish('update', {
+            'source': 'profile',
+            'indicator': '10.0.%d.%d' % ((j >> 8) & 0xFF, j & 0xFF),
+            'value': {
+                'type': 'IPv4',
+                'confidence': 50,
+                'sources': ['profile']
+            }
+        })
+    pub.publish('checkpoint', {'source': 'profile', 'value': 'c'})
+    node.done.wait()
+    t2 = time.time()
+    print '%s - pub/sub: %d updates in %f secs, %f updates/sec' % (
+        name,
+        node.received,
+        t2-t1,
+        num_updates/(t2-t1)
+    )
+
+    latencies = []
+    for j in xrange(num_rpcs):
+        t1 = time.time()
+        pc.send_rpc('profile', 'ping', {}, timeout=10)
+        latencies.append(time.time()-t1)
+    latencies.sort()
+    print '%s - rpc: avg %f usecs, p50 %f usecs, p99 %f usecs' % (
+        name,
+        sum(latencies)*1e6/num_rpcs,
+        latencies[num_rpcs/2]*1e6,
+        latencies[num_rpcs*99/100]*1e6
+    )
+
+    pc.stop()
+    sc.stop()
+
+
+if __name__ == '__main__':
+    num_updates = NUM_UPDATES
+    if len(sys.argv) > 1:
+        num_updates = int(sys.argv[1])
+    num_rpcs = NUM_RPCS
+    if len(sys.argv) > 2:
+        num_rpcs = int(sys.argv[2])
+
+    profile('uds', 'UDS', {'path': UDS_PATH}, num_updates, num_rpcs)
+    shutil.rmtree(UDS_PATH)
+
+    try:
+        profile('amqp', 'AMQP', {}, num_updates, num_rpcs)
+    except socket.error as e:
+        print 'amqp - broker not reachable: %s' % e
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Compares the delivery of updates between two nodes in the same chassis
+through the in-process channels of minemeld.comm.local and through the
+AMQP broker. The AMQP path is skipped if the broker is not reachable.
+
+Usage: fabric_profile.py [<num updates>]
+"""
+
+import gevent.monkey
+gevent.monkey.patch_all(thread=False, select=False)
+
+import sys
+import time
+import socket
+
+import gevent
+import gevent.event
+
+import minemeld.fabric
+
+NUM_UPDATES = 100000
+
+
+class Node(object):
+    def __init__(self, num_updates):
+        self.num_updates = num_updates
+        self.received = 0
+        self.done = gevent.event.Event()
+
+    def update(self, source=None, indicator=None, value=None):
+        self.received += 1
+
+    def checkpoint(self, source=None, value=None):
+        self.done.set()
+
+
+def profile(name, fabricconfig, num_updates):
+    fabric = minemeld.fabric.Fabric(None, fabricconfig, 'AMQP')
+    fabric.configure(['miner', 'processor'], remote_outputs=[])
+
+    node = Node(num_updates)
+    fabric.request_sub_channel(
+        'processor',
+        node,
+        'miner',
+        ['update', 'checkpoint']
+    )
+    pc = fabric.request_pub_channel('miner')
+
+    if fabricconfig.get('local_delivery', True):
+        # only the local channels, the broker is not needed
+        for sc in fabric.local_sub_channels.values():
+            sc.start()
+    else:
+        fabric.start()
+
+    t1 = time.time()
+    for j in xrange(num_updates):
+        pc.publish('update', {
+            'source': 'miner',
+            'indicator': '10.0.%d.%d' % ((j >> 8) & 0xFF, j & 0xFF),
+            'value': {
+                'type': 'IPv4',
+                'confidence': 50,
+                'sources': ['miner']
+            }
+        })
+    pc.publish('checkpoint', {'source': 'miner', 'value': 'c'})
+    node.done.wait()
+    t2 = time.time()
+
+    if fabricconfig.get('local_delivery', True):
+        for sc in fabric.local_sub_channels.values():
+            sc.stop()
+    else:
+        fabric.stop()
+
+    print '%s - delivered %d updates in %f secs, %f usecs/update' % (
+        name,
+        node.received,
+        t2-t1,
+        (t2-t1)*1e6/num_updates
+    )
+
+
+if __name__ == '__main__':
+    num_updates = NUM_UPDATES
+    if len(sys.argv) > 1:
+        num_updates = int(sys.argv[1])
+
+    profile('local', {}, num_updates)
+
+    try:
+        profile('amqp', {'local_delivery': False}, num_updates)
+    except socket.error as e:
+        print 'amqp - broker not reachable: %s' % e
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Compares the compiled filters of minemeld.ft.base with the previous
+implementation, evaluating every condition with JMESPath on a copy
+of the value. The second run uses a list of per-source drop rules,
+dispatched on the origin by the compiled filters.
+
+Usage: filters_profile.py [<num indicators>]
+"""
+
+import sys
+import copy
+import time
+
+import minemeld.ft.base
+import minemeld.ft.condition
+
+NUM_INDICATORS = 100000
+NUM_SOURCES = 50
+
+FILTERS = [
+    {
+        'name': 'accept withdraws',
+        'conditions': ["__method == 'withdraw'"],
+        'actions': ['accept']
+    },
+    {
+        'name': 'drop low confidence',
+        'conditions': ["confidence < 30", "type == 'IPv4'"],
+        'actions': ['drop']
+    },
+    {
+        'name': 'drop private',
+        'conditions': ["starts_with(__indicator, '192.168.') == true"],
+        'actions': ['drop']
+    },
+    {
+        'name': 'accept IPv4',
+        'conditions': ["type == 'IPv4'", "length(sources) > 0"],
+        'actions': ['accept']
+    },
+    {
+        'name': 'drop all',
+        'actions': ['drop']
+    }
+]
+
+PER_SOURCE_FILTERS = [
+    {
+        'name': 'drop source%d' % j,
+        'conditions': [
+            "__origin == 'source%d'" % j,
+            "confidence > %d" % (j+25)
+        ],
+        'actions': ['drop']
+    } for j in range(NUM_SOURCES)
+] + [
+    {
+        'name': 'accept all',
+        'actions': ['accept']
+    }
+]
+
+
+class _OldFilters(object):
+    def __init__(self, filters):
+        self.filters = []
+
+        for f in filters:
+            cf = {
+                'name': f.get('name', 'filter_%d' % len(self.filters)),
+                'conditions': [],
+                'actions': []
+            }
+
+            for c in f.get('conditions', []):
+                cf['conditions'].append(minemeld.ft.condition.Condition(c))
+
+            for a in f.get('actions'):
+                cf['actions'].append(a)
+
+            self.filters.append(cf)
+
+    def apply(self, origin=None, method=None, indicator=None, value=None):
+        if value is None:
+            d = {}
+        else:
+            d = copy.copy(value)
+
+        if indicator is not None:
+            d['__indicator'] = indicator
+
+        if method is not None:
+            d['__method'] = method
+
+        if origin is not None:
+            d['__origin'] = origin
+
+        for f in self.filters:
+            r = True
+            for c in f['conditions']:
+                r &= c.eval(d)
+
+            if not r:
+                continue
+
+            for a in f['actions']:
+                if a == 'accept':
+                    if value is None:
+                        return indicator, None
+
+                    d.pop('__indicator')
+                    d.pop('__origin', None)
+                    d.pop('__method', None)
+
+                    return indicator, d
+
+                elif a == 'drop':
+                    return None, None
+
+        if value is None:
+            return indicator, None
+
+        d.pop('__indicator')
+        d.pop('__origin', None)
+        d.pop('__method', None)
+
+        return indicator, d
+
+
+def _indicators(num_indicators):
+    for j in xrange(num_indicators):
+        if j % 4 == 0:
+            indicator = '192.168.%d.%d' % ((j >> 8) & 0xFF, j & 0xFF)
+        else:
+            indicator = '10.%d.%d.%d' % (
+                (j >> 16) & 0xFF, (j >> 8) & 0xFF, j & 0xFF
+            )
+
+        yield (
+            'source%d' % (j % NUM_SOURCES),
+            indicator,
+            'withdraw' if j % 10 == 0 else 'update',
+            {
+                'type': 'IPv4',
+                'confidence': j % 100,
+                'sources': ['profile']
+            }
+        )
+
+
+def profile(name, filters, indicators):
+    t1 = time.time()
+    accepted = 0
+    for origin, indicator, method, value in indicators:
+        i, _ = filters.apply(
+            origin=origin,
+            method=method,
+            indicator=indicator,
+            value=value
+        )
+        if i is not None:
+            accepted += 1
+    t2 = time.time()
+
+    print '%s: %d indicators (%d accepted) in %f secs, %f indicators/sec' % (
+        name,
+        len(indicators),
+        accepted,
+        t2-t1,
+        len(indicators)/(t2-t1)
+    )
+
+    return accepted
+
+
+if __name__ == '__main__':
+    num_indicators = NUM_INDICATORS
+    if len(sys.argv) > 1:
+        num_indicators = int(sys.argv[1])
+
+    indicators = list(_indicators(num_indicators))
+
+    for filters in [FILTERS, PER_SOURCE_FILTERS]:
+        old = profile('jmespath', _OldFilters(filters), indicators)
+        new = profile('compiled', minemeld.ft.base._Filters(filters),
+                      indicators)
+        assert old == new
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Compares the interval engines of AggregateIPv4FT and AggregateIPv6FT,
+minemeld.ft.st.ST and minemeld.ft.memst.MemoryST, with the workload of
+tests/st_profile.py: /24 networks and single addresses. With epsize 128
+the workload is /64 networks and single addresses.
+
+Usage: st_engine_profile.py [<num intervals>] [<epsize>]
+"""
+
+import sys
+import uuid
+import random
+import shutil
+import tempfile
+import time
+
+import minemeld.ft.st
+import minemeld.ft.memst
+
+TABLENAME = tempfile.mktemp(prefix='minemeld.ftstengineprofile')
+NUM_INTERVALS = 1000000
+NUM_QUERIES = 100000
+
+# epsize -> number of host bits of the networks
+HOST_BITS = {
+    32: 8,
+    128: 64
+}
+
+ENGINES = [
+    ('leveldb', minemeld.ft.st.ST),
+    ('memory', minemeld.ft.memst.MemoryST)
+]
+
+
+def random_intervals(num_intervals, epsize):
+    max_endpoint = (1 << epsize)-1
+    hostmask = (1 << HOST_BITS[epsize])-1
+
+    result = []
+    for j in xrange(num_intervals):
+        end = random.randint(0, max_endpoint)
+        if random.randint(0, 1) == 0:
+            start = end & ~hostmask
+            end = start + hostmask
+        else:
+            start = end
+        result.append((uuid.uuid4().bytes, start, end))
+
+    return result
+
+
+def profile(name, stclass, epsize, intervals, queries):
+    st = stclass(TABLENAME, epsize, truncate=True)
+
+    t1 = time.time()
+    for sid, start, end in intervals:
+        st.put(sid, start, end, level=1)
+    t2 = time.time()
+    print '%s - Inserted %d intervals in %f secs' % (name, len(intervals),
+                                                     t2-t1)
+
+    t1 = time.time()
+    for q in queries:
+        for _ in st.cover(q):
+            pass
+    t2 = time.time()
+    print '%s - cover: %f usecs/query' % (name, (t2-t1)*1e6/len(queries))
+
+    # as in AggregateIPv4FT._calc_ipranges: endpoints of a range spanning
+    # 256 networks, and cover of the first endpoint
+    rangesize = (1 << (HOST_BITS[epsize]+8))-1
+    t1 = time.time()
+    for q in queries:
+        first = True
+        for ep in st.query_endpoints(start=q, stop=q+rangesize):
+            if first:
+                first = False
+                for _ in st.cover(ep[0]):
+                    pass
+    t2 = time.time()
+    print '%s - /%d range recompute: %f usecs/range' % (
+        name,
+        epsize-HOST_BITS[epsize]-8,
+        (t2-t1)*1e6/len(queries)
+    )
+
+    st.close()
+    st = None
+
+    if stclass is minemeld.ft.memst.MemoryST:
+        t1 = time.time()
+        st = stclass(TABLENAME, epsize)
+        t2 = time.time()
+        print '%s - Loaded %d intervals in %f secs' % (name, len(intervals),
+                                                       t2-t1)
+        st.close()
+        st = None
+
+
+if __name__ == '__main__':
+    num_intervals = NUM_INTERVALS
+    if len(sys.argv) > 1:
+        num_intervals = int(sys.argv[1])
+    epsize = 32
+    if len(sys.argv) > 2:
+        epsize = int(sys.argv[2])
+
+    intervals = random_intervals(num_intervals, epsize)
+    maxq = (1 << epsize)-(1 << (HOST_BITS[epsize]+8))
+    queries = [random.randint(0, maxq) for _ in xrange(NUM_QUERIES)]
+
+    for name, stclass in ENGINES:
+        profile(name, stclass, epsize, intervals, queries)
+
+    shutil.rmtree(TABLENAME)
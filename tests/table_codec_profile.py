@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Compares the codecs of minemeld.ft.table: encode and decode time of
+indicator values and size of the encoded values in the table.
+"""
+
+import gc
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import minemeld.ft.table
+import minemeld.ft.codec
+
+TABLENAME = tempfile.mktemp(prefix='minemeld.fttablecodecprofile')
+NUM_INDICATORS = 100000
+
+
+def random_value(j):
+    return {
+        'type': 'IPv4',
+        'confidence': random.randint(0, 100),
+        'share_level': 'green',
+        'direction': 'inbound',
+        'first_seen': 1450000000000+j,
+        'last_seen': 1450000000000+j*2,
+        'sources': ['feed%d' % random.randint(0, 10), 'feed.example'],
+        'vendor_example_threat_score': random.random(),
+        'vendor_example_tags': ['malware', 'c2'],
+        '_age_out': 1460000000000+j
+    }
+
+
+def db_size(path):
+    result = 0
+    for f in os.listdir(path):
+        result += os.path.getsize(os.path.join(path, f))
+    return result
+
+
+def profile(codec, values):
+    table = minemeld.ft.table.Table(TABLENAME, truncate=True, codec=codec)
+
+    t1 = time.time()
+    with table.write_batch():
+        for j, v in enumerate(values):
+            table.put('i%d' % j, v)
+    t2 = time.time()
+    print '%s - Written %d indicators in %f secs' % (codec, len(values),
+                                                     t2-t1)
+
+    t1 = time.time()
+    for j in xrange(len(values)):
+        table.get('i%d' % j)
+    t2 = time.time()
+    print '%s - Read %d indicators in %f secs' % (codec, len(values), t2-t1)
+
+    # as timeit, gc is disabled while measuring encode and decode
+    gc.disable()
+
+    encoder = table._encoder
+    t1 = time.time()
+    blobs = [encoder.encode(v) for v in values]
+    t2 = time.time()
+    print '%s - Encode: %f usecs/value' % (codec,
+                                           (t2-t1)*1e6/len(values))
+
+    t1 = time.time()
+    for b in blobs:
+        table._decode(b)
+    t2 = time.time()
+
+    gc.enable()
+    print '%s - Decode: %f usecs/value' % (codec,
+                                           (t2-t1)*1e6/len(values))
+
+    print '%s - Avg value size: %f bytes' % (
+        codec,
+        float(sum(len(b) for b in blobs))/len(blobs)
+    )
+
+    table.db.compact_range()
+    table.close()
+    table = None
+
+    print '%s - Table size on disk: %d bytes' % (codec, db_size(TABLENAME))
+
+
+if __name__ == '__main__':
+    values = [random_value(j) for j in xrange(NUM_INDICATORS)]
+
+    for codec in sorted(minemeld.ft.codec.CODECS.keys()):
+        profile(codec, values)
+
+    shutil.rmtree(TABLENAME)
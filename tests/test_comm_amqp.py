@@ -16,6 +16,12 @@ import gevent.monkey
 gevent.monkey.patch_all(thread=False, select=False)
 
 import unittest
+import mock
+import ujson
+import time
+
+import gevent
+import gevent.event
 
 import minemeld.comm.amqp
 
@@ -87,3 +93,140 @@ class MineMeldCommAMQP(unittest.TestCase):
         self.assertEqual(result['answers'], {'a1': 1, 'a2': 2})
 
         ac.stop()
+
+    def test_04_batch_publish(self):
+        pc = minemeld.comm.amqp.AMQPPubChannel(
+            'a',
+            batch_max_size=2,
+            batch_flush_interval=0.05
+        )
+        pc.channel = mock.Mock()
+
+        def _published():
+            result = []
+            for c in pc.channel.basic_publish.call_args_list:
+                msg = ujson.loads(c[0][0].body)
+                self.assertIn('timestamp', msg)
+                msg.pop('timestamp')
+                result.append(msg)
+            pc.channel.basic_publish.reset_mock()
+            return result
+
+        pc.publish('update', {'indicator': 'i1'})
+        self.assertEqual(_published(), [])
+
+        pc.publish('withdraw', {'indicator': 'i2'})
+        self.assertEqual(_published(), [{
+            'method': 'batch',
+            'params': {'messages': [
+                ['update', {'indicator': 'i1'}],
+                ['withdraw', {'indicator': 'i2'}]
+            ]}
+        }])
+
+        # other methods flush the pending batch first
+        pc.publish('update', {'indicator': 'i3'})
+        pc.publish('checkpoint', {'value': 'c'})
+        self.assertEqual(_published(), [
+            {
+                'method': 'batch',
+                'params': {'messages': [['update', {'indicator': 'i3'}]]}
+            },
+            {
+                'method': 'checkpoint',
+                'params': {'value': 'c'}
+            }
+        ])
+
+        # flushed by the timer
+        pc.publish('update', {'indicator': 'i4'})
+        gevent.sleep(0.1)
+        self.assertEqual(len(_published()), 1)
+
+    def test_05_batch_dispatch(self):
+        class A(object):
+            def __init__(self):
+                self.calls = []
+
+            def update(self, indicator=None):
+                self.calls.append(('update', indicator))
+
+            def withdraw(self, indicator=None):
+                self.calls.append(('withdraw', indicator))
+
+            def batch(self, messages=None):
+                self.calls.append(('batch', len(messages)))
+
+        a1 = A()
+        a2 = A()
+
+        sc = minemeld.comm.amqp.AMQPSubChannel('a')
+        sc.add_listener(a1, ['update', 'withdraw'])
+        sc.add_listener(a2, ['update', 'withdraw', 'batch'])
+
+        msg = mock.Mock()
+        msg.body = ujson.dumps({
+            'method': 'batch',
+            'params': {'messages': [
+                ['update', {'indicator': 'i1'}],
+                ['withdraw', {'indicator': 'i1'}],
+                ['update', {'indicator': 'i2'}]
+            ]}
+        })
+        sc._callback(msg)
+
+        self.assertEqual(
+            a1.calls,
+            [('update', 'i1'), ('withdraw', 'i1'), ('update', 'i2')]
+        )
+        self.assertEqual(a2.calls, [('batch', 3)])
+
+    def test_06_flow_control(self):
+        flow = gevent.event.Event()
+
+        pc = minemeld.comm.amqp.AMQPPubChannel('a', flow=flow)
+        pc.channel = mock.Mock()
+        lc = minemeld.comm.amqp.AMQPPubChannel('log', flow=flow, shed=True)
+        lc.channel = mock.Mock()
+
+        # blocked by the broker
+        g = gevent.spawn(pc.publish, 'update', {'indicator': 'i1'})
+        lc.publish('log', {'log': 'l1'})
+        gevent.sleep(0.1)
+        self.assertFalse(g.ready())
+        self.assertEqual(pc.channel.basic_publish.call_count, 0)
+        self.assertEqual(lc.channel.basic_publish.call_count, 0)
+        self.assertEqual(lc.num_shed, 1)
+
+        flow.set()
+        g.join(timeout=1)
+        self.assertTrue(g.ready())
+        self.assertEqual(pc.channel.basic_publish.call_count, 1)
+        lc.publish('log', {'log': 'l2'})
+        self.assertEqual(lc.channel.basic_publish.call_count, 1)
+
+    def test_07_sub_acks(self):
+        class A(object):
+            def update(self, indicator=None):
+                pass
+
+        sc = minemeld.comm.amqp.AMQPSubChannel('a', prefetch_count=10)
+        sc.add_listener(A(), ['update'])
+        sc.channel = mock.Mock()
+
+        msg = mock.Mock()
+        msg.delivery_tag = 1
+        msg.body = ujson.dumps({
+            'method': 'batch',
+            'params': {'messages': [
+                ['update', {'indicator': 'i1'}],
+                ['update', {'indicator': 'i2'}]
+            ]},
+            'timestamp': time.time()-1
+        })
+        sc._callback(msg)
+
+        sc.channel.basic_ack.assert_called_once_with(1)
+        stats = sc.stats()
+        self.assertEqual(stats['received'], 2)
+        self.assertGreaterEqual(stats['lag'], 1)
@@ -0,0 +1,188 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import gevent.monkey
+gevent.monkey.patch_all(thread=False, select=False)
+
+import unittest
+import tempfile
+import shutil
+import mock
+
+import gevent
+
+import minemeld.comm.local
+import minemeld.fabric
+import minemeld.ft.base
+
+
+class Listener(object):
+    def __init__(self):
+        self.calls = []
+
+    def update(self, source=None, indicator=None, value=None):
+        value['sources'].append('listener')
+        self.calls.append(('update', indicator, value))
+
+    def withdraw(self, source=None, indicator=None, value=None):
+        self.calls.append(('withdraw', indicator, value))
+
+    def checkpoint(self, source=None, value=None):
+        self.calls.append(('checkpoint', value))
+
+
+class MineMeldCommLocal(unittest.TestCase):
+    def test_pubsub(self):
+        l1 = Listener()
+        l2 = Listener()
+
+        sc = minemeld.comm.local.LocalSubChannel('a')
+        sc.add_listener(l1, ['update', 'withdraw', 'checkpoint'])
+        sc.add_listener(l2, ['update', 'withdraw', 'checkpoint'])
+        remote = mock.Mock()
+        pc = minemeld.comm.local.LocalPubChannel(
+            'a',
+            sub_channel=sc,
+            remote=remote
+        )
+        sc.start()
+
+        value = {'sources': ['a']}
+        pc.publish('update', {'source': 'a', 'indicator': 'i1',
+                              'value': value})
+        value['sources'].append('publisher')
+        pc.publish('withdraw', {'source': 'a', 'indicator': 'i1',
+                                'value': None})
+        pc.publish('checkpoint', {'source': 'a', 'value': 'c'})
+
+        # delivery is asynchronous
+        self.assertEqual(l1.calls, [])
+
+        gevent.sleep(0.1)
+        sc.stop()
+
+        for l in [l1, l2]:
+            self.assertEqual(l.calls, [
+                ('update', 'i1', {'sources': ['a', 'listener']}),
+                ('withdraw', 'i1', None),
+                ('checkpoint', 'c')
+            ])
+
+        self.assertEqual(remote.publish.call_count, 3)
+        self.assertEqual(remote.publish.call_args[0][0], 'checkpoint')
+
+    def test_fabric(self):
+        comm = mock.Mock()
+        with mock.patch('minemeld.comm.factory', return_value=comm):
+            f = minemeld.fabric.Fabric(None, {}, 'AMQP')
+        f.configure(['a', 'b', 'c'], remote_outputs=['b'])
+
+        l = Listener()
+        f.request_sub_channel('c', l, 'a', ['update'])
+        f.request_sub_channel('c', l, 'x', ['update'])
+        comm.request_sub_channel.assert_called_once_with(
+            'x', l, ['update']
+        )
+
+        pa = f.request_pub_channel('a')
+        pb = f.request_pub_channel('b')
+        f.request_pub_channel('x')
+        self.assertEqual(
+            [c[0][0] for c in comm.request_pub_channel.call_args_list],
+            ['b', 'x']
+        )
+        self.assertIsNone(pa.remote)
+        self.assertIsNotNone(pb.remote)
+
+        f.start()
+        pa.publish('update', {'indicator': 'i1', 'value': {'sources': []}})
+        gevent.sleep(0.1)
+        f.stop()
+
+        self.assertEqual(
+            l.calls,
+            [('update', 'i1', {'sources': ['listener']})]
+        )
+
+    def test_fabric_rpc_error(self):
+        class Dest(object):
+            def update_chunk(self, **kwargs):
+                raise RuntimeError('ko')
+
+        path = tempfile.mkdtemp(prefix='minemeld.commlocal')
+        try:
+            f = minemeld.fabric.Fabric(None, {'path': path}, 'UDS')
+            f.configure(['src', 'dest'])
+            f.request_rpc_channel('dest', Dest(), ['update_chunk'])
+            f.start()
+
+            chassis = mock.Mock()
+            chassis.send_rpc.side_effect = f.send_rpc
+
+            b = minemeld.ft.base.BaseFT('src', chassis, {})
+            b.connect([], False)
+
+            # the error of the remote node is returned to the caller
+            self.assertRaises(
+                RuntimeError,
+                b.stream_indicators,
+                'dest',
+                iter([('i1', {'v': 1})])
+            )
+
+            f.stop()
+
+        finally:
+            shutil.rmtree(path)
+
+    def test_fabric_no_local_delivery(self):
+        comm = mock.Mock()
+        with mock.patch('minemeld.comm.factory', return_value=comm):
+            f = minemeld.fabric.Fabric(None, {'local_delivery': False},
+                                       'AMQP')
+        f.configure(['a', 'b'])
+
+        f.request_sub_channel('b', None, 'a', ['update'])
+        self.assertEqual(f.request_pub_channel('a'),
+                         comm.request_pub_channel.return_value)
+        self.assertEqual(comm.request_sub_channel.call_count, 1)
+
+    def test_backpressure(self):
+        l = Listener()
+
+        sc = minemeld.comm.local.LocalSubChannel('a', queue_size=2)
+        sc.add_listener(l, ['withdraw'])
+        pc = minemeld.comm.local.LocalPubChannel('a', sub_channel=sc)
+
+        pc.publish('withdraw', {'indicator': 'i1'})
+        self.assertFalse(sc.congested())
+        pc.publish('withdraw', {'indicator': 'i2'})
+        self.assertTrue(sc.congested())
+        self.assertEqual(sc.stats()['pending'], 2)
+
+        # queue full, the publisher blocks
+        g = gevent.spawn(pc.publish, 'withdraw', {'indicator': 'i3'})
+        gevent.sleep(0.1)
+        self.assertFalse(g.ready())
+
+        sc.start()
+        g.join(timeout=1)
+        self.assertTrue(g.ready())
+        gevent.sleep(0.1)
+        sc.stop()
+
+        self.assertEqual([c[1] for c in l.calls], ['i1', 'i2', 'i3'])
+        stats = sc.stats()
+        self.assertEqual(stats['received'], 3)
+        self.assertEqual(stats['pending'], 0)
@@ -0,0 +1,199 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import gevent.monkey
+gevent.monkey.patch_all(thread=False, select=False)
+
+import unittest
+import tempfile
+import shutil
+import os.path
+
+import gevent
+
+import minemeld.comm
+import minemeld.comm.uds
+
+
+class MineMeldCommUDS(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='minemeld.commuds')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_01_rpc(self):
+        class A(object):
+            def f(self):
+                return 'ok'
+
+            def g(self):
+                raise RuntimeError('ko')
+
+        a = A()
+
+        ac = minemeld.comm.factory('UDS', {'path': self.path})
+        ac.request_rpc_server_channel('a', a, allowed_methods=['f', 'g'])
+        ac.start()
+
+        result = ac.send_rpc('a', 'f', {}, timeout=1)
+        self.assertEqual(result['result'], 'ok')
+
+        result = ac.send_rpc('a', 'g', {}, timeout=1)
+        self.assertEqual(result['error'], 'ko')
+
+        result = ac.send_rpc('a', 'h', {}, timeout=1)
+        self.assertEqual(result['error'], 'Method not allowed')
+
+        ac.stop()
+
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'rpc', 'a')))
+
+    def test_02_pubsub(self):
+        class A(object):
+            def __init__(self):
+                self.calls = []
+
+            def update(self, indicator=None):
+                self.calls.append(('update', indicator))
+
+            def checkpoint(self, value=None):
+                self.calls.append(('checkpoint', value))
+
+        a = A()
+
+        sc = minemeld.comm.factory('UDS', {'path': self.path})
+        sc.request_sub_channel('a', a, ['update', 'checkpoint'])
+        sc.start()
+
+        pc = minemeld.comm.factory('UDS', {
+            'path': self.path,
+            'batch_max_size': 2
+        })
+        p = pc.request_pub_channel('a')
+        pc.start()
+
+        gevent.sleep(0.3)
+        self.assertEqual(len(p.subscribers), 1)
+
+        p.publish('update', {'indicator': 'i1'})
+        p.publish('update', {'indicator': 'i2'})
+        p.publish('update', {'indicator': 'i3'})
+        p.publish('checkpoint', {'value': 'c'})
+        gevent.sleep(0.1)
+
+        self.assertEqual(a.calls, [
+            ('update', 'i1'),
+            ('update', 'i2'),
+            ('update', 'i3'),
+            ('checkpoint', 'c')
+        ])
+
+        # the sub channel connects again
+        pc.stop()
+        pc.start()
+        gevent.sleep(0.3)
+        p.publish('update', {'indicator': 'i4'})
+        p.flush()
+        gevent.sleep(0.1)
+        self.assertEqual(a.calls[-1], ('update', 'i4'))
+
+        pc.stop()
+        sc.stop()
+
+    def test_03_rpc_fanout(self):
+        class A(object):
+            def __init__(self, name):
+                self.name = name
+
+            def mgmtbus_f(self):
+                return self.name
+
+        ac1 = minemeld.comm.factory('UDS', {'path': self.path})
+        ac1.request_rpc_server_channel('a1', A('a1'), ['mgmtbus_f'],
+                                       method_prefix='mgmtbus_',
+                                       fanout='bus')
+        ac1.start()
+
+        ac2 = minemeld.comm.factory('UDS', {'path': self.path})
+        ac2.request_rpc_server_channel('a2', A('a2'), ['mgmtbus_f'],
+                                       method_prefix='mgmtbus_',
+                                       fanout='bus')
+        ac2.start()
+
+        mc = minemeld.comm.factory('UDS', {'path': self.path})
+        rfc = mc.request_rpc_fanout_client_channel('bus')
+        mc.start()
+
+        event = rfc.send_rpc('f', num_results=2)
+        result = event.get(timeout=1)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['answers'], {'a1': 'a1', 'a2': 'a2'})
+
+        mc.stop()
+        ac1.stop()
+        ac2.stop()
+
+    def test_04_multiple_publishers(self):
+        class A(object):
+            def __init__(self):
+                self.calls = []
+
+            def log(self, value=None):
+                self.calls.append(value)
+
+        a = A()
+
+        # publishers connected before the sub channel are not missed
+        pc1 = minemeld.comm.factory('UDS', {'path': self.path})
+        p1 = pc1.request_pub_channel('mbus:log')
+        pc1.start()
+
+        sc = minemeld.comm.factory('UDS', {'path': self.path})
+        sc.request_sub_channel('mbus:log', a, ['log'])
+        sc.start()
+
+        pc2 = minemeld.comm.factory('UDS', {'path': self.path})
+        p2 = pc2.request_pub_channel('mbus:log')
+        pc2.start()
+
+        self.assertNotEqual(p1.path, p2.path)
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.path, 'pub', 'mbus:log'))),
+            2
+        )
+
+        gevent.sleep(0.3)
+        self.assertEqual(len(p1.subscribers), 1)
+        self.assertEqual(len(p2.subscribers), 1)
+
+        p1.publish('log', {'value': 1})
+        p2.publish('log', {'value': 2})
+        p1.publish('log', {'value': 3})
+        gevent.sleep(0.1)
+
+        self.assertEqual(sorted(a.calls), [1, 2, 3])
+
+        # the other publisher is not affected when one stops
+        pc1.stop()
+        p2.publish('log', {'value': 4})
+        gevent.sleep(0.1)
+        self.assertEqual(a.calls[-1], 4)
+        self.assertEqual(
+            os.listdir(os.path.join(self.path, 'pub', 'mbus:log')),
+            [os.path.basename(p2.path)]
+        )
+
+        pc2.stop()
+        sc.stop()
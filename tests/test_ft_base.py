@@ -68,7 +68,8 @@ class MineMeldFTBaseTests(unittest.TestCase):
         for i in inputs:
             icalls.append(
                 mock.call(ftname, b, i,
-                          allowed_methods=['update', 'withdraw', 'checkpoint'])
+                          allowed_methods=['update', 'withdraw', 'checkpoint',
+                                           'batch'])
             )
 
         chassis.request_sub_channel.assert_has_calls(
@@ -81,6 +82,7 @@ class MineMeldFTBaseTests(unittest.TestCase):
             b,
             allowed_methods=[
                 'update',
+                'update_chunk',
                 'withdraw',
                 'checkpoint',
                 'get',
@@ -118,6 +120,7 @@ class MineMeldFTBaseTests(unittest.TestCase):
             b,
             allowed_methods=[
                 'update',
+                'update_chunk',
                 'withdraw',
                 'checkpoint',
                 'get',
@@ -164,6 +167,7 @@ class MineMeldFTBaseTests(unittest.TestCase):
             b,
             allowed_methods=[
                 'update',
+                'update_chunk',
                 'withdraw',
                 'checkpoint',
                 'get',
@@ -234,6 +238,7 @@ class MineMeldFTBaseTests(unittest.TestCase):
             b,
             allowed_methods=[
                 'update',
+                'update_chunk',
                 'withdraw',
                 'checkpoint',
                 'get',
@@ -266,3 +271,251 @@ class MineMeldFTBaseTests(unittest.TestCase):
         ochannel.publish.reset_mock()
         b.emit_update('testi', {'type': 'IPv6', 'direction': 'outbound'})
         self.assertEqual(ochannel.publish.call_count, 0)
+
+    def test_filters(self):
+        filters = minemeld.ft.base._Filters([
+            {
+                'name': 'no action',
+                'conditions': ["type == 'URL'"],
+                'actions': []
+            },
+            {
+                'name': 'drop low confidence',
+                'conditions': ["confidence < 50", "length(sources) > 0"],
+                'actions': ['drop']
+            },
+            {
+                'name': 'accept IPv4',
+                'conditions': ["type == 'IPv4'"],
+                'actions': ['accept']
+            },
+            {
+                'name': 'drop all',
+                'actions': ['drop']
+            }
+        ])
+        self.assertEqual(len(filters._compiled), 3)
+
+        value = {'type': 'IPv4', 'confidence': 60, 'sources': ['a']}
+        i, v = filters.apply(origin='a', method='update',
+                             indicator='1.1.1.1', value=value)
+        self.assertEqual(i, '1.1.1.1')
+        self.assertIs(v, value)
+        self.assertEqual(value,
+                         {'type': 'IPv4', 'confidence': 60, 'sources': ['a']})
+
+        # sources is missing, the drop filter does not match
+        value = {'type': 'IPv4', 'confidence': 60}
+        self.assertEqual(
+            filters.apply(indicator='1.1.1.1', value=value),
+            ('1.1.1.1', value)
+        )
+
+        value = {'type': 'IPv4', 'confidence': 10, 'sources': ['a']}
+        self.assertEqual(filters.apply(indicator='1.1.1.1', value=value),
+                         (None, None))
+        self.assertEqual(filters.apply(indicator='www.example.com',
+                                       value={'type': 'URL'}),
+                         (None, None))
+
+        filters = minemeld.ft.base._Filters([])
+        self.assertEqual(filters.apply(indicator='1.1.1.1', value=None),
+                         ('1.1.1.1', None))
+
+    def test_filters_index(self):
+        filters = minemeld.ft.base._Filters([
+            {
+                'name': 'accept withdraws',
+                'conditions': ["__method == 'withdraw'"],
+                'actions': ['accept']
+            },
+            {
+                'name': 'drop a',
+                'conditions': ["confidence < 50", "__origin == 'a'"],
+                'actions': ['drop']
+            },
+            {
+                'name': 'drop b',
+                'conditions': ["__origin == 'b'"],
+                'actions': ['drop']
+            },
+            {
+                'name': 'accept URL',
+                'conditions': ["type == 'URL'"],
+                'actions': ['accept']
+            },
+            {
+                'name': 'drop IPv4 from c',
+                'conditions': ["__origin != 'c'", "type != 'IPv4'"],
+                'actions': ['drop']
+            }
+        ])
+        self.assertEqual(filters._not_indexed, [4])
+        self.assertEqual(filters._index['__origin'], {'a': [1], 'b': [2]})
+        self.assertEqual(filters._index['__method'], {'withdraw': [0]})
+        self.assertEqual(filters._index['type'], {'URL': [3]})
+
+        self.assertEqual(
+            filters.apply(origin='a', method='update', indicator='i1',
+                          value={'type': 'URL', 'confidence': 10}),
+            (None, None)
+        )
+        self.assertEqual(
+            filters.apply(origin='a', method='withdraw', indicator='i1',
+                          value={'type': 'URL', 'confidence': 10}),
+            ('i1', {'type': 'URL', 'confidence': 10})
+        )
+        self.assertEqual(
+            filters.apply(origin='b', method='update', indicator='i1',
+                          value={'type': 'URL'}),
+            (None, None)
+        )
+        self.assertEqual(
+            filters.apply(origin='c', method='update', indicator='i1',
+                          value={'type': 'URL'}),
+            ('i1', {'type': 'URL'})
+        )
+        self.assertEqual(
+            filters.apply(origin='c', method='update', indicator='i1',
+                          value={'type': ['URL']}),
+            ('i1', {'type': ['URL']})
+        )
+        self.assertEqual(
+            filters.apply(origin='d', method='update', indicator='i1',
+                          value=None),
+            (None, None)
+        )
+
+        self.assertEqual(
+            [c[2] for c in filters._candidates[('c', 'update', 'URL')]],
+            [3, 4]
+        )
+        self.assertEqual(
+            [f['hits'] for f in filters.stats()],
+            [1, 1, 1, 1, 1]
+        )
+
+    def test_stream_indicators(self):
+        ftname = 'test'
+
+        config = {
+            'stream_chunk_size': 2,
+            'stream_window': 2
+        }
+        chassis = mock.Mock()
+        chassis.send_rpc.return_value = {'result': 'OK', 'error': None}
+
+        b = minemeld.ft.base.BaseFT(ftname, chassis, config)
+        b.connect([], False)
+
+        indicators = [('i%d' % j, {'v': j}) for j in range(5)]
+        self.assertEqual(b.stream_indicators('dest', iter(indicators)), 5)
+
+        self.assertEqual(chassis.send_rpc.call_count, 4)
+        chunks = [c[0][3] for c in chassis.send_rpc.call_args_list]
+        for c in chassis.send_rpc.call_args_list:
+            self.assertEqual(c[0][:3], (ftname, 'dest', 'update_chunk'))
+        self.assertEqual(len(set([c['stream'] for c in chunks])), 1)
+
+        self.assertEqual([c['seq'] for c in chunks], [0, 1, 2, 3])
+        self.assertEqual(
+            [i for c in chunks for i in c['indicators']],
+            [[i, v] for i, v in indicators]
+        )
+        self.assertEqual([c['cursor'] for c in chunks[:3]],
+                         ['i1', 'i3', 'i4'])
+        self.assertFalse(any(c['last'] for c in chunks[:3]))
+        self.assertTrue(chunks[3]['last'])
+        self.assertEqual(chunks[3]['indicators'], [])
+
+        # failed chunk
+        chassis.send_rpc.return_value = {'result': None, 'error': 'ko'}
+        self.assertRaises(
+            RuntimeError,
+            b.stream_indicators,
+            'dest',
+            iter(indicators)
+        )
+
+    def test_update_chunk(self):
+        chassis = mock.Mock()
+
+        b = minemeld.ft.base.BaseFT('test', chassis, {})
+        b.update = mock.Mock()
+
+        b.update_chunk(source='a', stream='s', seq=0,
+                       indicators=[['i1', {'v': 1}], ['i2', {'v': 2}]],
+                       cursor='i2')
+        b.update_chunk(source='a', stream='s', seq=1, indicators=[],
+                       last=True)
+
+        self.assertEqual(b.update.call_args_list, [
+            mock.call(source='a', indicator='i1', value={'v': 1}),
+            mock.call(source='a', indicator='i2', value={'v': 2})
+        ])
+
+    def test_trace_levels(self):
+        chassis = mock.Mock()
+        chassis.log.return_value = True
+
+        b = minemeld.ft.base.BaseFT('test', chassis, {'trace_level': 'off'})
+        b.state = minemeld.ft.ft_states.STARTED
+        b.trace('RECVD_UPDATE', 'i1', value={})
+        self.assertEqual(chassis.log.call_count, 0)
+
+        b = minemeld.ft.base.BaseFT('test', chassis,
+                                    {'trace_level': 'withdraw'})
+        b.state = minemeld.ft.ft_states.STARTED
+        b.trace('RECVD_UPDATE', 'i1', value={})
+        b.trace('RECVD_WITHDRAW', 'i1', value={})
+        self.assertEqual(chassis.log.call_count, 1)
+        self.assertEqual(chassis.log.call_args[1]['value']['op'],
+                         'RECVD_WITHDRAW')
+        b.length = mock.Mock(return_value=0)
+        self.assertEqual(b.mgmtbus_status()['trace_level'], 'withdraw')
+
+        chassis.log.return_value = False
+        b = minemeld.ft.base.BaseFT('test', chassis, {})
+        b.state = minemeld.ft.ft_states.STARTED
+        b.trace('RECVD_UPDATE', 'i1', value={})
+        self.assertEqual(b.statistics['trace.dropped'], 1)
+        self.assertEqual(b.statistics['trace.tx'], 0)
+
+        self.assertRaises(
+            ValueError,
+            minemeld.ft.base.BaseFT, 'test', chassis, {'trace_level': 'x'}
+        )
+
+    def test_trace_sampled(self):
+        config = {
+            'trace_level': 'sampled',
+            'trace_sample_rate': 0.1
+        }
+        indicators = ['10.0.0.%d' % j for j in range(256)]
+
+        traced = []
+        for j in range(2):
+            chassis = mock.Mock()
+            chassis.log.return_value = True
+
+            b = minemeld.ft.base.BaseFT('test%d' % j, chassis, config)
+            b.state = minemeld.ft.ft_states.STARTED
+            for i in indicators:
+                b.trace('RECVD_UPDATE', i, value={})
+                b.trace('ACCEPT_UPDATE', unicode(i), value={})
+
+            ntraced = b.statistics['trace.tx']
+            self.assertEqual(
+                ntraced+b.statistics['trace.sampled_out'],
+                2*len(indicators)
+            )
+            self.assertTrue(0 < ntraced < len(indicators))
+
+            # every op of the same indicator is traced
+            logged = [c[1]['value']['indicator']
+                      for c in chassis.log.call_args_list]
+            self.assertEqual(logged[0::2], logged[1::2])
+            traced.append(logged)
+
+        # nodes sample the same indicators
+        self.assertEqual(traced[0], traced[1])
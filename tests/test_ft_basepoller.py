@@ -26,9 +26,9 @@ import time
 import shutil
 import logging
 import gc
-import calendar
 
 import minemeld.ft.basepoller
+import minemeld.ft.table
 
 FTNAME = 'testft-%d' % int(time.time())
 
@@ -38,7 +38,7 @@ CUR_LOGICAL_TIME = 0
 
 
 def logical_millisec(*args):
-    return CUR_LOGICAL_TIME
+    return CUR_LOGICAL_TIME*1000
 
 
 def gevent_event_mock_factory():
@@ -155,7 +155,8 @@ class MineMeldFTBasePollerTests(unittest.TestCase):
     @mock.patch.object(gevent, 'spawn_later')
     @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
     @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
-    @mock.patch.object(calendar, 'timegm', side_effect=logical_millisec)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
     def test_delta_feed(self, um_mock, event_mock, sleep_mock, spawnl_mock, spawn_mock):
         global CUR_LOGICAL_TIME
 
@@ -177,7 +178,7 @@ class MineMeldFTBasePollerTests(unittest.TestCase):
         a.mgmtbus_initialize()
         a.start()
         self.assertEqual(spawnl_mock.call_count, 1)
-        self.assertEqual(spawn_mock.call_count, 1)
+        self.assertEqual(spawn_mock.call_count, 2)
 
         CUR_LOGICAL_TIME = 1
         a._age_out_run()
@@ -231,7 +232,8 @@ class MineMeldFTBasePollerTests(unittest.TestCase):
     @mock.patch.object(gevent, 'spawn_later')
     @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
     @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
-    @mock.patch.object(calendar, 'timegm', side_effect=logical_millisec)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
     def test_rolling_feed(self, um_mock, event_mock, sleep_mock,
                           spawnl_mock, spawn_mock):
         global CUR_LOGICAL_TIME
@@ -254,7 +256,7 @@ class MineMeldFTBasePollerTests(unittest.TestCase):
         a.mgmtbus_initialize()
         a.start()
         self.assertEqual(spawnl_mock.call_count, 1)
-        self.assertEqual(spawn_mock.call_count, 1)
+        self.assertEqual(spawn_mock.call_count, 2)
 
         CUR_LOGICAL_TIME = 1
         a._age_out_run()
@@ -308,7 +310,8 @@ class MineMeldFTBasePollerTests(unittest.TestCase):
     @mock.patch.object(gevent, 'spawn_later')
     @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
     @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
-    @mock.patch.object(calendar, 'timegm', side_effect=logical_millisec)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
     def test_permanent_feed(self, um_mock, event_mock,
                             sleep_mock, spawnl_mock, spawn_mock):
         global CUR_LOGICAL_TIME
@@ -331,7 +334,7 @@ class MineMeldFTBasePollerTests(unittest.TestCase):
         a.mgmtbus_initialize()
         a.start()
         self.assertEqual(spawnl_mock.call_count, 1)
-        self.assertEqual(spawn_mock.call_count, 1)
+        self.assertEqual(spawn_mock.call_count, 2)
 
         CUR_LOGICAL_TIME = 1
         a._age_out_run()
@@ -380,3 +383,311 @@ class MineMeldFTBasePollerTests(unittest.TestCase):
         ochannel = None
 
         gc.collect()
+
+    @mock.patch.object(gevent, 'spawn')
+    @mock.patch.object(gevent, 'spawn_later')
+    @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
+    @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
+    def test_generations(self, um_mock, event_mock,
+                         sleep_mock, spawnl_mock, spawn_mock):
+        global CUR_LOGICAL_TIME
+
+        chassis = mock.Mock()
+
+        iterators = [
+            ['A', 'B', 'C'],
+            ['B', 'C', 'D'],
+            ['B', 'D'],
+            ['B', 'D'],
+            ['B', 'D', 'E']
+        ]
+
+        a = RollingFeed(FTNAME, chassis)
+        a.iterators = iterators
+
+        a.connect([], False)
+        a.mgmtbus_initialize()
+        a.start()
+
+        CUR_LOGICAL_TIME = 1
+        a._age_out_run()
+
+        CUR_LOGICAL_TIME = 2
+        a._run()
+        self.assertEqual(a.statistics['added'], 3)
+        slots = [a.table.get(i)['_slot'] for i in ['A', 'B', 'C']]
+        self.assertEqual(sorted(slots), [0, 1, 2])
+        self.assertNotIn('_last_run', a.table.get('B'))
+
+        bversion = a.table._get(a.table._indicator_key_version('B'))
+
+        CUR_LOGICAL_TIME = 3
+        a._run()
+        self.assertEqual(a.statistics['added'], 4)
+        self.assertEqual(a.statistics['removed'], 1)
+        self.assertEqual(a.table.get('A')['_age_out'], 3000-1)
+
+        # unchanged indicators are not rewritten
+        self.assertEqual(
+            a.table._get(a.table._indicator_key_version('B')),
+            bversion
+        )
+
+        a.stop()
+        a.table.close()
+
+        # generations are restored from the table
+        a = RollingFeed(FTNAME, chassis)
+        a.iterators = iterators
+        a.cur_iterator = 2
+        a.connect([], False)
+        a.mgmtbus_initialize()
+        a.start()
+        a.last_ageout_run = CUR_LOGICAL_TIME
+
+        CUR_LOGICAL_TIME = 4
+        a._run()
+        self.assertEqual(a.statistics.get('added', 0), 0)
+        self.assertEqual(a.statistics['removed'], 1)
+        self.assertEqual(a.table.get('C')['_age_out'], 4000-1)
+
+        CUR_LOGICAL_TIME = 5
+        a._age_out_run()
+        self.assertEqual(a.statistics['aged_out'], 2)
+
+        CUR_LOGICAL_TIME = 6
+        a._run()
+        self.assertEqual(a.statistics['garbage_collected'], 2)
+        self.assertEqual(a.length(), 2)
+
+        # free slots are reused
+        CUR_LOGICAL_TIME = 7
+        a._run()
+        self.assertIn(a.table.get('E')['_slot'], [0, 2])
+
+        a.stop()
+        a.table.close()
+
+        a = None
+        chassis = None
+
+        gc.collect()
+
+    @mock.patch.object(gevent, 'spawn')
+    @mock.patch.object(gevent, 'spawn_later')
+    @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
+    @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
+    def test_failed_poll(self, um_mock, event_mock,
+                         sleep_mock, spawnl_mock, spawn_mock):
+        global CUR_LOGICAL_TIME
+
+        def _failing_iterator():
+            yield 'A'
+            raise RuntimeError('poll failed')
+
+        chassis = mock.Mock()
+
+        a = RollingFeed(FTNAME, chassis)
+        a.iterators = [
+            ['A', 'B', 'C'],
+            _failing_iterator(),
+            ['B', 'C']
+        ]
+
+        a.connect([], False)
+        a.mgmtbus_initialize()
+        a.start()
+
+        CUR_LOGICAL_TIME = 1
+        a._age_out_run()
+
+        CUR_LOGICAL_TIME = 2
+        a._run()
+        self.assertEqual(a.statistics['added'], 3)
+
+        CUR_LOGICAL_TIME = 3
+        self.assertRaises(gevent.GreenletExit, a._run)
+        self.assertEqual(a.statistics['error.polling'], 1)
+        self.assertEqual(a.statistics.get('removed', 0), 0)
+
+        # marks of the failed run are discarded, A is not in the feed
+        CUR_LOGICAL_TIME = 4
+        a._run()
+        self.assertEqual(a.statistics['removed'], 1)
+        self.assertEqual(a.table.get('A')['_age_out'], 4000-1)
+
+        a.stop()
+        a.table.close()
+
+    @mock.patch.object(gevent, 'spawn')
+    @mock.patch.object(gevent, 'spawn_later')
+    @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
+    @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
+    def test_sudden_death_stale_slot(self, um_mock, event_mock,
+                                     sleep_mock, spawnl_mock, spawn_mock):
+        chassis = mock.Mock()
+
+        a = RollingFeed(FTNAME, chassis)
+        a.connect([], False)
+        a.mgmtbus_initialize()
+
+        a.table.put('X', {'_slot': 5, '_age_out': 10000})
+        a.table.delete('X')
+        a.table.put('Y', {'_slot': 5, '_age_out': 10000})
+        a.table.put('X', {'_slot': 9, '_age_out': 10000})
+
+        a.generations.removed = mock.Mock(return_value=[5])
+        a.generations.prev_valid = True
+        a._sudden_death(1000)
+
+        self.assertEqual(a.table.get('X')['_age_out'], 10000)
+        self.assertEqual(a.table.get('Y')['_age_out'], 999)
+        self.assertEqual(a.statistics['removed'], 1)
+
+        a.table.close()
+
+    @mock.patch.object(gevent, 'spawn')
+    @mock.patch.object(gevent, 'spawn_later')
+    @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
+    @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
+    def test_last_run_migration(self, um_mock, event_mock,
+                                sleep_mock, spawnl_mock, spawn_mock):
+        global CUR_LOGICAL_TIME
+
+        # table written by the versions before generations
+        t = minemeld.ft.table.Table(FTNAME, truncate=True)
+        t.create_index('_last_run')
+        t.create_index('_age_out')
+        t.put('A', {'_last_run': 2000, '_age_out': 100000,
+               'last_seen': 2000})
+        t.put('B', {'_last_run': 3000, '_age_out': 100000,
+               'last_seen': 3000})
+        t.put('C', {'_last_run': 3000, '_age_out': 100000,
+               'last_seen': 3000})
+        t.close()
+        t = None
+
+        chassis = mock.Mock()
+
+        a = RollingFeed(FTNAME, chassis)
+        a.iterators = [['B']]
+        a.connect([], False)
+        a.mgmtbus_initialize()
+        a.start()
+
+        self.assertNotIn('_last_run', a.table.indexes)
+        for i in ['A', 'B', 'C']:
+            v = a.table.get(i)
+            self.assertNotIn('_last_run', v)
+            self.assertIn('_slot', v)
+        self.assertEqual(a.generations.generation, 3000)
+
+        CUR_LOGICAL_TIME = 3
+        a._age_out_run()
+
+        # only C was in the feed of the last legacy run
+        CUR_LOGICAL_TIME = 4
+        a._run()
+        self.assertEqual(a.statistics['removed'], 1)
+        self.assertEqual(a.table.get('C')['_age_out'], 4000-1)
+        self.assertEqual(a.table.get('A')['_age_out'], 100000)
+        self.assertNotEqual(a.table.get('B')['_age_out'], 4000-1)
+
+        a.stop()
+        a.table.close()
+
+    @mock.patch.object(gevent, 'spawn')
+    @mock.patch.object(gevent, 'spawn_later')
+    @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
+    @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
+    def test_sudden_death_stale_generation(self, um_mock, event_mock,
+                                           sleep_mock, spawnl_mock,
+                                           spawn_mock):
+        global CUR_LOGICAL_TIME
+
+        chassis = mock.Mock()
+
+        a = RollingFeed(FTNAME, chassis)
+        a.iterators = [['A', 'B']]
+        a.connect([], False)
+        a.mgmtbus_initialize()
+        a.start()
+
+        CUR_LOGICAL_TIME = 1
+        a._age_out_run()
+
+        CUR_LOGICAL_TIME = 2
+        a._run()
+        self.assertEqual(a.statistics['added'], 2)
+
+        a.stop()
+        a.table.close()
+
+        # after a restart the previous generation is too old, nothing
+        # is removed by sudden death
+        a = RollingFeed(FTNAME, chassis)
+        a.iterators = [['B']]
+        a.interval = 1
+        a.connect([], False)
+        a.mgmtbus_initialize()
+        a.start()
+        a.last_ageout_run = CUR_LOGICAL_TIME
+
+        CUR_LOGICAL_TIME = 10
+        a._run()
+        self.assertFalse(a.generations.in_feed(
+            a.table.get('A')['_slot']
+        ))
+        self.assertEqual(a.statistics.get('removed', 0), 0)
+        self.assertEqual(a.table.get('A')['_age_out'], 2000+4000)
+
+        a.stop()
+        a.table.close()
+
+    @mock.patch.object(gevent, 'spawn')
+    @mock.patch.object(gevent, 'spawn_later')
+    @mock.patch.object(gevent, 'sleep', side_effect=gevent.GreenletExit())
+    @mock.patch('gevent.event.Event', side_effect=gevent_event_mock_factory)
+    @mock.patch.object(minemeld.ft.basepoller, 'utc_millisec',
+                       side_effect=logical_millisec)
+    def test_fetch_outside_batch(self, um_mock, event_mock,
+                                 sleep_mock, spawnl_mock, spawn_mock):
+        global CUR_LOGICAL_TIME
+
+        batches = []
+
+        def _iterator():
+            for i in ['A', 'B', 'C']:
+                # no write batch is open while fetching
+                batches.append(a.table._batch)
+                yield i
+
+        chassis = mock.Mock()
+
+        a = RollingFeed(FTNAME, chassis)
+        a.connect([], False)
+        a.mgmtbus_initialize()
+        a.start()
+        a.iterators = [_iterator()]
+
+        CUR_LOGICAL_TIME = 1
+        a._age_out_run()
+
+        CUR_LOGICAL_TIME = 2
+        a._run()
+        self.assertEqual(a.statistics['added'], 3)
+        self.assertEqual(batches, [None, None, None])
+        self.assertEqual(a.table._batch, None)
+
+        a.stop()
+        a.table.close()
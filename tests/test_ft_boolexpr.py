@@ -134,3 +134,42 @@ class MineMeldFTBaseTests(unittest.TestCase):
 
         c = minemeld.ft.condition.Condition("type == 'IPv4'")
         self.assertTrue(c.eval(i))
+
+    def test_compile(self):
+        values = [
+            None,
+            {},
+            {'sources': [1, 2], 'type': 'IPv4', 'confidence': 50},
+            {'type': 'URL', 'confidence': 100, '__indicator': 'x'}
+        ]
+        conditions = [
+            "type == 'IPv4'",
+            "confidence > 60",
+            "b == null",
+            "length(sources) > 1",
+            "__indicator == '1.1.1.1'",
+            "__method == 'update'",
+            "__origin != 'a'",
+            "starts_with(__indicator, '1.') == true",
+            "contains(sources, __origin) == false"
+        ]
+
+        for cs in conditions:
+            c = minemeld.ft.condition.Condition(cs)
+            cc = c.compile()
+
+            for v in values:
+                for i, m, o in [('1.1.1.1', 'update', 'a'),
+                                ('2.2.2.2', 'withdraw', None)]:
+                    d = {} if v is None else dict(v)
+                    d['__indicator'] = i
+                    d['__method'] = m
+                    if o is not None:
+                        d['__origin'] = o
+
+                    self.assertEqual(cc(v, i, m, o), c.eval(d), cs)
+
+        c = minemeld.ft.condition.Condition("type == 'IPv4'")
+        self.assertEqual(c.identifier, 'type')
+        c = minemeld.ft.condition.Condition("length(type) == 4")
+        self.assertIsNone(c.identifier)
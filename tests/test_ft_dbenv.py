@@ -0,0 +1,170 @@
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""FT dbenv tests
+
+Unit tests for minemeld.ft.dbenv
+"""
+
+import unittest
+import tempfile
+import shutil
+import os.path
+
+import minemeld.ft.dbenv
+import minemeld.ft.table
+import minemeld.ft.st
+
+TABLENAME = tempfile.mktemp(prefix='minemeld.ftdbenvtest')
+SHAREDNAME = tempfile.mktemp(prefix='minemeld.ftdbenvsharedtest')
+
+
+class MineMeldFTDBEnvTests(unittest.TestCase):
+    def setUp(self):
+        for p in [TABLENAME, TABLENAME+'_st', SHAREDNAME]:
+            try:
+                shutil.rmtree(p)
+            except:
+                pass
+
+    def tearDown(self):
+        minemeld.ft.dbenv.configure({}, [])
+
+        for p in [TABLENAME, TABLENAME+'_st', SHAREDNAME]:
+            try:
+                shutil.rmtree(p)
+            except:
+                pass
+
+    def test_memory_budget(self):
+        env = minemeld.ft.dbenv.StorageEnvironment(
+            memory_budget=(64 << 20),
+            nodes={
+                'n1': ['n1'],
+                'n2': ['n2', 'n2_uuid', 'n2_st', 'n2_temp'],
+                'n3': [],
+                'n4': ['n4_0', 'n4_1'],
+                'n5': ['n5']
+            }
+        )
+        options = env._db_options('n1')
+        self.assertEqual(options['lru_cache_size'], 12 << 20)
+        self.assertEqual(options['write_buffer_size'], 4 << 20)
+        options = env._db_options('n2_st')
+        self.assertEqual(options['lru_cache_size'], 3 << 20)
+        self.assertEqual(options['write_buffer_size'], 1 << 20)
+        options = env._db_options('n4_1')
+        self.assertEqual(options['lru_cache_size'], 6 << 20)
+        self.assertEqual(options['write_buffer_size'], 2 << 20)
+
+        # the DBs of all the nodes fit in the budget
+        total = 0
+        for dbs in env.nodes.values():
+            for db in dbs:
+                options = env._db_options(db)
+                total += options['lru_cache_size']
+                total += options['write_buffer_size']
+        self.assertLessEqual(total, 64 << 20)
+
+        # undeclared DBs get the minimum sizes
+        options = env._db_options('n1_other')
+        self.assertEqual(options['lru_cache_size'], 1 << 20)
+        self.assertEqual(options['write_buffer_size'], 1 << 20)
+
+        env = minemeld.ft.dbenv.StorageEnvironment(
+            memory_budget=(4 << 20),
+            nodes=dict(('n%d' % n, ['n%d' % n]) for n in range(16)),
+            max_open_files=100
+        )
+        options = env._db_options('n0')
+        self.assertEqual(options['lru_cache_size'], 1 << 20)
+        self.assertEqual(options['write_buffer_size'], 1 << 20)
+        self.assertEqual(options['max_open_files'], 100)
+
+        env = minemeld.ft.dbenv.StorageEnvironment()
+        self.assertEqual(env._db_options(), {})
+
+    def test_usage(self):
+        minemeld.ft.dbenv.configure(
+            {'memory_budget': (16 << 20)},
+            {
+                TABLENAME: [TABLENAME, TABLENAME+'_st'],
+                TABLENAME+'_st': [TABLENAME+'_st_other']
+            }
+        )
+
+        table = minemeld.ft.table.Table(TABLENAME, truncate=True)
+        st = minemeld.ft.st.ST(TABLENAME+'_st', 32, truncate=True)
+        table.put('a', {'a': 1})
+
+        usage = minemeld.ft.dbenv.usage(TABLENAME)
+        self.assertEqual(
+            sorted(usage.keys()),
+            [TABLENAME, TABLENAME+'_st']
+        )
+        self.assertEqual(usage[TABLENAME]['lru_cache_size'], 3 << 20)
+        self.assertEqual(usage[TABLENAME]['write_buffer_size'], 1 << 20)
+        self.assertGreater(usage[TABLENAME]['memory_usage'], 0)
+
+        # the DBs of a node are not reported by the nodes whose name
+        # is a prefix of the DB names
+        self.assertEqual(minemeld.ft.dbenv.usage(TABLENAME+'_st'), {})
+        self.assertEqual(minemeld.ft.dbenv.usage('other'), {})
+
+        st.close()
+        st = None
+        table.close()
+        table = None
+
+        # the environment does not keep the tables alive
+        self.assertEqual(minemeld.ft.dbenv.usage(TABLENAME), {})
+
+    def test_shared(self):
+        minemeld.ft.dbenv.configure(
+            {'shared': True, 'path': SHAREDNAME},
+            [TABLENAME+'1', TABLENAME+'2']
+        )
+
+        t1 = minemeld.ft.table.Table(TABLENAME+'1', truncate=True)
+        t2 = minemeld.ft.table.Table(TABLENAME+'2', truncate=True)
+        t1.create_index('a')
+
+        t1.put('i', {'a': 1})
+        t2.put('i', {'a': 2})
+        self.assertEqual(t1.get('i'), {'a': 1})
+        self.assertEqual(t2.get('i'), {'a': 2})
+        self.assertEqual(t1.num_indicators, 1)
+        self.assertEqual(t2.num_indicators, 1)
+        self.assertEqual(
+            list(t1.query(index='a', include_value=True, snapshot=True)),
+            [('i', {'a': 1})]
+        )
+
+        self.assertFalse(os.path.exists(TABLENAME+'1'))
+        self.assertTrue(os.path.exists(SHAREDNAME))
+
+        t1.close()
+        t1 = None
+        t1 = minemeld.ft.table.Table(TABLENAME+'1')
+        self.assertEqual(t1.get('i'), {'a': 1})
+        t1 = None
+
+        # truncate removes only the keys of the table
+        t1 = minemeld.ft.table.Table(TABLENAME+'1', truncate=True)
+        self.assertEqual(t1.get('i'), None)
+        self.assertEqual(t1.num_indicators, 0)
+        self.assertEqual(t2.get('i'), {'a': 2})
+
+        usage = minemeld.ft.dbenv.usage(TABLENAME+'2')
+        self.assertTrue(usage[TABLENAME+'2']['shared'])
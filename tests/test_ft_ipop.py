@@ -35,6 +35,7 @@ import gc  # noqa
 from nose.plugins.attrib import attr
 
 import minemeld.ft.ipop
+import minemeld.ft.memst
 
 LOG = logging.getLogger(__name__)
 FTNAME = 'testft-%d' % int(time.time())
@@ -105,6 +106,11 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         except:
             pass
 
+        try:
+            shutil.rmtree(FTNAME+"_uuid")
+        except:
+            pass
+
     def tearDown(self):
         try:
             shutil.rmtree(FTNAME)
@@ -116,6 +122,11 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         except:
             pass
 
+        try:
+            shutil.rmtree(FTNAME+"_uuid")
+        except:
+            pass
+
     def test_calc_ipranges(self):
         config = {}
         chassis = mock.Mock()
@@ -253,6 +264,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_uwl(self):
@@ -327,6 +339,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_uwl2(self):
@@ -408,6 +421,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_uwl3(self):
@@ -515,6 +529,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_overlap_by_one(self):
@@ -589,6 +604,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_overlap_by_lastrange(self):
@@ -659,6 +675,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_3overlaps(self):
@@ -763,6 +780,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_attr_override(self):
@@ -824,6 +842,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_uw(self):
@@ -887,6 +906,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_2uw(self):
@@ -959,6 +979,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     def test_updated_indicator(self):
@@ -1028,6 +1049,416 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
+        a = None
+
+    def test_uuid_table_rebuild(self):
+        config = {}
+        chassis = mock.Mock()
+
+        ochannel = mock.Mock()
+        chassis.request_pub_channel.return_value = ochannel
+
+        rpcmock = mock.Mock()
+        rpcmock.get.return_value = {'error': None, 'result': 'OK'}
+        chassis.send_rpc.return_value = rpcmock
+
+        a = minemeld.ft.ipop.AggregateIPv4FT(FTNAME, chassis, config)
+
+        inputs = ['s1', 's2']
+        output = True
+
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        a.update('s1', indicator='192.168.0.0/24', value={
+            'type': 'IPv4',
+            'sources': ['s1s'],
+            's1$a': 1
+        })
+        a.update('s2', indicator='192.168.0.0/24', value={
+            'type': 'IPv4',
+            'sources': ['s2s'],
+            's2$a': 1
+        })
+        uuids = [
+            a.table.get('192.168.0.0/24\x00s1')['_id'],
+            a.table.get('192.168.0.0/24\x00s2')['_id']
+        ]
+
+        a.stop()
+        a.table.db.close()
+        a.st.db.close()
+        a.uuid_table.db.close()
+        a = None
+
+        # tables written by the previous versions have no uuid table
+        shutil.rmtree(FTNAME+'_uuid')
+
+        a = minemeld.ft.ipop.AggregateIPv4FT(FTNAME, chassis, config)
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        self.assertEqual(a.uuid_table.num_indicators, 2)
+        value = a._calc_indicator_value(uuids)
+        self.assertEqual(value['s1$a'], 1)
+        self.assertEqual(value['s2$a'], 1)
+        self.assertEqual(sorted(value['sources']), ['s1s', 's2s'])
+
+        # merged values are cached until one of the uuids changes
+        a._calc_indicator_value(uuids)
+        self.assertEqual(a.merged_values.hits, 1)
+
+        a.update('s2', indicator='192.168.0.0/24', value={
+            'type': 'IPv4',
+            'sources': ['s2s'],
+            's2$a': 2
+        })
+        value = a._calc_indicator_value(uuids)
+        self.assertEqual(value['s2$a'], 2)
+
+        a.stop()
+        a.table.db.close()
+        a.st.db.close()
+        a.uuid_table.db.close()
+        a = None
+
+    def test_merged_values_cache(self):
+        cache = minemeld.ft.ipop._MergedValuesCache(2)
+
+        k1 = frozenset(['u1', 'u2'])
+        k2 = frozenset(['u2', 'u3'])
+        k3 = frozenset(['u4'])
+        cache.put(k1, {'a': 1})
+        cache.put(k2, {'a': 2})
+        self.assertEqual(cache.get(k1), {'a': 1})
+
+        # k2 is the least recently used entry
+        cache.put(k3, {'a': 3})
+        self.assertEqual(cache.get(k2), None)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(
+            cache.by_uuid,
+            {'u1': set([k1]), 'u2': set([k1]), 'u4': set([k3])}
+        )
+
+        cache.invalidate('u2')
+        self.assertEqual(cache.get(k1), None)
+        self.assertEqual(cache.get(k3), {'a': 3})
+        self.assertEqual(cache.by_uuid, {'u4': set([k3])})
+
+    def test_random_deltas(self):
+        config = {
+            'whitelist_prefixes': ['wl']
+        }
+        chassis = mock.Mock()
+
+        ochannel = mock.Mock()
+        chassis.request_pub_channel.return_value = ochannel
+
+        rpcmock = mock.Mock()
+        rpcmock.get.return_value = {'error': None, 'result': 'OK'}
+        chassis.send_rpc.return_value = rpcmock
+
+        a = minemeld.ft.ipop.AggregateIPv4FT(FTNAME, chassis, config)
+
+        inputs = ['s1', 's2', 'wl']
+        output = True
+
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        # the ranges emitted as deltas match a full recomputation
+        base = int(netaddr.IPAddress('10.0.0.0'))
+        emitted = set()
+        indicators = []
+        for j in xrange(300):
+            ochannel.publish.reset_mock()
+
+            if len(indicators) != 0 and random.randint(0, 3) == 0:
+                source, indicator = indicators.pop(
+                    random.randint(0, len(indicators)-1)
+                )
+                a.withdraw(source, indicator=indicator)
+
+            else:
+                start = base+random.randint(0, 63)
+                end = start+random.randint(0, 15)
+                source = random.choice(inputs)
+                indicator = '%s-%s' % (netaddr.IPAddress(start),
+                                       netaddr.IPAddress(end))
+                a.update(source, indicator=indicator, value={
+                    'type': 'IPv4',
+                    'sources': [source]
+                })
+                if (source, indicator) not in indicators:
+                    indicators.append((source, indicator))
+
+            for call in ochannel.publish.call_args_list:
+                method, params = call[0][:2]
+                if method == 'update':
+                    emitted.add(params['indicator'])
+                elif method == 'withdraw':
+                    emitted.discard(params['indicator'])
+
+            expected = set(
+                u.indicator() for u in a._calc_ipranges(0, 0xFFFFFFFF)
+            )
+            self.assertEqual(emitted, expected)
+
+        a.stop()
+        a.table.db.close()
+        a.st.db.close()
+        a.uuid_table.db.close()
+        a = None
+
+    def test_cidr_output(self):
+        config = {
+            'whitelist_prefixes': ['wl'],
+            'output_mode': 'cidr'
+        }
+        chassis = mock.Mock()
+
+        ochannel = mock.Mock()
+        chassis.request_pub_channel.return_value = ochannel
+
+        rpcmock = mock.Mock()
+        rpcmock.get.return_value = {'error': None, 'result': 'OK'}
+        chassis.send_rpc.return_value = rpcmock
+
+        a = minemeld.ft.ipop.AggregateIPv4FT(FTNAME, chassis, config)
+
+        inputs = ['s1', 's2', 'wl']
+        output = True
+
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        a.update('s1', indicator='10.0.0.0-10.0.0.255', value={
+            'type': 'IPv4',
+            'sources': ['s1s'],
+            's1$a': 1
+        })
+        self.assertTrue(check_for_rpc(
+            ochannel.publish.call_args_list,
+            [
+                {
+                    'method': 'update',
+                    'indicator': '10.0.0.0/24',
+                    'value': {
+                        's1$a': 1
+                    }
+                }
+            ],
+            all_here=True
+        ))
+
+        ochannel.publish.reset_mock()
+        a.update('wl', indicator='10.0.0.0/25', value={
+            'type': 'IPv4',
+            'sources': ['wls']
+        })
+        self.assertTrue(check_for_rpc(
+            ochannel.publish.call_args_list,
+            [
+                {
+                    'method': 'update',
+                    'indicator': '10.0.0.128/25'
+                },
+                {
+                    'method': 'withdraw',
+                    'indicator': '10.0.0.0/24'
+                }
+            ],
+            all_here=True
+        ))
+
+        ochannel.publish.reset_mock()
+        a.withdraw('wl', indicator='10.0.0.0/25')
+        self.assertTrue(check_for_rpc(
+            ochannel.publish.call_args_list,
+            [
+                {
+                    'method': 'update',
+                    'indicator': '10.0.0.0/24'
+                },
+                {
+                    'method': 'withdraw',
+                    'indicator': '10.0.0.128/25'
+                }
+            ],
+            all_here=True
+        ))
+
+        # 10.0.0.0/24 is updated, 10.0.1.0/24 is added
+        ochannel.publish.reset_mock()
+        a.update('s2', indicator='10.0.0.0-10.0.1.255', value={
+            'type': 'IPv4',
+            'sources': ['s2s'],
+            's2$a': 1
+        })
+        self.assertTrue(check_for_rpc(
+            ochannel.publish.call_args_list,
+            [
+                {
+                    'method': 'update',
+                    'indicator': '10.0.0.0/24',
+                    'value': {
+                        's1$a': 1,
+                        's2$a': 1
+                    }
+                },
+                {
+                    'method': 'update',
+                    'indicator': '10.0.1.0/24',
+                    'value': {
+                        's2$a': 1
+                    }
+                }
+            ],
+            all_here=True
+        ))
+
+        a.stop()
+        a.table.db.close()
+        a.st.db.close()
+        a.uuid_table.db.close()
+        a = None
+
+    def test_ipv6_uwl(self):
+        config = {
+            'whitelist_prefixes': ['s2']
+        }
+        chassis = mock.Mock()
+
+        ochannel = mock.Mock()
+        chassis.request_pub_channel.return_value = ochannel
+
+        rpcmock = mock.Mock()
+        rpcmock.get.return_value = {'error': None, 'result': 'OK'}
+        chassis.send_rpc.return_value = rpcmock
+
+        a = minemeld.ft.ipop.AggregateIPv6FT(FTNAME, chassis, config)
+
+        inputs = ['s1', 's2']
+        output = True
+
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        # IPv4 indicators are dropped
+        a.update('s1', indicator='192.168.0.0/16', value={
+            'type': 'IPv4',
+            'sources': ['s1s']
+        })
+        a.update('s1', indicator='192.168.0.0/16', value={
+            'type': 'IPv6',
+            'sources': ['s1s']
+        })
+        self.assertEqual(ochannel.publish.call_count, 0)
+
+        a.update('s1', indicator='2001:db8::/32', value={
+            'type': 'IPv6',
+            'sources': ['s1s'],
+            's1$a': 1
+        })
+        self.assertTrue(
+            check_for_rpc(
+                ochannel.publish.call_args_list,
+                [
+                    {
+                        'method': 'update',
+                        'indicator': '2001:db8::-2001:db8:ffff:ffff:ffff:'
+                                     'ffff:ffff:ffff',
+                        'value': {
+                            's1$a': 1
+                        }
+                    }
+                ],
+                all_here=True
+            )
+        )
+
+        ochannel.publish.reset_mock()
+        a.update('s2', indicator='2001:db8::/48', value={
+            'type': 'IPv6',
+            'sources': ['s2s']
+        })
+        self.assertTrue(
+            check_for_rpc(
+                ochannel.publish.call_args_list,
+                [
+                    {
+                        'method': 'update',
+                        'indicator': '2001:db8:1::-2001:db8:ffff:ffff:ffff:'
+                                     'ffff:ffff:ffff',
+                        'value': {
+                            's1$a': 1
+                        }
+                    },
+                    {
+                        'method': 'withdraw',
+                        'indicator': '2001:db8::-2001:db8:ffff:ffff:ffff:'
+                                     'ffff:ffff:ffff'
+                    }
+                ],
+                all_here=True
+            )
+        )
+
+        ochannel.publish.reset_mock()
+        a.withdraw('s2', indicator='2001:db8::/48')
+        self.assertTrue(
+            check_for_rpc(
+                ochannel.publish.call_args_list,
+                [
+                    {
+                        'method': 'update',
+                        'indicator': '2001:db8::-2001:db8:ffff:ffff:ffff:'
+                                     'ffff:ffff:ffff',
+                        'value': {
+                            's1$a': 1
+                        }
+                    },
+                    {
+                        'method': 'withdraw',
+                        'indicator': '2001:db8:1::-2001:db8:ffff:ffff:ffff:'
+                                     'ffff:ffff:ffff'
+                    }
+                ],
+                all_here=True
+            )
+        )
+
+        ochannel.publish.reset_mock()
+        a.update('s1', indicator='ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff',
+                 value={
+                     'type': 'IPv6',
+                     'sources': ['s1s']
+                 })
+        self.assertTrue(
+            check_for_rpc(
+                ochannel.publish.call_args_list,
+                [
+                    {
+                        'method': 'update',
+                        'indicator': 'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff-'
+                                     'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'
+                    }
+                ],
+                all_here=True
+            )
+        )
+
+        a.stop()
+        a.table.db.close()
+        a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     @attr('slow')
@@ -1099,6 +1530,7 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
 
     @attr('slow')
@@ -1151,4 +1583,21 @@ class MineMeldFTIPOpTests(unittest.TestCase):
         a.stop()
         a.table.db.close()
         a.st.db.close()
+        a.uuid_table.db.close()
         a = None
+
+
+class MineMeldFTIPOpMemorySTTests(MineMeldFTIPOpTests):
+    def setUp(self):
+        super(MineMeldFTIPOpMemorySTTests, self).setUp()
+
+        self.engines_patch = mock.patch.dict(
+            minemeld.ft.ipop.ST_ENGINES,
+            {'leveldb': minemeld.ft.memst.MemoryST}
+        )
+        self.engines_patch.start()
+
+    def tearDown(self):
+        self.engines_patch.stop()
+
+        super(MineMeldFTIPOpMemorySTTests, self).tearDown()
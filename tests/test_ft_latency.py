@@ -0,0 +1,205 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""FT latency tests
+
+Unit tests for minemeld.ft.latency
+"""
+
+import unittest
+import tempfile
+import shutil
+import mock
+
+import gevent
+
+import minemeld.ft.latency
+import minemeld.ft.table
+import minemeld.ft.base
+import minemeld.ft
+
+TABLENAME = tempfile.mktemp(prefix='minemeld.ftlatencytest')
+
+
+class MineMeldFTLatencyTests(unittest.TestCase):
+    def setUp(self):
+        try:
+            shutil.rmtree(TABLENAME)
+        except:
+            pass
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(TABLENAME)
+        except:
+            pass
+
+    def test_histogram(self):
+        h = minemeld.ft.latency.Histogram()
+        self.assertEqual(h.statistics()['p50'], None)
+
+        for _ in range(98):
+            h.add(0.000003)
+        h.add(0.001)
+        h.add(1000)
+
+        self.assertEqual(h.buckets[2], 98)
+        self.assertEqual(h.buckets[10], 1)
+        self.assertEqual(h.buckets[-1], 1)
+
+        s = h.statistics()
+        self.assertEqual(s['count'], 100)
+        self.assertEqual(s['p50'], 4)
+        self.assertEqual(s['p99'], 1024)
+        self.assertAlmostEqual(s['avg'], (98*0.000003+0.001+1000)*1e4)
+
+    def test_table(self):
+        table = minemeld.ft.table.Table(TABLENAME)
+        table.put('k1', {'a': 1})
+        table.get('k1')
+        table.get('k2')
+        table.delete('k1')
+
+        s = minemeld.ft.latency.statistics(table.latency)
+        self.assertEqual(sorted(s.keys()), ['delete', 'get', 'put'])
+        self.assertEqual(s['get']['count'], 2)
+
+        table.close()
+
+    def test_node(self):
+        class Node(minemeld.ft.base.BaseFT):
+            def length(self, source=None):
+                return 0
+
+            @minemeld.ft.base._counting('update.processed')
+            def filtered_update(self, source=None, indicator=None,
+                                value=None):
+                pass
+
+        chassis = mock.Mock()
+        n = Node('test', chassis, {})
+        n.table = minemeld.ft.table.Table(TABLENAME)
+        n.table.put('k1', {'a': 1})
+
+        n.filtered_update(source='a', indicator='i', value={})
+        n.filtered_update(source='a', indicator='i', value={})
+
+        status = n.mgmtbus_status()
+        self.assertEqual(status['statistics']['update.processed'], 2)
+        self.assertEqual(status['latency']['update.processed']['count'], 2)
+        self.assertEqual(status['latency']['table.put']['count'], 1)
+
+        n.table.close()
+
+    def test_edge_latency(self):
+        class Node(minemeld.ft.base.BaseFT):
+            def length(self, source=None):
+                return 0
+
+            def filtered_update(self, source=None, indicator=None,
+                                value=None):
+                self.emit_update(indicator, value)
+
+            def filtered_withdraw(self, source=None, indicator=None,
+                                  value=None):
+                self.emit_withdraw(indicator, value)
+
+        chassis = mock.Mock()
+        chassis.request_sub_channel.return_value = None
+        chassis.request_rpc_channel.return_value = None
+
+        a = Node('a', chassis, {'track_latency': True})
+        a.connect([], True)
+        a.state = minemeld.ft.ft_states.STARTED
+        b = Node('b', chassis, {})
+        b.connect(['a'], True)
+        b.state = minemeld.ft.ft_states.STARTED
+        b.inputs_checkpoint = {}
+        output = chassis.request_pub_channel.return_value
+
+        a.emit_update('i1', {'type': 'IPv4'})
+        method, params = output.publish.call_args[0]
+        self.assertEqual(method, 'update')
+        self.assertEqual(params['meta']['hops'], 1)
+        self.assertNotIn('meta', params['value'])
+
+        params['meta']['ts'] -= 0.5
+        b.update(**params)
+        _, bparams = output.publish.call_args[0]
+        self.assertEqual(bparams['source'], 'b')
+        self.assertEqual(bparams['meta'],
+                         {'ts': params['meta']['ts'], 'hops': 2})
+        self.assertIsNone(b.current_meta)
+
+        b.withdraw(source='a', indicator='i1', value=None)
+        _, bparams = output.publish.call_args[0]
+        self.assertNotIn('meta', bparams)
+
+        status = b.mgmtbus_status()
+        self.assertEqual(status['edge_latency']['a']['count'], 1)
+        self.assertEqual(status['edge_latency']['a']['hops'], 1)
+        self.assertGreaterEqual(status['edge_latency']['a']['p50'], 500000)
+        self.assertNotIn('edge_latency', a.mgmtbus_status())
+
+    def test_edge_latency_interleaved(self):
+        class Node(minemeld.ft.base.BaseFT):
+            def length(self, source=None):
+                return 0
+
+            def filtered_update(self, source=None, indicator=None,
+                                value=None):
+                # handlers yield, e.g. while publishing
+                gevent.sleep(0)
+                self.emit_update(indicator, value)
+                gevent.sleep(0)
+                self.emit_update(indicator+'.2', value)
+
+        chassis = mock.Mock()
+        chassis.request_sub_channel.return_value = None
+        chassis.request_rpc_channel.return_value = None
+
+        n = Node('n', chassis, {})
+        n.connect(['s1', 's2'], True)
+        n.state = minemeld.ft.ft_states.STARTED
+        n.inputs_checkpoint = {}
+        output = chassis.request_pub_channel.return_value
+
+        g1 = gevent.spawn(n.update, source='s1', indicator='a', value={},
+                          meta={'ts': 1, 'hops': 1})
+        g2 = gevent.spawn(n.update, source='s2', indicator='b', value={},
+                          meta={'ts': 2, 'hops': 5})
+        gevent.joinall([g1, g2])
+        self.assertTrue(g1.successful())
+        self.assertTrue(g2.successful())
+
+        emitted = dict(
+            (c[0][1]['indicator'], c[0][1].get('meta', None))
+            for c in output.publish.call_args_list
+        )
+        self.assertEqual(emitted, {
+            'a': {'ts': 1, 'hops': 2},
+            'a.2': {'ts': 1, 'hops': 2},
+            'b': {'ts': 2, 'hops': 6},
+            'b.2': {'ts': 2, 'hops': 6}
+        })
+
+        # no stale meta in the other greenlets of the node
+        self.assertIsNone(n.current_meta)
+        n.emit_withdraw('a')
+        self.assertNotIn('meta', output.publish.call_args[0][1])
+
+        # explicit meta
+        n.emit_withdraw('a', meta={'ts': 3, 'hops': 1})
+        self.assertEqual(output.publish.call_args[0][1]['meta'],
+                         {'ts': 3, 'hops': 2})
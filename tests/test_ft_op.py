@@ -37,6 +37,25 @@ FTNAME = 'testft-%d' % int(time.time())
 LOG = logging.getLogger(__name__)
 
 
+def expand_chunks(call_args_list):
+    """Expands update_chunk RPCs in a list of update RPCs"""
+    result = []
+    for c in call_args_list:
+        args = c[0]
+        if args[2] != 'update_chunk':
+            result.append(c)
+            continue
+
+        for indicator, value in args[3]['indicators']:
+            result.append((
+                (args[0], args[1], 'update',
+                 {'indicator': indicator, 'value': value}),
+                {}
+            ))
+
+    return result
+
+
 def check_for_rpc(call_args_list, check_list, all_here=False, offset=0):
     LOG.debug("call_args_list: %s", call_args_list)
 
@@ -98,12 +117,22 @@ class MineMeldFTOpTests(unittest.TestCase):
         except:
             pass
 
+        try:
+            shutil.rmtree(FTNAME+'_summary')
+        except:
+            pass
+
     def tearDown(self):
         try:
             shutil.rmtree(FTNAME)
         except:
             pass
 
+        try:
+            shutil.rmtree(FTNAME+'_summary')
+        except:
+            pass
+
     def test_aggregate_2u(self):
         config = {}
         chassis = mock.Mock()
@@ -143,6 +172,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
 
         a = None
         chassis = None
@@ -189,6 +219,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
 
         a = None
         chassis = None
@@ -235,6 +266,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
 
         a = None
         chassis = None
@@ -273,10 +305,15 @@ class MineMeldFTOpTests(unittest.TestCase):
         pargs = ochannel.publish.call_args[0]
         self.assertListEqual(pargs[1]['value']['sources'], ['s1s', 's2s'])
 
+        # merged value not changed, no updates
         a.update('s1', indicator='i', value={'s1$a': 1, 'sources': ['s1s']})
+        self.assertEqual(ochannel.publish.call_count, 2)
+
+        a.update('s1', indicator='i', value={'s1$a': 2, 'sources': ['s1s']})
         self.assertEqual(ochannel.publish.call_count, 3)
         pargs = ochannel.publish.call_args[0]
         self.assertListEqual(pargs[1]['value']['sources'], ['s1s', 's2s'])
+        self.assertEqual(pargs[1]['value']['s1$a'], 2)
 
         a.withdraw('s2', indicator='i')
         self.assertEqual(ochannel.publish.call_count, 4)
@@ -291,6 +328,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
 
         a = None
         chassis = None
@@ -350,6 +388,76 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
+
+        a = None
+        chassis = None
+        rpcmock = None
+        ochannel = None
+
+        gc.collect()
+
+    def test_summary_rebuild(self):
+        config = {
+            'whitelist_prefixes': ['s3']
+        }
+        chassis = mock.Mock()
+
+        ochannel = mock.Mock()
+        chassis.request_pub_channel.return_value = ochannel
+
+        rpcmock = mock.Mock()
+        rpcmock.get.return_value = {'error': None, 'result': 'OK'}
+        chassis.send_rpc.return_value = rpcmock
+
+        a = minemeld.ft.op.AggregateFT(FTNAME, chassis, config)
+
+        inputs = ['s1', 's2', 's3']
+        output = True
+
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        a.update('s1', indicator='i', value={'s1$a': 1, 'sources': ['s1s']})
+        a.update('s2', indicator='i', value={'s2$a': 1, 'sources': ['s2s']})
+        a.update('s3', indicator='i', value={'sources': ['s3s']})
+        a.update('s2', indicator='j', value={'s2$a': 1, 'sources': ['s2s']})
+        self.assertEqual(ochannel.publish.call_count, 4)
+        pargs = ochannel.publish.call_args_list[2][0]
+        self.assertEqual(pargs[0], 'withdraw')
+
+        a.stop()
+        a.table.db.close()
+        a.summary_table.db.close()
+        a = None
+
+        # tables written by the previous versions have no summary table
+        shutil.rmtree(FTNAME+'_summary')
+
+        ochannel.publish.reset_mock()
+        a = minemeld.ft.op.AggregateFT(FTNAME, chassis, config)
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        self.assertEqual(a.summary_table.num_indicators, 2)
+
+        a.withdraw('s3', indicator='i')
+        self.assertEqual(ochannel.publish.call_count, 1)
+        pargs = ochannel.publish.call_args[0]
+        self.assertEqual(pargs[0], 'update')
+        self.assertListEqual(pargs[1]['value']['sources'], ['s1s', 's2s'])
+
+        a.withdraw('s2', indicator='j')
+        self.assertEqual(ochannel.publish.call_count, 2)
+        pargs = ochannel.publish.call_args[0]
+        self.assertEqual(pargs[0], 'withdraw')
+        self.assertEqual(a.summary_table.num_indicators, 1)
+
+        a.stop()
+        a.table.db.close()
+        a.summary_table.db.close()
 
         a = None
         chassis = None
@@ -399,6 +507,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
 
         a = None
         chassis = None
@@ -456,6 +565,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
 
         a = None
         chassis = None
@@ -523,6 +633,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
         a = None
         gc.collect()
 
@@ -571,7 +682,7 @@ class MineMeldFTOpTests(unittest.TestCase):
         a.get_all(source='test')
         self.assertTrue(
             check_for_rpc(
-                chassis.send_rpc.call_args_list,
+                expand_chunks(chassis.send_rpc.call_args_list),
                 [
                     {
                         'method': 'update',
@@ -603,6 +714,7 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
         a = None
         gc.collect()
 
@@ -652,7 +764,7 @@ class MineMeldFTOpTests(unittest.TestCase):
                     to_key='10.1.1.0/24')
         self.assertTrue(
             check_for_rpc(
-                chassis.send_rpc.call_args_list,
+                expand_chunks(chassis.send_rpc.call_args_list),
                 [
                     {
                         'method': 'update',
@@ -684,5 +796,6 @@ class MineMeldFTOpTests(unittest.TestCase):
 
         a.stop()
         a.table.db.close()
+        a.summary_table.db.close()
         a = None
         gc.collect()
@@ -0,0 +1,81 @@
+#  Copyright 2015 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""FT panos tests
+
+Unit tests for minemeld.ft.panos
+"""
+
+import gevent.monkey
+gevent.monkey.patch_all(thread=False, select=False)
+
+import unittest
+import mock
+import time
+import shutil
+
+import minemeld.ft.panos
+
+FTNAME = 'testft-%d' % int(time.time())
+
+
+class MineMeldFTPanOSLogsAPITests(unittest.TestCase):
+    def setUp(self):
+        for idx in range(2):
+            try:
+                shutil.rmtree(FTNAME+'_%d' % idx)
+            except:
+                pass
+
+    def tearDown(self):
+        for idx in range(2):
+            try:
+                shutil.rmtree(FTNAME+'_%d' % idx)
+            except:
+                pass
+
+    def test_initialize_tables(self):
+        config = {
+            'fields': [
+                {'name': 'src'},
+                {'name': 'dst', 'age_out': '1d'}
+            ]
+        }
+
+        chassis = mock.Mock()
+
+        a = minemeld.ft.panos.PanOSLogsAPIFT(FTNAME, chassis, config)
+
+        a.initialize()
+        self.assertEqual(len(a.tables), 2)
+        self.assertEqual(len(a.expiries), 2)
+
+        a.tables[0].put('1.1.1.1', {'last_seen': 1})
+        tables = a.tables
+
+        # tables and expiries are rebuilt, not appended
+        a.rebuild()
+        self.assertEqual(len(a.tables), 2)
+        self.assertEqual(len(a.expiries), 2)
+        self.assertNotIn(a.tables[0], tables)
+        self.assertEqual(a.expiries[0].table, a.tables[0])
+        self.assertEqual(a.tables[0].num_indicators, 1)
+
+        a.reset()
+        self.assertEqual(len(a.tables), 2)
+        self.assertEqual(len(a.expiries), 2)
+        self.assertEqual(a.tables[0].num_indicators, 0)
+
+        for t in a.tables:
+            t.close()
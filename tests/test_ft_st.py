@@ -27,12 +27,15 @@ import time
 from nose.plugins.attrib import attr
 
 import minemeld.ft.st
+import minemeld.ft.memst
 
 TABLENAME = tempfile.mktemp(prefix='minemeld.ftsttest')
 NUM_ELEMENTS = 10000
 
 
 class MineMeldFTSTTests(unittest.TestCase):
+    ST_CLASS = minemeld.ft.st.ST
+
     def setUp(self):
         try:
             shutil.rmtree(TABLENAME)
@@ -46,7 +49,7 @@ class MineMeldFTSTTests(unittest.TestCase):
             pass
 
     def test_add_delete(self):
-        st = minemeld.ft.st.ST(TABLENAME, 8, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 8, truncate=True)
 
         sid = uuid.uuid4().bytes
 
@@ -56,7 +59,7 @@ class MineMeldFTSTTests(unittest.TestCase):
         st.close()
 
     def test_query_endpoints_forward(self):
-        st = minemeld.ft.st.ST(TABLENAME, 8, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 8, truncate=True)
 
         sid1 = uuid.uuid4().bytes
         sid2 = uuid.uuid4().bytes
@@ -77,7 +80,7 @@ class MineMeldFTSTTests(unittest.TestCase):
         st.close()
 
     def test_query_endpoints_reverse(self):
-        st = minemeld.ft.st.ST(TABLENAME, 8, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 8, truncate=True)
 
         sid1 = uuid.uuid4().bytes
         sid2 = uuid.uuid4().bytes
@@ -98,7 +101,7 @@ class MineMeldFTSTTests(unittest.TestCase):
         st.close()
 
     def test_basic_cover(self):
-        st = minemeld.ft.st.ST(TABLENAME, 8, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 8, truncate=True)
 
         sid = uuid.uuid4().bytes
 
@@ -118,7 +121,7 @@ class MineMeldFTSTTests(unittest.TestCase):
         st.close()
 
     def test_cover_overlap(self):
-        st = minemeld.ft.st.ST(TABLENAME, 8, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 8, truncate=True)
 
         sid1 = uuid.uuid4().bytes
         sid2 = uuid.uuid4().bytes
@@ -164,7 +167,7 @@ class MineMeldFTSTTests(unittest.TestCase):
         st.close()
 
     def test_cover_overlap2(self):
-        st = minemeld.ft.st.ST(TABLENAME, 8, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 8, truncate=True)
 
         sid1 = uuid.uuid4().bytes
         sid2 = uuid.uuid4().bytes
@@ -190,7 +193,7 @@ class MineMeldFTSTTests(unittest.TestCase):
 
         rmap = [set() for i in xrange(epmax+1)]
 
-        st = minemeld.ft.st.ST(TABLENAME, nbits, truncate=True)
+        st = self.ST_CLASS(TABLENAME, nbits, truncate=True)
 
         for j in xrange(nintervals):
             sid = uuid.uuid4().bytes
@@ -231,17 +234,58 @@ class MineMeldFTSTTests(unittest.TestCase):
         self._random_map(nintervals=2000)
 
     def test_255(self):
-        st = minemeld.ft.st.ST(TABLENAME, 32, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 32, truncate=True)
         sid = uuid.uuid4().bytes
         st.put(sid, 0, 0xFF)
         self.assertEqual(st.num_segments, 1)
         self.assertEqual(st.num_endpoints, 2)
         st.close()
 
+    def test_128bit(self):
+        st = self.ST_CLASS(TABLENAME, 128, truncate=True)
+
+        sid1 = uuid.uuid4().bytes
+        sid2 = uuid.uuid4().bytes
+        sid3 = uuid.uuid4().bytes
+
+        base = 0x20010db8 << 96
+        st.put(sid1, base, base+(1 << 96)-1, 1)
+        st.put(sid2, base+(1 << 64), base+(1 << 65)-1, 2)
+        st.put(sid3, st.max_endpoint, st.max_endpoint, 1)
+        self.assertEqual(st.num_endpoints, 6)
+
+        self.assertEqual(
+            [ep[0] for ep in st.query_endpoints()],
+            [base, base+(1 << 64), base+(1 << 65)-1, base+(1 << 96)-1,
+             st.max_endpoint, st.max_endpoint]
+        )
+        self.assertEqual(
+            [ep[0] for ep in st.query_endpoints(reverse=True)][:2],
+            [st.max_endpoint, st.max_endpoint]
+        )
+        self.assertEqual(
+            sorted(st.cover(base+(1 << 64)+1)),
+            sorted([(sid1, 1, base, base+(1 << 96)-1),
+                    (sid2, 2, base+(1 << 64), base+(1 << 65)-1)])
+        )
+        self.assertEqual(list(st.cover(base-1)), [])
+        self.assertEqual(
+            list(st.cover(st.max_endpoint)),
+            [(sid3, 1, st.max_endpoint, st.max_endpoint)]
+        )
+
+        st.delete(sid2, base+(1 << 64), base+(1 << 65)-1, 2)
+        self.assertEqual(
+            list(st.cover(base+(1 << 64)+1)),
+            [(sid1, 1, base, base+(1 << 96)-1)]
+        )
+
+        st.close()
+
     @attr('slow')
     def test_stress_0(self):
         num_intervals = 100000
-        st = minemeld.ft.st.ST(TABLENAME, 32, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 32, truncate=True)
 
         t1 = time.time()
         for j in xrange(num_intervals):
@@ -276,7 +320,7 @@ class MineMeldFTSTTests(unittest.TestCase):
     @attr('slow')
     def test_stress_1(self):
         num_intervals = 100000
-        st = minemeld.ft.st.ST(TABLENAME, 32, truncate=True)
+        st = self.ST_CLASS(TABLENAME, 32, truncate=True)
 
         t1 = time.time()
         for j in xrange(num_intervals):
@@ -306,3 +350,56 @@ class MineMeldFTSTTests(unittest.TestCase):
         print "TIME: Queried %d times in %d" % (num_queries, (t2-t1))
 
         st.close()
+
+
+class MineMeldFTMemorySTTests(MineMeldFTSTTests):
+    ST_CLASS = minemeld.ft.memst.MemoryST
+
+    def test_load(self):
+        st = self.ST_CLASS(TABLENAME, 8, truncate=True)
+
+        sid1 = uuid.uuid4().bytes
+        sid2 = uuid.uuid4().bytes
+        sid3 = uuid.uuid4().bytes
+
+        st.put(sid1, 1, 70, 1)
+        st.put(sid2, 50, 100, 2)
+        st.put(sid3, 60, 60, 1)
+        st.delete(sid1, 1, 70, 1)
+        st.close()
+        st = None
+
+        st = self.ST_CLASS(TABLENAME, 8)
+        self.assertEqual(st.num_endpoints, 4)
+        self.assertEqual(
+            [ep[0] for ep in st.query_endpoints()],
+            [50, 60, 60, 100]
+        )
+        self.assertEqual(
+            sorted(st.cover(60)),
+            sorted([(sid2, 2, 50, 100), (sid3, 1, 60, 60)])
+        )
+        self.assertEqual(list(st.cover(10)), [])
+
+        st.close()
+
+    def test_sorted_list(self):
+        sl = minemeld.ft.memst._SortedList()
+        sl.LOAD = 4
+
+        items = range(100)
+        random.shuffle(items)
+        for i in items:
+            sl.add(i)
+
+        self.assertEqual(list(sl.irange(0, 99)), range(100))
+        self.assertEqual(list(sl.irange(10, 50, reverse=True)),
+                         range(50, 9, -1))
+
+        for i in items[:50]:
+            sl.remove(i)
+
+        self.assertEqual(list(sl.irange(-1, 100)), sorted(items[50:]))
+        self.assertEqual(list(sl.irange(-1, 100, reverse=True)),
+                         sorted(items[50:], reverse=True))
+        self.assertRaises(ValueError, sl.remove, items[0])
@@ -568,3 +568,98 @@ class MineMeldFTSyslogMatcherests(unittest.TestCase):
         ochannel = None
 
         gc.collect()
+
+    @mock.patch.object(gevent, 'spawn_later')
+    def test_index_gc(self, spawnl_mock):
+        config = {
+        }
+
+        chassis = mock.Mock()
+
+        ochannel = mock.Mock()
+        chassis.request_pub_channel.return_value = ochannel
+
+        rpcmock = mock.Mock()
+        rpcmock.get.return_value = {'error': None, 'result': 'OK'}
+        chassis.send_rpc.return_value = rpcmock
+
+        a = minemeld.ft.syslog.SyslogMatcher(FTNAME, chassis, config)
+
+        inputs = ['a']
+        output = True
+
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        # each update and match leaves a stale index entry behind
+        for confidence in [10, 20, 30]:
+            a.update('a', indicator='1.1.1.1-1.1.1.2', value={
+                'type': 'IPv4',
+                'confidence': confidence
+            })
+            a._handle_ip('1.1.1.1')
+
+        for index_gc in a.index_gcs.values():
+            index_gc.run_once()
+
+        status = a.mgmtbus_status()['index_gc']
+        self.assertEqual(status[FTNAME+'_ipv4']['_start']['removed'], 2)
+        self.assertEqual(status[FTNAME+'_ipv4']['_start']['entries'], 1)
+        self.assertEqual(
+            status[FTNAME]['syslog_original_indicator']['removed'],
+            2
+        )
+        self.assertEqual(
+            status[FTNAME]['syslog_original_indicator']['entries'],
+            1
+        )
+
+        a.stop()
+        a.table.db.close()
+        a.table_ipv4.db.close()
+        a.table_indicators.db.close()
+
+        a = None
+        chassis = None
+        rpcmock = None
+        ochannel = None
+
+        gc.collect()
+
+    @mock.patch.object(gevent, 'spawn_later')
+    def test_miner_index_gc(self, spawnl_mock):
+        config = {
+            'rules': FTNAME+'_rules.yml'
+        }
+
+        chassis = mock.Mock()
+
+        ochannel = mock.Mock()
+        chassis.request_pub_channel.return_value = ochannel
+
+        a = minemeld.ft.syslog.SyslogMiner(FTNAME, chassis, config)
+
+        inputs = []
+        output = True
+
+        a.connect(inputs, output)
+        a.mgmtbus_initialize()
+        a.start()
+
+        a.table.put('1.1.1.1\x00IPv4', {'_withdrawn': 1, '_age_out': 1})
+        a.table.put('1.1.1.1\x00IPv4', {'_withdrawn': 2, '_age_out': 2})
+
+        a.index_gc.run_once()
+        status = a.mgmtbus_status()['index_gc']
+        self.assertEqual(status['_withdrawn']['removed'], 1)
+        self.assertEqual(status['_withdrawn']['entries'], 1)
+
+        a.stop()
+        a.table.db.close()
+
+        a = None
+        chassis = None
+        ochannel = None
+
+        gc.collect()
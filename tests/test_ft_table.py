@@ -23,7 +23,11 @@ import shutil
 import random
 import time
 
+import plyvel
+
 import minemeld.ft.table
+import minemeld.ft.codec
+import minemeld.ft.indexgc
 
 from nose.plugins.attrib import attr
 
@@ -144,6 +148,322 @@ class MineMeldFTTableTests(unittest.TestCase):
         self.assertEqual(rk, 'k2')
         self.assertEqual(ok, 1)
 
+    def test_write_batch(self):
+        table = minemeld.ft.table.Table(TABLENAME)
+        table.create_index('a')
+
+        with table.write_batch():
+            table.put('k1', {'a': 1})
+            table.put('k2', {'a': 1})
+            table.put('k1', {'a': 2})
+            table.put('k3', {'a': 3})
+            table.delete('k3')
+
+            # read your writes
+            self.assertEqual(table.get('k1'), {'a': 2})
+            self.assertTrue(table.exists('k2'))
+            self.assertFalse(table.exists('k3'))
+            self.assertEqual(table.num_indicators, 2)
+
+            # query commits pending writes
+            self.assertEqual(list(table.query('a', from_key=0, to_key=1)),
+                             ['k2'])
+
+            table.put('k4', {'a': 4})
+
+        table.close()
+        table = None
+
+        table = minemeld.ft.table.Table(TABLENAME)
+        self.assertEqual(table.num_indicators, 3)
+        self.assertEqual(table.get('k4'), {'a': 4})
+
+        table.put('k5', {'a': 5})
+        self.assertEqual(
+            list(table.query('a', from_key=0, to_key=5)),
+            ['k2', 'k1', 'k4', 'k5']
+        )
+
+    def test_write_batch_max_size(self):
+        # json codec, interned attribute names would add writes
+        table = minemeld.ft.table.Table(TABLENAME, codec='json')
+
+        table.begin_batch(max_size=10)
+        for i in range(25):
+            table.put('i%d' % i, {'a': i})
+        self.assertEqual(len(table._batch.pending), 10)
+        table.commit_batch()
+        self.assertEqual(table._batch, None)
+
+        table.close()
+        table = None
+
+        table = minemeld.ft.table.Table(TABLENAME)
+        self.assertEqual(table.num_indicators, 25)
+
+    def test_write_batch_abort(self):
+        table = minemeld.ft.table.Table(TABLENAME, cache_size=10)
+        table.put('k1', {'a': 1})
+
+        def _failing_batch():
+            with table.write_batch():
+                table.put('k1', {'a': 2})
+                table.put('k2', {'a': 2})
+                self.assertEqual(table.num_indicators, 2)
+                raise RuntimeError('ko')
+
+        self.assertRaises(RuntimeError, _failing_batch)
+
+        # pending writes are discarded
+        self.assertEqual(table._batch, None)
+        self.assertEqual(table.num_indicators, 1)
+        self.assertEqual(table.get('k1'), {'a': 1})
+        self.assertEqual(table.get('k2'), None)
+
+        table.close()
+        table = None
+
+        table = minemeld.ft.table.Table(TABLENAME)
+        self.assertEqual(table.num_indicators, 1)
+        self.assertEqual(table.get('k1'), {'a': 1})
+
+    def test_codec(self):
+        value = {
+            'type': 'IPv4',
+            'sources': ['s1', u's\xe8'],
+            'confidence': 80,
+            'score': 0.5,
+            'nested': {'a': [1, 2, {'b': None}]},
+            'flag': True
+        }
+
+        for codec in minemeld.ft.codec.CODECS.keys():
+            table = minemeld.ft.table.Table(TABLENAME, truncate=True,
+                                            codec=codec)
+            table.put('k1', value)
+            table.put('k2', {'type': 'URL', 'new_attribute': 1})
+            self.assertEqual(table.get('k1'), value)
+            table.close()
+            table = None
+
+            table = minemeld.ft.table.Table(TABLENAME, codec=codec)
+            self.assertEqual(table.get('k1'), value)
+            self.assertEqual(
+                table.get('k2'),
+                {'type': 'URL', 'new_attribute': 1}
+            )
+            table.close()
+            table = None
+
+    def test_schema_migration(self):
+        table = minemeld.ft.table.Table(TABLENAME, codec='json')
+        table.create_index('a')
+        for i in range(10):
+            table.put('i%d' % i, {'a': i, 'b': 'v%d' % i})
+        table.close()
+        table = None
+
+        # downgrade to schema 0
+        db = plyvel.DB(TABLENAME)
+        db.put(minemeld.ft.table.SCHEMAVERSION_KEY, '\x00')
+        db.delete(minemeld.ft.table.CODEC_KEY)
+        db.close()
+
+        table = minemeld.ft.table.Table(TABLENAME, codec='msgpack')
+        self.assertEqual(table.get('i3'), {'a': 3, 'b': 'v3'})
+        self.assertEqual(
+            list(table.query('a', from_key=2, to_key=4)),
+            ['i2', 'i3', 'i4']
+        )
+        table.close()
+        table = None
+
+        db = plyvel.DB(TABLENAME)
+        self.assertEqual(db.get(minemeld.ft.table.SCHEMAVERSION_KEY), '\x01')
+        self.assertEqual(db.get(minemeld.ft.table.CODEC_KEY), 'msgpack')
+        for k, v in db.iterator(start='\x01\x01', stop='\x01\x02'):
+            self.assertEqual(v[8], minemeld.ft.codec.MsgpackCodec.TAG)
+        db.close()
+
+        # and back to json
+        table = minemeld.ft.table.Table(TABLENAME, codec='json')
+        self.assertEqual(table.get('i3'), {'a': 3, 'b': 'v3'})
+        self.assertEqual(table.num_indicators, 10)
+
+    def test_cache(self):
+        table = minemeld.ft.table.Table(TABLENAME, cache_size=2)
+        table.create_index('a')
+
+        table.put('k1', {'a': 1})
+        table.put('k2', {'a': 2})
+        table.put('k3', {'a': 3})
+
+        stats = table.cache_statistics()
+        self.assertEqual(stats['length'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+        # k1 evicted
+        self.assertTrue(table.exists('k1'))
+        self.assertEqual(table.get('k1'), {'a': 1})
+        self.assertEqual(table.get('k3'), {'a': 3})
+        stats = table.cache_statistics()
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hits'], 1)
+
+        # returned values are copies
+        v = table.get('k3')
+        v['a'] = 4
+        self.assertEqual(table.get('k3'), {'a': 3})
+
+        # write-through
+        table.delete('k3')
+        self.assertFalse(table.exists('k3'))
+        self.assertEqual(table.get('k3'), None)
+        table.put('k1', {'a': 5})
+        self.assertEqual(table.get('k1'), {'a': 5})
+        self.assertEqual(
+            list(table.query('a', from_key=0, to_key=10,
+                             include_value=True)),
+            [('k2', {'a': 2}), ('k1', {'a': 5})]
+        )
+
+        self.assertEqual(
+            minemeld.ft.table.Table(TABLENAME+'2').cache_statistics(),
+            None
+        )
+        shutil.rmtree(TABLENAME+'2')
+
+    def test_index_gc(self):
+        table = minemeld.ft.table.Table(TABLENAME)
+        table.create_index('a')
+
+        for j in range(3):
+            for i in range(10):
+                table.put('i%d' % i, {'a': i+j})
+        table.delete('i0')
+
+        def num_entries():
+            return len(list(table.db.iterator(start='\x02\x00\xF0',
+                                              stop='\x02\x00\xF1')))
+
+        # queries are read-only
+        self.assertEqual(len(list(table.query('a'))), 9)
+        self.assertEqual(num_entries(), 30)
+
+        cursor, scanned, removed = table.collect_index_garbage(
+            'a',
+            max_entries=12
+        )
+        self.assertNotEqual(cursor, None)
+        self.assertEqual(scanned, 12)
+
+        gc = minemeld.ft.indexgc.IndexGC(table, slice_size=7)
+        gc.run_once()
+        self.assertEqual(num_entries(), 9)
+        self.assertEqual(gc.statistics['a']['entries'], 9)
+        self.assertEqual(gc.statistics['a']['removed'], 21-removed)
+        self.assertEqual(
+            list(table.query('a', from_key=0, to_key=20)),
+            ['i1', 'i2', 'i3', 'i4', 'i5', 'i6', 'i7', 'i8', 'i9']
+        )
+
+    def test_snapshot_query(self):
+        for index in [None, 'a']:
+            table = minemeld.ft.table.Table(TABLENAME, truncate=True)
+            table.create_index('a')
+
+            for i in range(5):
+                table.put('i%d' % i, {'a': i})
+
+            result = []
+            for k, v in table.query(index=index, include_value=True,
+                                    snapshot=True, fill_cache=False):
+                result.append((k, v))
+
+                # updates during the query are not visible
+                table.put('i4', {'a': 4, 'b': 1})
+                table.put('i5', {'a': 5})
+                table.delete('i3')
+
+            self.assertEqual(result, [('i%d' % i, {'a': i})
+                                      for i in range(5)])
+
+            table.close()
+            table = None
+
+        table = minemeld.ft.table.Table(TABLENAME, truncate=True)
+        for i in range(5):
+            table.put('i%d' % i, {'a': i})
+
+        # the live query sees the updates
+        result = []
+        for k, v in table.query(include_value=True):
+            result.append(v)
+            table.put('i4', {'a': 4, 'b': 1})
+        self.assertEqual(result[-1], {'a': 4, 'b': 1})
+
+    def test_expiry(self):
+        table = minemeld.ft.table.Table(TABLENAME)
+
+        for i in range(10):
+            table.put('i%d' % i, {'a': i})
+            table.set_expiry('i%d' % i, 1000-i)
+
+        self.assertEqual(table.next_expiry(), 991)
+        self.assertEqual(table.get_expiry('i3'), 997)
+
+        # deadline changed, the old entry is removed
+        table.set_expiry('i0', 10)
+        table.set_expiry('i1', 2000)
+        self.assertEqual(table.next_expiry(), 10)
+
+        expired = list(table.query_expired(995))
+        self.assertEqual(
+            expired,
+            [('i0', 10), ('i9', 991), ('i8', 992), ('i7', 993),
+             ('i6', 994), ('i5', 995)]
+        )
+
+        # deleted indicators and cancelled deadlines
+        with table.write_batch():
+            table.delete('i0')
+            table.cancel_expiry('i9')
+        self.assertEqual(table.get_expiry('i0'), None)
+        self.assertEqual(table.next_expiry(), 992)
+
+        table.close()
+        table = None
+
+        table = minemeld.ft.table.Table(TABLENAME)
+        self.assertEqual(
+            [i for i, _ in table.query_expired(3000)],
+            ['i8', 'i7', 'i6', 'i5', 'i4', 'i3', 'i2', 'i1']
+        )
+
+    def test_drop_index(self):
+        table = minemeld.ft.table.Table(TABLENAME)
+        table.create_index('a')
+        table.create_index('b')
+
+        for i in range(10):
+            table.put('i%d' % i, {'a': i, 'b': i})
+
+        table.drop_index('a')
+        self.assertNotIn('a', table.indexes)
+        self.assertEqual(
+            len(list(table.query('b', from_key=0, to_key=9))),
+            10
+        )
+
+        table.close()
+        table = None
+
+        table = minemeld.ft.table.Table(TABLENAME)
+        self.assertEqual(table.indexes.keys(), ['b'])
+        for k in table.db.iterator(include_value=False):
+            if k[0] == '\x02':
+                self.assertEqual(k[1], chr(table.indexes['b']['id']))
+
     @attr('slow')
     def test_random(self):
         # create table
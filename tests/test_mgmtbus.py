@@ -0,0 +1,84 @@
+#  Copyright 2016 Palo Alto Networks, Inc
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Mgmtbus tests
+
+Unit tests for minemeld.mgmtbus
+"""
+
+import unittest
+import mock
+
+import minemeld.mgmtbus
+import minemeld.ft.latency
+
+
+class MineMeldMgmtbusTests(unittest.TestCase):
+    @mock.patch('minemeld.mgmtbus.CollectdClient')
+    @mock.patch('minemeld.comm.factory')
+    def test_collectd_latency(self, comm_mock, collectd_mock):
+        master = minemeld.mgmtbus.MgmtbusMaster(['a'], {}, 'AMQP', {})
+
+        buckets = [0]*minemeld.ft.latency.NUM_BUCKETS
+        buckets[2] = 10
+        answers = {
+            'mbus:slave:a': {
+                'inputs': ['b'],
+                'output': True,
+                'statistics': {'update.rx': 10},
+                'latency': {'update.rx': {'buckets': list(buckets)}}
+            }
+        }
+        master._send_collectd_metrics(answers, 60)
+
+        cc = collectd_mock.return_value
+        putvals = dict((c[0][0], c[0][1]) for c in cc.putval.call_args_list)
+        self.assertEqual(putvals['a.update.rx'], 10)
+        self.assertEqual(putvals['a.latency.update.rx.p50'], 4)
+        self.assertEqual(putvals['a.latency.update.rx.p99'], 4)
+
+        # only the latencies of the last interval are sent
+        cc.putval.reset_mock()
+        buckets[10] = 10
+        answers['mbus:slave:a']['latency']['update.rx']['buckets'] = buckets
+        master._send_collectd_metrics(answers, 60)
+        putvals = dict((c[0][0], c[0][1]) for c in cc.putval.call_args_list)
+        self.assertEqual(putvals['a.latency.update.rx.p50'], 1024)
+
+        # no calls in the last interval
+        cc.putval.reset_mock()
+        master._send_collectd_metrics(answers, 60)
+        putvals = dict((c[0][0], c[0][1]) for c in cc.putval.call_args_list)
+        self.assertNotIn('a.latency.update.rx.p50', putvals)
+
+    @mock.patch('minemeld.mgmtbus.CollectdClient')
+    @mock.patch('minemeld.comm.factory')
+    def test_collectd_edge_latency(self, comm_mock, collectd_mock):
+        master = minemeld.mgmtbus.MgmtbusMaster(['a'], {}, 'AMQP', {})
+
+        buckets = [0]*32
+        buckets[20] = 1
+        answers = {
+            'mbus:slave:a': {
+                'inputs': ['b'],
+                'output': False,
+                'edge_latency': {'b': {'buckets': buckets, 'hops': 2}}
+            }
+        }
+        master._send_collectd_metrics(answers, 60)
+
+        cc = collectd_mock.return_value
+        putvals = dict((c[0][0], c[0][1]) for c in cc.putval.call_args_list)
+        self.assertEqual(putvals['a.latency.edge.b.p50'], 1 << 20)
+        self.assertEqual(putvals['a.latency.edge.b.p99'], 1 << 20)
@@ -87,6 +87,20 @@ class MineMeldTracedStorage(unittest.TestCase):
         table.close()
         table = None
 
+    def test_table_put_many(self):
+        table = minemeld.traced.storage.Table(TABLENAME, create_if_missing=True)
+        table.put_many([('%016x' % 0, 'value0'), ('%016x' % 0, 'value1')])
+        self.assertEqual(table.max_counter, 1)
+        table.close()
+        table = None
+
+        table = minemeld.traced.storage.Table(TABLENAME, create_if_missing=False)
+        self.assertEqual(table.max_counter, 1)
+        iterator = table.backwards_iterator(1, 0xFFFFFFFFFFFFFFFF)
+        self.assertEqual([line for _, line in iterator], ['value1', 'value0'])
+        table.close()
+        table = None
+
     def test_table_references(self):
         table = minemeld.traced.storage.Table(TABLENAME, create_if_missing=True)
         self.assertEqual(table.ref_count(), 0)
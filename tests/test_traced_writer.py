@@ -41,7 +41,8 @@ class MineMeldTracedStorage(unittest.TestCase):
 
         writer = minemeld.traced.writer.Writer(comm, store, 'TESTTOPIC')
         self.assertEqual(comm.sub_channels[0]['topic'], 'TESTTOPIC')
-        self.assertEqual(comm.sub_channels[0]['allowed_methods'], ['log'])
+        self.assertEqual(comm.sub_channels[0]['allowed_methods'],
+                         ['log', 'log_batch'])
 
         writer.log(0, log='testlog')
         self.assertEqual(store.writes[0]['timestamp'], 0)
@@ -52,3 +53,37 @@ class MineMeldTracedStorage(unittest.TestCase):
         self.assertEqual(len(store.writes), 1)
 
         writer.stop()  # just for coverage
+
+    def test_writer_batch(self):
+        config = {}
+        comm = comm_mock.comm_factory(config)
+        store = traced_mock.store_factory()
+
+        writer = minemeld.traced.writer.Writer(comm, store, 'TESTTOPIC')
+
+        value = {'type': 'IPv4', 'sources': ['a']}
+        writer.log_batch(
+            logs=[
+                {'timestamp': 1, 'source': 'a', 'log_type': 'TRACE',
+                 'log': {'indicator': 'i1', 'op': 'RECVD_UPDATE',
+                         'value_ref': 0}},
+                {'timestamp': 2, 'source': 'a', 'log_type': 'TRACE',
+                 'log': {'indicator': 'i1', 'op': 'ACCEPT_UPDATE',
+                         'value_ref': 0}},
+                {'timestamp': 3, 'source': 'a', 'log_type': 'OTHER',
+                 'log': 'testlog'}
+            ],
+            values=[ujson.dumps(value)]
+        )
+
+        self.assertEqual([w['timestamp'] for w in store.writes], [1, 2, 3])
+        logs = [ujson.loads(w['log']) for w in store.writes]
+        self.assertEqual(logs[0], {
+            'source': 'a',
+            'log_type': 'TRACE',
+            'log': {'indicator': 'i1', 'op': 'RECVD_UPDATE', 'value': value}
+        })
+        self.assertEqual(logs[1]['log']['value'], value)
+        self.assertEqual(logs[2]['log'], 'testlog')
+
+        writer.stop()
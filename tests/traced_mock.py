@@ -69,6 +69,10 @@ class MockTable(object):
 
         self.db[key+new_max_counter] = value
 
+    def put_many(self, items):
+        for key, value in items:
+            self.put(key, value)
+
     def backwards_iterator(self, timestamp, counter):
         starting_key = '%016x%016x' % (timestamp, counter)
         items = [[k, v] for k, v in self.db.iteritems() if k <= starting_key]
@@ -122,6 +126,10 @@ class MockStore(object):
         self.db['%016x%016x' % (timestamp, self.counter)] = log
         self.counter += 1
 
+    def write_many(self, logs):
+        for timestamp, log in logs:
+            self.write(timestamp, log)
+
     def iterate_backwards(self, ref, timestamp, counter):
         starting_key = '%016x%016x' % (timestamp, counter)
         items = [[k, v] for k, v in self.db.iteritems() if k <= starting_key]